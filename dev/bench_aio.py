@@ -0,0 +1,112 @@
+"""Compare the threaded RelayManager with nostr.aio.AsyncRelayManager against an
+in-process stub relay: time from REQ until every relay sent EOSE, peak traced
+memory and number of threads.
+
+Usage: python dev/bench_aio.py [n_relays] [n_events]
+"""
+import asyncio
+import json
+import sys
+import threading
+import time
+import tracemalloc
+
+from websockets.asyncio.server import serve
+
+from nostr.aio import AsyncRelayManager
+from nostr.event import Event
+from nostr.filter import Filter, Filters
+from nostr.key import PrivateKey
+from nostr.relay_manager import RelayManager
+
+
+def start_stub_relay(n_events: int) -> int:
+    """Serve `n_events` signed events to every REQ from a background thread and
+    return the port."""
+    pk = PrivateKey()
+    events = []
+    for i in range(n_events):
+        event = Event(content=f"event {i}", created_at=1674819397 + i)
+        event.sign(pk.hex())
+        events.append(event.to_dict())
+
+    async def handler(ws):
+        async for message in ws:
+            message_json = json.loads(message)
+            if message_json[0] == "REQ":
+                subscription_id = message_json[1]
+                for event in events:
+                    await ws.send(json.dumps(["EVENT", subscription_id, event]))
+                await ws.send(json.dumps(["EOSE", subscription_id]))
+
+    started = threading.Event()
+    port = []
+
+    async def run():
+        async with serve(handler, "127.0.0.1", 0) as server:
+            port.append(server.sockets[0].getsockname()[1])
+            started.set()
+            await asyncio.Future()
+
+    threading.Thread(target=asyncio.run, args=(run(),), daemon=True).start()
+    started.wait()
+    return port[0]
+
+
+def bench_threaded(urls: list) -> tuple:
+    manager = RelayManager()
+    for url in urls:
+        manager.add_relay(url)
+    manager.open_connections()
+    threads = threading.active_count()
+    tracemalloc.start()
+    start = time.perf_counter()
+    manager.add_subscription_on_all_relays("sub", Filters([Filter()]))
+    eose = set()
+    while len(eose) < len(urls):
+        eose.add(manager.message_pool.get_eose_notice().url)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    manager.close_connections()
+    return elapsed, peak, threads
+
+
+async def bench_async(urls: list) -> tuple:
+    async with AsyncRelayManager() as manager:
+        for url in urls:
+            manager.add_relay(url)
+        await manager.open_connections()
+        threads = threading.active_count()
+        tracemalloc.start()
+        start = time.perf_counter()
+        await manager.add_subscription_on_all_relays("sub", Filters([Filter()]))
+        eose = set()
+        async for notice in manager.eose_notices():
+            eose.add(notice.url)
+            if len(eose) == len(urls):
+                break
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return elapsed, peak, threads
+
+
+def main(n_relays: int = 20, n_events: int = 500):
+    port = start_stub_relay(n_events)
+    urls = [f"ws://127.0.0.1:{port}/{i}" for i in range(n_relays)]
+    print(f"{n_relays} relays x {n_events} events (stub relay runs on 1 thread)")
+    for name, run in (
+        ("asyncio", lambda: asyncio.run(bench_async(urls))),
+        ("threaded", lambda: bench_threaded(urls)),
+    ):
+        elapsed, peak, threads = run()
+        print(
+            f"{name:>9}: {elapsed:.2f}s to EOSE, "
+            f"{n_relays * n_events / elapsed:,.0f} events/s, "
+            f"peak {peak / 2**20:.1f} MiB, {threads} threads"
+        )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
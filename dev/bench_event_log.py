@@ -0,0 +1,97 @@
+"""Benchmark `nostr.event_log.EventLog` against a JSON-per-line file: append
+rate, lookup by id and a time range query.
+
+Usage: python dev/bench_event_log.py [n_events]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+from nostr.event import Event
+from nostr.event_log import EventLog
+
+PUBKEY = "f3c25355c29f64ea8e9b4e11b583ac0a7d0d8235f156cffec2b73e5756aab206"
+START = 1674819397
+
+
+def build(n: int) -> "list[Event]":
+    events = []
+    for i in range(n):
+        event = Event(
+            content=f"benchmark event {i}", public_key=PUBKEY, created_at=START + i
+        )
+        event.signature = "98" * 64
+        event.id
+        events.append(event)
+    return events
+
+
+def jsonl(events: "list[Event]", path: str) -> dict:
+    timings = {}
+    start = time.perf_counter()
+    with open(path, "w") as file:
+        for event in events:
+            file.write(json.dumps(event.to_dict()) + "\n")
+    timings["append"] = time.perf_counter() - start
+
+    event_id = events[len(events) // 2].id
+    start = time.perf_counter()
+    with open(path) as file:
+        for line in file:
+            if json.loads(line)["id"] == event_id:
+                break
+    timings["get by id"] = time.perf_counter() - start
+
+    since = START + len(events) // 2
+    start = time.perf_counter()
+    with open(path) as file:
+        found = [
+            line
+            for line in file
+            if since <= json.loads(line)["created_at"] < since + 60
+        ]
+    assert len(found) == 60
+    timings["1 min range"] = time.perf_counter() - start
+    return timings
+
+
+def event_log(events: "list[Event]", directory: str) -> dict:
+    timings = {}
+    start = time.perf_counter()
+    with EventLog(directory, segment_size=16 * 1024 * 1024) as log:
+        log.append_many(events)
+    timings["append"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    log = EventLog(directory, segment_size=16 * 1024 * 1024)
+    timings["open"] = time.perf_counter() - start
+
+    event_id = events[len(events) // 2].id
+    start = time.perf_counter()
+    log.get(event_id)
+    timings["get by id"] = time.perf_counter() - start
+
+    since = START + len(events) // 2
+    start = time.perf_counter()
+    found = list(log.iter_raw(since, since + 59))
+    assert len(found) == 60
+    timings["1 min range"] = time.perf_counter() - start
+    log.close()
+    return timings
+
+
+def main(n: int = 200000):
+    events = build(n)
+    with tempfile.TemporaryDirectory() as directory:
+        lines = jsonl(events, os.path.join(directory, "events.jsonl"))
+        log = event_log(events, os.path.join(directory, "log"))
+    print(f"{n} events")
+    print(f"{'operation':<14}{'jsonl (ms)':>12}{'log (ms)':>12}")
+    for name in log:
+        print(f"{name:<14}{lines.get(name, 0) * 1e3:>12.2f}{log[name] * 1e3:>12.2f}")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
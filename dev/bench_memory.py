@@ -0,0 +1,44 @@
+"""Measure memory per buffered event: an Event wrapped in an EventMessage, as
+held in MessagePool.events / EventMessageStore.
+
+Usage: python dev/bench_memory.py [n_events]
+"""
+import sys
+import tracemalloc
+
+from nostr.event import Event
+from nostr.message_pool import EventMessage
+
+PUBKEY = "f3c25355c29f64ea8e9b4e11b583ac0a7d0d8235f156cffec2b73e5756aab206"
+SIG = "98" * 64
+
+
+def build(n: int) -> list:
+    messages = []
+    for i in range(n):
+        event = Event.from_dict(
+            {
+                "pubkey": PUBKEY,
+                "created_at": 1674819397 + i,
+                "kind": 1,
+                "tags": [],
+                "content": "",
+                "sig": SIG,
+            }
+        )
+        event.id
+        messages.append(EventMessage(event, "sub", "wss://relay.example.com"))
+    return messages
+
+
+def main(n: int = 100000):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    messages = build(n)
+    after = tracemalloc.take_snapshot()
+    total = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    print(f"{len(messages)} buffered events: {total / n:.0f} bytes per event")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
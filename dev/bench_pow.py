@@ -0,0 +1,52 @@
+"""Compare NIP-13 guesses per second of the PowEvent.mine loop, which
+re-serializes the event for every nonce, with NonceMiner, which only hashes the
+nonce digits and what follows them.
+
+Usage: python dev/bench_pow.py [n_guesses] [content_length]
+"""
+import sys
+import time
+
+from nostr import codec
+from nostr.event import Event
+from nostr.key import PrivateKey
+from nostr.pow import NonceMiner, PowEvent
+
+DIFFICULTY = 250  # never reached, every run makes all its guesses
+
+
+def bench_mine_loop(event: Event, n: int) -> float:
+    pow_event = PowEvent(DIFFICULTY, event)
+    start = time.perf_counter()
+    pow_event.mine(max_count=n)
+    return n / (time.perf_counter() - start)
+
+
+def bench_nonce_miner(event: Event, n: int) -> float:
+    start = time.perf_counter()
+    miner = NonceMiner(
+        event.public_key,
+        event.created_at,
+        event.kind,
+        event.tags,
+        event.content,
+        DIFFICULTY,
+    )
+    blocks = max(1, n // miner.block)
+    for block in range(blocks):
+        miner.search_block(block)
+    return blocks * miner.block / (time.perf_counter() - start)
+
+
+def main(n: int = 200000, content_length: int = 40):
+    public_key = PrivateKey().public_key.hex()
+    event = Event(content="x" * content_length, public_key=public_key)
+    event.add_pubkey_ref(public_key)
+    loop = bench_mine_loop(event, n)
+    midstate = bench_nonce_miner(event, n)
+    print(f"PowEvent.mine: {loop:,.0f} guesses/s ({codec.get_backend()} backend)")
+    print(f"NonceMiner:    {midstate:,.0f} guesses/s ({midstate / loop:.1f}x)")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,114 @@
+"""Benchmark `nostr.message_pool.EventMessageStore`: indexing rate for events
+arriving live, newest first (stored events after a REQ) and shuffled, the cost
+of a late event followed by a query by time, and query latency against the
+linear scans it replaced.
+
+Usage: python dev/bench_store.py [n_events]
+"""
+import random
+import sys
+import time
+
+from nostr.event import Event
+from nostr.message_pool import EventMessage, EventMessageStore
+
+AUTHORS = [f"{i:064x}" for i in range(1000)]
+URLS = [f"wss://relay{i}.example.com" for i in range(5)]
+START = 1674819397
+
+
+def build(n: int) -> "list[EventMessage]":
+    rng = random.Random(0)
+    messages = []
+    for i in range(n):
+        # mostly in order, as relays deliver them, with some stragglers
+        created_at = START + i - (rng.randrange(3600) if i % 10 == 0 else 0)
+        event = Event(
+            content=f"event {i}",
+            public_key=rng.choice(AUTHORS),
+            created_at=created_at,
+            kind=rng.randrange(10),
+        )
+        event.id
+        messages.append(EventMessage(event, f"sub{i % 10}", rng.choice(URLS)))
+    return messages
+
+
+def orders(messages: "list[EventMessage]") -> "dict[str, list[EventMessage]]":
+    newest_first = sorted(messages, key=lambda m: m.event.created_at, reverse=True)
+    shuffled = list(messages)
+    random.Random(1).shuffle(shuffled)
+    return {"live": messages, "newest first": newest_first, "shuffled": shuffled}
+
+
+def timed(function, repeat: int) -> float:
+    """Mean seconds per call."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+def main(n: int = 1000000):
+    messages = build(n)
+    for order, ordered in orders(messages).items():
+        start = time.perf_counter()
+        store = EventMessageStore()
+        store.add_event(ordered)
+        store.get_newest_event()
+        elapsed = time.perf_counter() - start
+        print(f"{n} events indexed ({order}) in {elapsed:.2f} s")
+
+    # a late event, then a query, as when a relay sends stragglers meanwhile
+    rng = random.Random(2)
+    late = [
+        EventMessage(
+            Event(content="late", created_at=START + rng.randrange(n)), "sub0", URLS[0]
+        )
+        for _ in range(1000)
+    ]
+    start = time.perf_counter()
+    for message in late:
+        store.add_event(message)
+        store.get_newest_event()
+        store.get_events_between(message.event.created_at, message.event.created_at)
+    elapsed = (time.perf_counter() - start) / len(late)
+    print(f"late event added, then queried by time: {elapsed * 1e6:.1f} us")
+
+    event_id = messages[n // 2].event.id
+    author = AUTHORS[7]
+    middle = START + n // 2
+    queries = {
+        "newest": (
+            store.get_newest_event,
+            lambda: max(messages, key=lambda m: m.event.created_at),
+        ),
+        "by id": (
+            lambda: store.get_event(event_id),
+            lambda: next(m for m in messages if m.event.id == event_id),
+        ),
+        "by author": (
+            lambda: store.get_events_by_author(author),
+            lambda: [m for m in messages if m.event.public_key == author],
+        ),
+        "by url": (
+            lambda: store.get_events_by_url(URLS[0]),
+            lambda: [m for m in messages if m.url == URLS[0]],
+        ),
+        "1 min range": (
+            lambda: store.get_events_between(middle, middle + 60),
+            lambda: [
+                m for m in messages if middle <= m.event.created_at <= middle + 60
+            ],
+        ),
+    }
+    print(f"{'query':<14}{'indexed (us)':>14}{'scan (us)':>14}")
+    for name, (indexed, scan) in queries.items():
+        print(
+            f"{name:<14}{timed(indexed, 100) * 1e6:>14.1f}"
+            f"{timed(scan, 3) * 1e6:>14.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,43 @@
+"""Benchmark `nostr.event.verify_many`: verifications/sec vs. worker count.
+
+Usage: python dev/bench_verify.py [n_events]
+"""
+import sys
+import time
+
+from nostr.event import Event, verify_many
+from nostr.key import PrivateKey
+
+
+def make_events(n: int) -> "list[dict]":
+    keys = [PrivateKey() for _ in range(16)]
+    events = []
+    for i in range(n):
+        event = Event(content=f"benchmark event {i}")
+        event.sign(keys[i % len(keys)].hex())
+        events.append(event.to_dict())
+    return events
+
+
+def run(events: "list[dict]", **kwargs) -> float:
+    batch = [Event.from_dict(event) for event in events]
+    start = time.perf_counter()
+    assert all(verify_many(batch, **kwargs))
+    return len(batch) / (time.perf_counter() - start)
+
+
+def main(n: int = 20000):
+    events = make_events(n)
+    print(f"{n} events")
+    print(f"{'mode':<10}{'workers':>8}{'verif/s':>12}")
+    print(f"{'serial':<10}{1:>8}{run(events):>12.0f}")
+    for workers in (2, 4, 8, 16):
+        rate = run(events, workers=workers)
+        print(f"{'threads':<10}{workers:>8}{rate:>12.0f}")
+    for workers in (2, 4, 8):
+        rate = run(events, workers=workers, processes=True)
+        print(f"{'processes':<10}{workers:>8}{rate:>12.0f}")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
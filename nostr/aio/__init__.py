@@ -0,0 +1,9 @@
+"""asyncio counterparts of `Relay` and `RelayManager`.
+
+All relays of an `AsyncRelayManager` share one event loop instead of one thread
+each. Requires the `websockets` package: ``pip install nostrpy[aio]``.
+"""
+from .relay import AsyncRelay
+from .relay_manager import AsyncRelayManager
+
+__all__ = ["AsyncRelay", "AsyncRelayManager"]
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Optional, Union
+
+try:
+    from websockets.asyncio.client import ClientConnection, connect
+    from websockets.exceptions import ConnectionClosed
+    from websockets.protocol import State
+except ImportError as e:  # pragma: no cover
+    raise ImportError(
+        "nostr.aio requires websockets >= 13, install it with "
+        "`pip install nostrpy[aio]`"
+    ) from e
+
+from ..cache import VerifiedEventCache
+from ..message_pool import MessagePool
+from ..relay import BaseRelay, RelayPolicy
+from ..subscription import Subscription
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRelay(BaseRelay):
+    """A relay connection driven by the running event loop.
+
+    Inbound messages are read by a task started in `connect` and added to the
+    message pool as they arrive.
+
+    :param ssl: ssl.SSLContext for wss:// urls, the default context if None
+    :param on_message: called without arguments after each message is added to
+        the pool
+    """
+
+    def __init__(
+        self,
+        url: str,
+        message_pool: MessagePool,
+        policy: RelayPolicy = RelayPolicy(),
+        subscriptions: "dict[str, Subscription]" = None,
+        verified_cache: Optional[VerifiedEventCache] = None,
+        ssl=None,
+        on_message: Optional[Callable[[], None]] = None,
+    ) -> None:
+        super().__init__(url, message_pool, policy, subscriptions, verified_cache)
+        self.ssl = ssl
+        self.on_message = on_message
+        self.ws: Optional[ClientConnection] = None
+        self.active = False
+        self._reader: Optional[asyncio.Task] = None
+
+    @property
+    def is_connected(self) -> bool:
+        return self.ws is not None and self.ws.state is State.OPEN
+
+    async def connect(self, timeout: Optional[float] = 10.0):
+        if self.is_connected:
+            return
+        options = {"max_size": None}
+        if self.ssl is not None:
+            options["ssl"] = self.ssl
+        self.ws = await asyncio.wait_for(connect(self.url, **options), timeout)
+        self.active = time.time()
+        self._reader = asyncio.ensure_future(self._read_messages())
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+        if self._reader is not None:
+            await self._reader
+            self._reader = None
+        self.active = False
+
+    async def publish(self, message: str):
+        try:
+            await self.ws.send(message)
+        except ConnectionClosed:
+            self.active = False
+            logger.exception(f"failed to send message to {self.url}")
+
+    async def _read_messages(self):
+        try:
+            async for message in self.ws:
+                self._on_message(message)
+        except ConnectionClosed:
+            pass
+        except Exception:
+            logger.exception(f"stopped reading from {self.url}")
+        finally:
+            self.active = False
+
+    def _on_message(self, message: Union[str, bytes]):
+        self.active = time.time()
+        if isinstance(message, bytes):
+            message = message.decode()
+        try:
+            parsed = self._parse_message(message)
+        except Exception:
+            logger.exception(f"invalid message from {self.url}")
+            return
+        if parsed is None:
+            return
+        message_json, event = parsed
+        self.message_pool.add_message_json(message_json, self.url, event, message)
+        if self.on_message is not None:
+            self.on_message()
@@ -0,0 +1,228 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from queue import Empty, Queue
+from typing import AsyncIterator, Optional
+
+from .. import codec
+from ..cache import VerifiedEventCache
+from ..event import Event
+from ..filter import Filters
+from ..message_pool import (
+    EndOfStoredEventsMessage,
+    EventMessage,
+    MessagePool,
+    NoticeMessage,
+    OkMessage,
+)
+from ..relay import RelayPolicy
+from ..relay_manager import WAIT_FOR, PublishResult, RelayException
+from ..request import Request
+from .relay import AsyncRelay
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class AsyncRelayManager:
+    """Manages connections to a set of relays on one event loop, sharing one
+    message pool.
+
+    Usage::
+
+        async with AsyncRelayManager() as manager:
+            manager.add_relay("wss://relay.example.com")
+            await manager.open_connections()
+            await manager.add_subscription_on_all_relays("sub", filters)
+            async for message in manager.events(timeout=5):
+                ...
+
+    :param connect_timeout: seconds to wait for each relay to connect
+    :param verified_cache_size: number of verified (id, signature) pairs
+        remembered across relays so duplicate copies skip verification; 0 disables
+    """
+
+    connect_timeout: float = 10.0
+    verified_cache_size: int = 65536
+
+    def __post_init__(self):
+        self.relays: dict[str, AsyncRelay] = {}
+        self.message_pool: MessagePool = MessagePool()
+        self.verified_cache = None
+        if self.verified_cache_size > 0:
+            self.verified_cache = VerifiedEventCache(self.verified_cache_size)
+        # created on first use so that it belongs to the running loop
+        self._message_received: Optional[asyncio.Event] = None
+
+    def add_relay(self, url: str, policy: RelayPolicy = RelayPolicy(), ssl=None):
+        self.relays[url] = AsyncRelay(
+            url,
+            self.message_pool,
+            policy,
+            verified_cache=self.verified_cache,
+            ssl=ssl,
+            on_message=self._notify,
+        )
+
+    async def remove_relay(self, url: str):
+        if url in self.relays:
+            relay = self.relays.pop(url)
+            await relay.close()
+
+    async def remove_closed_relays(self):
+        for url, connected in self.connection_statuses.items():
+            if not connected:
+                await self.remove_relay(url)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        await self.close_connections()
+
+    async def open_connections(self):
+        """Connect to all relays concurrently; relays that fail to connect
+        within `connect_timeout` are removed."""
+        relays = list(self.relays.values())
+        results = await asyncio.gather(
+            *(relay.connect(self.connect_timeout) for relay in relays),
+            return_exceptions=True,
+        )
+        for relay, result in zip(relays, results):
+            if isinstance(result, BaseException):
+                logger.warning(f"could not connect to {relay.url}: {result!r}")
+        await self.remove_closed_relays()
+
+    async def close_connections(self):
+        await asyncio.gather(*(relay.close() for relay in self.relays.values()))
+
+    @property
+    def connection_statuses(self) -> dict:
+        return {url: relay.is_connected for url, relay in self.relays.items()}
+
+    def add_subscription(self, id: str, filters: Filters):
+        for relay in self.relays.values():
+            if relay.policy.should_read:
+                relay.add_subscription(id, filters)
+
+    async def add_subscription_on_relay(self, url: str, id: str, filters: Filters):
+        if url not in self.relays:
+            raise RelayException(f"Invalid relay url: no connection to {url}")
+        relay = self.relays[url]
+        if not relay.policy.should_read:
+            raise RelayException(
+                f"Could not send request: {url} is not configured to read from"
+            )
+        relay.add_subscription(id, filters)
+        await relay.publish(Request(id, filters).to_message())
+
+    async def add_subscription_on_all_relays(self, id: str, filters: Filters):
+        message = Request(id, filters).to_message()
+        relays = [relay for relay in self.relays.values() if relay.policy.should_read]
+        for relay in relays:
+            relay.add_subscription(id, filters)
+        await asyncio.gather(*(relay.publish(message) for relay in relays))
+
+    async def close_subscription_on_relay(self, url: str, id: str):
+        if url not in self.relays:
+            raise RelayException(f"Invalid relay url: no connection to {url}")
+        relay = self.relays[url]
+        relay.close_subscription(id)
+        await relay.publish(codec.dumps(["CLOSE", id]))
+
+    async def close_subscription_on_all_relays(self, id: str):
+        message = codec.dumps(["CLOSE", id])
+        for relay in self.relays.values():
+            relay.close_subscription(id)
+        await asyncio.gather(
+            *(relay.publish(message) for relay in self.relays.values())
+        )
+
+    async def publish_message(self, message: str):
+        await asyncio.gather(
+            *(
+                relay.publish(message)
+                for relay in self.relays.values()
+                if relay.policy.should_write
+            )
+        )
+
+    async def publish_event(
+        self, event: Event, wait_for: Optional[str] = None, timeout: float = 10.0
+    ) -> Optional[PublishResult]:
+        """Verifies that the Event is publishable before submitting it to relays.
+
+        :param wait_for: see `RelayManager.publish_event`
+        """
+        if event.signature is None:
+            raise RelayException(f"Could not publish {event.id}: must be signed")
+
+        if not event.verify():
+            raise RelayException(
+                f"Could not publish {event.id}: "
+                f"failed to verify signature {event.signature}"
+            )
+
+        if wait_for is None:
+            await self.publish_message(event.to_message())
+            return None
+
+        if wait_for not in WAIT_FOR:
+            raise ValueError(f"wait_for must be one of {WAIT_FOR}, not {wait_for!r}")
+        urls = [url for url, r in self.relays.items() if r.policy.should_write]
+        result = PublishResult(event.id, urls, wait_for)
+        done = asyncio.Event()
+
+        def on_ok(ok: OkMessage):
+            if ok.url in urls:
+                result.oks[ok.url] = ok
+            if result.done:
+                done.set()
+
+        self.message_pool.add_ok_listener(event.id, on_ok)
+        try:
+            await self.publish_message(event.to_message())
+            if not result.done:
+                await asyncio.wait_for(done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.message_pool.remove_ok_listener(event.id, on_ok)
+        return PublishResult(event.id, urls, wait_for, dict(result.oks))
+
+    def events(self, timeout: Optional[float] = None) -> AsyncIterator[EventMessage]:
+        """Iterate over inbound events as they arrive.
+
+        :param timeout: stop after this many seconds without a new message;
+            None to wait forever
+        """
+        return self._iterate(self.message_pool.events, timeout)
+
+    def notices(self, timeout: Optional[float] = None) -> AsyncIterator[NoticeMessage]:
+        return self._iterate(self.message_pool.notices, timeout)
+
+    def eose_notices(
+        self, timeout: Optional[float] = None
+    ) -> AsyncIterator[EndOfStoredEventsMessage]:
+        return self._iterate(self.message_pool.eose_notices, timeout)
+
+    def _notify(self):
+        if self._message_received is not None:
+            self._message_received.set()
+
+    async def _iterate(self, queue: Queue, timeout: Optional[float]):
+        if self._message_received is None:
+            self._message_received = asyncio.Event()
+        while True:
+            try:
+                yield queue.get_nowait()
+                continue
+            except Empty:
+                pass
+            self._message_received.clear()
+            if queue.qsize():
+                continue
+            try:
+                await asyncio.wait_for(self._message_received.wait(), timeout)
+            except asyncio.TimeoutError:
+                return
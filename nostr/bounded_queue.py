@@ -0,0 +1,131 @@
+"""Queue with a size limit and a policy for what happens when it is full."""
+import pickle
+import tempfile
+from collections import deque
+from queue import Queue
+from typing import Any, Optional
+
+
+class OverflowPolicy:
+    BLOCK = "block"
+    DROP_OLDEST = "drop-oldest"
+    DROP_NEWEST = "drop-newest"
+    SPILL = "spill"
+
+    @staticmethod
+    def is_valid(policy: str) -> bool:
+        return policy in (
+            OverflowPolicy.BLOCK,
+            OverflowPolicy.DROP_OLDEST,
+            OverflowPolicy.DROP_NEWEST,
+            OverflowPolicy.SPILL,
+        )
+
+
+class BoundedQueue(Queue):
+    """Queue holding at most `maxsize` items in memory.
+
+    When it is full, `put` follows `policy`:
+
+    - "block" waits for room, like `queue.Queue`, which slows the producer down
+    - "drop-oldest" discards the item that was queued first
+    - "drop-newest" discards the item being put
+    - "spill" pickles further items to a temporary file and reads them back in
+      order as room frees up, so memory stays bounded without losing items
+
+    `dropped` and `spilled` count the items discarded and written to disk.
+
+    :param maxsize: maximum number of items in memory, 0 for no limit
+    :param policy: one of the OverflowPolicy values
+    :param spill_dir: directory of the spill file, the system default if None
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 0,
+        policy: str = OverflowPolicy.BLOCK,
+        spill_dir: Optional[str] = None,
+    ) -> None:
+        if not OverflowPolicy.is_valid(policy):
+            raise ValueError(f"Unknown overflow policy {policy!r}")
+        self.policy = policy
+        self.limit = maxsize
+        self.spill_dir = spill_dir
+        self.dropped = 0
+        self.spilled = 0
+        # spilled items are accounted for by _qsize, Queue itself is unbounded
+        super().__init__(maxsize if policy == OverflowPolicy.BLOCK else 0)
+
+    def put(self, item: Any, block: bool = True, timeout: Optional[float] = None):
+        if not self.limit or self.policy in (
+            OverflowPolicy.BLOCK,
+            OverflowPolicy.SPILL,
+        ):
+            return super().put(item, block, timeout)
+
+        with self.not_full:
+            if len(self.queue) >= self.limit:
+                self.dropped += 1
+                if self.policy == OverflowPolicy.DROP_NEWEST:
+                    return
+                self.queue.popleft()
+                self.unfinished_tasks -= 1
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    def put_nowait(self, item: Any):
+        return self.put(item, block=False)
+
+    def _init(self, maxsize: int):
+        self.queue = deque()
+        self._spill_file = None
+        self._spill_count = 0
+        self._spill_read = 0
+
+    def _qsize(self) -> int:
+        return len(self.queue) + self._spill_count
+
+    def _put(self, item: Any):
+        spill = self.policy == OverflowPolicy.SPILL and self.limit
+        if spill and (self._spill_count or len(self.queue) >= self.limit):
+            self._spill(item)
+        else:
+            self.queue.append(item)
+
+    def _get(self) -> Any:
+        item = self.queue.popleft()
+        while self._spill_count and len(self.queue) < self.limit:
+            self.queue.append(self._unspill())
+        return item
+
+    def _spill(self, item: Any):
+        if self._spill_file is None:
+            self._spill_file = tempfile.TemporaryFile(
+                prefix="nostr-spill-", dir=self.spill_dir
+            )
+        self._spill_file.seek(0, 2)
+        pickle.dump(item, self._spill_file, pickle.HIGHEST_PROTOCOL)
+        self._spill_count += 1
+        self.spilled += 1
+
+    def _unspill(self) -> Any:
+        self._spill_file.seek(self._spill_read)
+        item = pickle.load(self._spill_file)
+        self._spill_read = self._spill_file.tell()
+        self._spill_count -= 1
+        if not self._spill_count:
+            # drained: reuse the file from the start
+            self._spill_file.seek(0)
+            self._spill_file.truncate()
+            self._spill_read = 0
+        return item
+
+    def close(self):
+        """Delete the spill file and any items still in it."""
+        with self.mutex:
+            if self._spill_file is not None:
+                self._spill_file.close()
+                self._spill_file = None
+            self._spill_count = 0
+            self._spill_read = 0
@@ -0,0 +1,182 @@
+import math
+import time
+from collections import OrderedDict
+from hashlib import blake2b
+from threading import Lock
+
+
+class VerifiedEventCache:
+    """Bounded, thread-safe LRU set of (event id, signature) pairs whose signature
+    has already been verified.
+
+    Shared by the relays of a RelayManager so that copies of an event received
+    from several relays are only verified once. Only consult it after checking
+    that the id matches the event content.
+
+    :param capacity: maximum number of pairs remembered
+    """
+
+    def __init__(self, capacity: int = 65536) -> None:
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def _key(event_id: str, signature: str) -> bytes:
+        return bytes.fromhex(event_id + signature)
+
+    def contains(self, event_id: str, signature: str) -> bool:
+        """Look up a pair, counting a hit or miss."""
+        key = self._key(event_id, signature)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False
+
+    def add(self, event_id: str, signature: str) -> None:
+        key = self._key(event_id, signature)
+        with self._lock:
+            self._entries[key] = None
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return (
+            f"VerifiedEventCache({len(self)}/{self.capacity} "
+            f"hits={self.hits} misses={self.misses})"
+        )
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over byte strings.
+
+    :param capacity: number of items the filter is sized for
+    :param error_rate: false positive rate at `capacity` items
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 1e-4) -> None:
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.n_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.n_hashes = max(1, round(self.n_bits / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.n_bits + 7) // 8)
+
+    def _positions(self, item: bytes):
+        digest = blake2b(item, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        for i in range(self.n_hashes):
+            yield (h1 + i * h2) % self.n_bits
+
+    def add(self, item: bytes) -> None:
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: bytes) -> bool:
+        for position in self._positions(item):
+            if not self._bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class EventDeduplicator:
+    """Bounded memory of (subscription id, event id) pairs already delivered.
+
+    Entries are stored as the raw 32-byte event id plus a small per-subscription
+    index. Not thread-safe; MessagePool calls it under its lock.
+
+    :param capacity: maximum number of entries, least recently seen are evicted
+        first; 0 for no limit
+    :param ttl: forget entries not seen for this many seconds; 0 for no limit
+    :param bloom: use two rotating Bloom filters of `capacity` entries each
+        instead of exact entries, for very high cardinality. A rare new event
+        (about `error_rate` per filter) may be dropped as a duplicate.
+    :param error_rate: false positive rate of the Bloom filters
+    """
+
+    def __init__(
+        self,
+        capacity: int = 100000,
+        ttl: float = 0,
+        bloom: bool = False,
+        error_rate: float = 1e-4,
+    ) -> None:
+        if bloom and capacity <= 0:
+            raise ValueError("A Bloom filter deduplicator needs a capacity")
+        self.capacity = capacity
+        self.ttl = ttl
+        self.bloom = bloom
+        self.error_rate = error_rate
+        self._subscriptions: "dict[str, bytes]" = {}
+        self._entries: OrderedDict = OrderedDict()
+        if bloom:
+            self._filters = [BloomFilter(capacity, error_rate)]
+            self._rotated_at = time.monotonic()
+
+    def _key(self, subscription_id: str, event_id: str) -> bytes:
+        index = self._subscriptions.get(subscription_id)
+        if index is None:
+            index = len(self._subscriptions).to_bytes(4, "big")
+            self._subscriptions[subscription_id] = index
+        return bytes.fromhex(event_id) + index
+
+    def seen(self, subscription_id: str, event_id: str) -> bool:
+        """Return whether the pair was seen before, and remember it."""
+        key = self._key(subscription_id, event_id)
+        if self.bloom:
+            return self._seen_bloom(key)
+
+        now = time.monotonic()
+        if self.ttl:
+            while self._entries:
+                oldest, seen_at = next(iter(self._entries.items()))
+                if now - seen_at <= self.ttl:
+                    break
+                del self._entries[oldest]
+
+        found = key in self._entries
+        self._entries[key] = now
+        self._entries.move_to_end(key)
+        if self.capacity and len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+        return found
+
+    def _seen_bloom(self, key: bytes) -> bool:
+        current = self._filters[-1]
+        expired = self.ttl and time.monotonic() - self._rotated_at > self.ttl
+        if current.count >= self.capacity or expired:
+            # keep the previous generation so recent entries are still found
+            current = BloomFilter(self.capacity, self.error_rate)
+            self._filters = [self._filters[-1], current]
+            self._rotated_at = time.monotonic()
+
+        found = any(key in bloom_filter for bloom_filter in self._filters)
+        if not found:
+            current.add(key)
+        return found
+
+    def __len__(self):
+        if self.bloom:
+            return sum(bloom_filter.count for bloom_filter in self._filters)
+        return len(self._entries)
+
+    def __repr__(self):
+        mode = "bloom" if self.bloom else "lru"
+        return f"EventDeduplicator({mode} {len(self)}/{self.capacity} ttl={self.ttl})"
@@ -0,0 +1,181 @@
+"""Coalescing of subscriptions into fewer relay REQs.
+
+Filters that only differ in their authors, or only in their event ids, are
+merged into one filter selecting the union of their events. Subscriptions are
+grouped into shared relay subscriptions whose REQs carry the merged filters,
+and received events are dispatched back to the original subscriptions by
+matching them against their own filters.
+"""
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .event import Event
+from .filter import Filter, Filters
+from .subscription import Subscription, SubscriptionIndex
+
+# (attribute, json key) of the lists merged filters may differ in
+_MERGEABLE = (("authors", "authors"), ("event_ids", "ids"))
+
+
+def _copy(filter: Filter) -> Filter:
+    copy = Filter(
+        event_ids=filter.event_ids,
+        kinds=filter.kinds,
+        authors=filter.authors,
+        since=filter.since,
+        until=filter.until,
+        limit=filter.limit,
+    )
+    copy.event_refs = filter.event_refs
+    copy.pubkey_refs = filter.pubkey_refs
+    copy.tags = dict(filter.tags)
+    return copy
+
+
+def _merge_on(filters: Iterable[Filter], attribute: str, json_key: str) -> List[Filter]:
+    merged: List[Filter] = []
+    by_key: Dict[str, Filter] = {}
+    for filter in filters:
+        # a limit applies to the matches of its own filter only
+        if filter.limit:
+            merged.append(filter)
+            continue
+        # what the filter selects, apart from the attribute being merged
+        key = filter.canonical_json((json_key,))
+        target = by_key.get(key)
+        if target is None:
+            target = by_key[key] = _copy(filter)
+            merged.append(target)
+            continue
+        values = getattr(target, attribute)
+        other = getattr(filter, attribute)
+        # no values selects everything, which the union is then too
+        if not values or not other:
+            setattr(target, attribute, None)
+        else:
+            setattr(target, attribute, list(dict.fromkeys(values + other)))
+    return merged
+
+
+def merge_filters(filters: Iterable[Filter]) -> List[Filter]:
+    """Merge the filters that only differ in their authors, or only in their
+    event ids. The result matches exactly the events matched by any of
+    `filters`; the filters themselves are left untouched."""
+    merged = list(filters)
+    for attribute, json_key in _MERGEABLE:
+        merged = _merge_on(merged, attribute, json_key)
+    return merged
+
+
+class _Group:
+    __slots__ = ("id", "members", "filters")
+
+    def __init__(self, id: str) -> None:
+        self.id = id
+        self.members: Dict[str, Filters] = {}
+        self.filters: List[Filter] = []
+
+    def merged(self, extra: Iterable[Filter] = ()) -> List[Filter]:
+        sources = [f for filters in self.members.values() for f in filters]
+        return merge_filters(sources + list(extra))
+
+
+class RequestCoalescer:
+    """Groups subscriptions into as few relay subscriptions as possible.
+
+    A new subscription joins the relay subscription whose merged filters absorb
+    its own without growing in number. Otherwise it gets a relay subscription of
+    its own, unless `max_subscriptions` are already open, in which case it joins
+    the one with the fewest filters.
+
+    Used as the `router` of a MessagePool, it turns the events and EOSE received
+    for a relay subscription into ones for the subscriptions of its group whose
+    filters match. Subscriptions may be added and removed while relays' receiving
+    threads route events.
+
+    :param max_subscriptions: relay subscriptions allowed at once, 0 for no limit
+    :param prefix: prefix of the relay subscription ids
+    """
+
+    def __init__(self, max_subscriptions: int = 0, prefix: str = "coalesced-"):
+        self.max_subscriptions = max_subscriptions
+        self.prefix = prefix
+        self.subscriptions: Dict[str, Filters] = {}
+        self._groups: Dict[str, _Group] = {}
+        self._group_of: Dict[str, str] = {}
+        self._index = SubscriptionIndex()
+        self._next_id = 0
+        self._lock = Lock()
+
+    def add(self, id: str, filters: Filters) -> Tuple[str, Filters]:
+        """Add a subscription; returns the id of the relay subscription it joins
+        and the filters its REQ must now carry."""
+        with self._lock:
+            if id in self.subscriptions:
+                raise ValueError(f"Subscription {id} was already added")
+            group = self._choose_group(filters)
+            group.members[id] = filters
+            group.filters = group.merged()
+            self.subscriptions[id] = filters
+            self._group_of[id] = group.id
+            self._index.add(Subscription(id, filters))
+            return group.id, Filters(group.filters)
+
+    def _choose_group(self, filters: Filters) -> _Group:
+        for group in self._groups.values():
+            if len(group.merged(filters)) <= len(group.filters):
+                return group
+        if not self.max_subscriptions or len(self._groups) < self.max_subscriptions:
+            group = _Group(f"{self.prefix}{self._next_id}")
+            self._next_id += 1
+            self._groups[group.id] = group
+            return group
+        return min(self._groups.values(), key=lambda group: len(group.filters))
+
+    def remove(self, id: str) -> Tuple[str, Optional[Filters]]:
+        """Remove a subscription; returns the id of its relay subscription and
+        the filters its REQ must now carry, or None if it must be closed."""
+        with self._lock:
+            group = self._groups[self._group_of.pop(id)]
+            del group.members[id]
+            del self.subscriptions[id]
+            self._index.remove(id)
+            if not group.members:
+                del self._groups[group.id]
+                return group.id, None
+            group.filters = group.merged()
+            return group.id, Filters(group.filters)
+
+    def route(self, subscription_id: str, event: Event) -> Optional[List[str]]:
+        """The subscriptions an event received for relay subscription
+        `subscription_id` belongs to, or None if it is not one of ours."""
+        with self._lock:
+            group = self._groups.get(subscription_id)
+            if group is None:
+                return None
+            matched = self._index.match(event)
+            return [id for id in group.members if id in matched]
+
+    def route_eose(self, subscription_id: str) -> Optional[List[str]]:
+        with self._lock:
+            group = self._groups.get(subscription_id)
+            if group is None:
+                return None
+            return list(group.members)
+
+    @property
+    def relay_subscriptions(self) -> Dict[str, Filters]:
+        with self._lock:
+            return {id: Filters(group.filters) for id, group in self._groups.items()}
+
+    def relay_subscription_of(self, id: str) -> str:
+        """Id of the relay subscription subscription `id` is part of, or `id`
+        itself if it was not added."""
+        with self._lock:
+            return self._group_of.get(id, id)
+
+    def __repr__(self):
+        return (
+            f"RequestCoalescer({len(self.subscriptions)} subscriptions in "
+            f"{len(self._groups)} relay subscriptions)"
+        )
@@ -0,0 +1,123 @@
+"""JSON encoding and decoding for relay messages and event ids.
+
+The fastest installed backend is used, in order: orjson, msgspec, ujson and the
+stdlib json module. Set the NOSTR_JSON_BACKEND environment variable or call
+`set_backend` to pick one explicitly.
+
+All backends produce compact output without ASCII escaping, so
+`canonical_dumps` is byte-identical to the NIP-01 serialization
+``json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()`` for the
+str, int, bool, None, list and dict values an event is made of. Whenever a
+backend rejects a value (e.g. integers beyond 64 bits) the stdlib is used
+instead, so results and errors match the stdlib.
+"""
+import json
+import os
+from collections import namedtuple
+from typing import Any, Union
+
+BACKENDS = ("orjson", "msgspec", "ujson", "json")
+
+Backend = namedtuple("Backend", ["name", "dumps", "loads", "canonical_dumps", "errors"])
+
+# Errors on which the stdlib json module is used instead of the backend
+_FALLBACK_ERRORS = (TypeError, ValueError, OverflowError)
+
+
+def _json_dumps(obj: Any) -> str:
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+def _json_canonical_dumps(obj: Any) -> bytes:
+    return _json_dumps(obj).encode()
+
+
+def _load_backend(name: str) -> Backend:
+    if name == "json":
+        return Backend(
+            "json", _json_dumps, json.loads, _json_canonical_dumps, _FALLBACK_ERRORS
+        )
+    if name == "orjson":
+        import orjson
+
+        return Backend(
+            "orjson",
+            lambda obj: orjson.dumps(obj).decode(),
+            orjson.loads,
+            orjson.dumps,
+            _FALLBACK_ERRORS,
+        )
+    if name == "msgspec":
+        import msgspec
+
+        encoder = msgspec.json.Encoder()
+        decoder = msgspec.json.Decoder()
+        return Backend(
+            "msgspec",
+            lambda obj: encoder.encode(obj).decode(),
+            decoder.decode,
+            encoder.encode,
+            _FALLBACK_ERRORS + (msgspec.MsgspecError,),
+        )
+    if name == "ujson":
+        import ujson
+
+        def dumps(obj: Any) -> str:
+            return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False)
+
+        return Backend(
+            "ujson",
+            dumps,
+            ujson.loads,
+            lambda obj: dumps(obj).encode(),
+            _FALLBACK_ERRORS,
+        )
+    raise ValueError(f"Unknown JSON backend {name!r}, expected one of {BACKENDS}")
+
+
+def _default_backend() -> Backend:
+    name = os.environ.get("NOSTR_JSON_BACKEND")
+    if name:
+        return _load_backend(name)
+    for name in BACKENDS:
+        try:
+            return _load_backend(name)
+        except ImportError:
+            continue
+
+
+_backend = _default_backend()
+
+
+def get_backend() -> str:
+    """Name of the backend in use."""
+    return _backend.name
+
+
+def set_backend(name: str) -> None:
+    """Switch to the named backend; raises ImportError if it is not installed."""
+    global _backend
+    _backend = _load_backend(name)
+
+
+def dumps(obj: Any) -> str:
+    """Compact JSON string for the wire."""
+    try:
+        return _backend.dumps(obj)
+    except _backend.errors:
+        return _json_dumps(obj)
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    try:
+        return _backend.loads(data)
+    except _backend.errors:
+        return json.loads(data)
+
+
+def canonical_dumps(obj: Any) -> bytes:
+    """UTF-8 NIP-01 serialization, as hashed for the event id."""
+    try:
+        return _backend.canonical_dumps(obj)
+    except _backend.errors:
+        return _json_canonical_dumps(obj)
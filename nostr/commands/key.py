@@ -1,9 +1,20 @@
+import itertools
 import json
+import os
+from pathlib import Path
 
 import click
 from click_aliases import ClickAliasedGroup
 
 from nostr.key import PrivateKey, PublicKey
+from nostr.pow import MiningProgress, PowKey, PowVanityKey
+
+PROGRESS_DIR = Path.home().joinpath('.nostr')
+
+
+def progress_file_for(difficulty: int) -> str:
+    """Default progress file of `nostr key mine -d <difficulty>`."""
+    return str(PROGRESS_DIR.joinpath(f'key-mining-{difficulty}.json'))
 
 
 @click.group(cls=ClickAliasedGroup)
@@ -37,3 +48,136 @@ def convert(identifier: str):
     click.echo(
         json.dumps({"npub": public_key.bech32(), "hex": public_key.hex()}, indent=2)
     )
+
+
+@cli.command()
+@click.option("-p", "--prefix", "prefixes", multiple=True, type=str)
+@click.option("-s", "--suffix", "suffixes", multiple=True, type=str)
+@click.option(
+    "-w",
+    "--workers",
+    "workers",
+    type=int,
+    default=0,
+    help="Processes searching keys, one per CPU by default.",
+)
+@click.option("-t", "--timeout", "timeout", type=float, default=0)
+def vanity(prefixes: tuple, suffixes: tuple, workers: int = 0, timeout: float = 0):
+    """Searches a key whose npub starts and/or ends with the given characters.
+
+    With several prefixes and/or suffixes, the first key matching any of their
+    combinations is returned.
+    """
+    patterns = list(itertools.product(prefixes or [None], suffixes or [None]))
+    try:
+        pow_key = PowVanityKey(patterns=patterns)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    private_key = pow_key.mine_parallel(workers, max_duration=timeout)
+    if private_key is None:
+        click.echo(f"No key found in {pow_key.count} guesses", err=True)
+        return 1
+
+    click.echo(
+        json.dumps(
+            {
+                "Private key": private_key.bech32(),
+                "Public key": private_key.public_key.bech32(),
+                "Guesses": pow_key.count,
+                "Guesses/s": round(pow_key.get_hashrate()),
+            },
+            indent=2,
+        )
+    )
+    return 0
+
+
+@cli.command()
+@click.option(
+    "-d",
+    "--difficulty",
+    "difficulty",
+    required=True,
+    type=int,
+    help="Leading zero bits of the public key.",
+)
+@click.option(
+    "-w",
+    "--workers",
+    "workers",
+    type=int,
+    default=0,
+    help="Processes searching keys, one per CPU by default.",
+)
+@click.option("-t", "--timeout", "timeout", type=float, default=0)
+@click.option(
+    "--progress-file",
+    "progress_file",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Where progress is saved, and resumed from on the next run; "
+    "~/.nostr/key-mining-<difficulty>.json by default.",
+)
+@click.option("--restart", is_flag=True, help="Ignore the saved progress.")
+def mine(
+    difficulty: int,
+    workers: int = 0,
+    timeout: float = 0,
+    progress_file: str = None,
+    restart: bool = False,
+):
+    """Mines a key whose public key starts with `difficulty` zero bits.
+
+    Progress is printed and saved while mining, so that an interrupted run
+    continues where it stopped.
+    """
+    if progress_file is None:
+        progress_file = progress_file_for(difficulty)
+    pow_key = PowKey(difficulty)
+    progress = None if restart else MiningProgress.load(progress_file)
+    if progress is not None and progress.difficulty != difficulty:
+        click.echo(
+            f"{progress_file} holds progress for difficulty {progress.difficulty}, "
+            f"not {difficulty}; use another --progress-file or --restart",
+            err=True,
+        )
+        return 1
+    if progress is not None:
+        pow_key.resume(progress)
+        click.echo(f"Resuming from {progress_file}", err=True)
+
+    def echo_progress(progress: MiningProgress):
+        click.echo(
+            f"{progress.count} guesses, best {progress.best_bits} bits, "
+            f"{progress.hashrate:.0f} guesses/s",
+            err=True,
+        )
+
+    try:
+        private_key = pow_key.mine_parallel(
+            workers,
+            max_duration=timeout,
+            progress_file=progress_file,
+            on_progress=echo_progress,
+        )
+    except KeyboardInterrupt:
+        click.echo(f"Interrupted, progress saved to {progress_file}", err=True)
+        return 1
+    if pow_key.num_leading_zero_bits < difficulty:
+        click.echo(f"Stopped, progress saved to {progress_file}", err=True)
+        return 1
+
+    os.remove(progress_file)
+    click.echo(
+        json.dumps(
+            {
+                "Private key": private_key.bech32(),
+                "Public key": private_key.public_key.bech32(),
+                "Hex": private_key.public_key.hex(),
+                "Leading zero bits": pow_key.num_leading_zero_bits,
+                "Guesses": pow_key.count,
+            },
+            indent=2,
+        )
+    )
+    return 0
@@ -1,17 +1,29 @@
 import json
+import queue
 import time
 import uuid
+from pathlib import Path
 
 import click
 
 from nostr.commands.config import Config
 from nostr.event import EncryptedDirectMessage, Event, EventKind
+from nostr.event_store import EventStore
 from nostr.filter import Filter, Filters
 from nostr.key import PrivateKey, PublicKey
 from nostr.message_type import ClientMessageType
+from nostr.pow import PowEvent
 from nostr.relay_manager import RelayManager
+from nostr.sync_state import SyncState
 from nostr.utils import dict2obj
 
+WAIT_FOR_CHOICE = click.Choice(["all", "quorum", "any", "none"])
+
+# seconds between checks for EOSE while no event arrives
+EOSE_POLL_INTERVAL = 0.1
+
+SYNC_FILE = Path.home().joinpath('.nostr', 'sync.json')
+
 
 @click.group()
 @click.option("-c", "--config", required=False, type=str, help="Config file")
@@ -56,10 +68,59 @@ def cli(ctx, config: str = None):
 @click.option("-i", "--identifier", required=False, type=str)
 @click.option("-p", "--pub-key", "npub", required=False, type=str)
 @click.option("-l", "--limit", "limit", type=int, default=10)
-@click.option("-s", "--sleep", "sleep", type=int, default=2)
+@click.option("-s", "--sleep", "sleep", type=int, default=0, hidden=True)
+@click.option("-t", "--timeout", "timeout", type=float, default=10.0)
+@click.option(
+    "--stream",
+    is_flag=True,
+    help="Print events as they arrive, one JSON object per line.",
+)
+@click.option(
+    "-f",
+    "--follow",
+    is_flag=True,
+    help="Keep streaming new events after the stored ones, until interrupted.",
+)
+@click.option(
+    "--db",
+    "db",
+    type=click.Path(dir_okay=False),
+    help="SQLite database keeping received events; the events it already has "
+    "are printed first and relays are only asked for newer ones.",
+)
+@click.option(
+    "--sync",
+    is_flag=True,
+    help="Only ask each relay for events newer than those it sent on previous "
+    "runs with --sync.",
+)
+@click.option(
+    "--sync-file",
+    "sync_file",
+    type=click.Path(dir_okay=False),
+    default=str(SYNC_FILE),
+    show_default=True,
+    help="Where --sync keeps the newest event received per relay and filter.",
+)
 @click.pass_context
-def receive(ctx: dict, identifier: str, npub: str, limit: int = 10, sleep: int = 2):
-    """Receives messages from npub address."""
+def receive(
+    ctx: dict,
+    identifier: str,
+    npub: str,
+    limit: int = 10,
+    sleep: int = 0,
+    timeout: float = 10.0,
+    stream: bool = False,
+    follow: bool = False,
+    db: str = None,
+    sync: bool = False,
+    sync_file: str = str(SYNC_FILE),
+):
+    """Receives messages from npub address.
+
+    Stops once every relay has sent all its stored events (EOSE), or after
+    `timeout` seconds.
+    """
     npubs = [npub] if npub else []
     if identifier:
         for influencer in ctx.obj.get('influencers', []):
@@ -80,22 +141,25 @@ def receive(ctx: dict, identifier: str, npub: str, limit: int = 10, sleep: int =
     filters = Filters(
         [Filter(authors=authors, kinds=[EventKind.TEXT_NOTE], limit=limit)]
     )
+    store = EventStore(db) if db else None
+    stored = []
+    if store is not None:
+        stored = store.query(filters)
+        newest = store.newest_created_at(filters)
+        if newest is not None:
+            # inclusive, events of the same second may not all be stored
+            for filter in filters:
+                filter.since = newest
     subscription_id = uuid.uuid1().hex
     request = [ClientMessageType.REQUEST, subscription_id]
     request.extend(filters.to_json_array())
 
-    relay_manager = RelayManager()
+    sync_state = SyncState.load(sync_file) if sync else None
+    relay_manager = RelayManager(connect_timeout=timeout, sync_state=sync_state)
     for relay in ctx.obj['relays']:
         relay_manager.add_relay(relay)
     relay_manager.add_subscription(subscription_id, filters)
 
-    def get_events(relay_manager):
-        events = []
-        while relay_manager.message_pool.has_events():
-            event_msg = relay_manager.message_pool.get_event()
-            events.append(event_msg.event.content)
-        return events
-
     def get_notices(relay_manager):
         notices = []
         while relay_manager.message_pool.has_notices():
@@ -103,28 +167,102 @@ def receive(ctx: dict, identifier: str, npub: str, limit: int = 10, sleep: int =
             notices.append(notice_msg.content)
         return notices
 
+    stream = stream or follow
     with relay_manager:
-        time.sleep(sleep)  # allow the connections to open
         message = json.dumps(request)
         relay_manager.publish_message(message)
-        time.sleep(sleep)  # allow the messages to send
 
-        events = get_events(relay_manager=relay_manager)
+        events = []
+        seen = set()
+
+        def output(event: Event):
+            if event.id in seen:
+                return
+            seen.add(event.id)
+            if stream:
+                click.echo(json.dumps(event.to_dict()))
+            else:
+                events.append(event.content)
+
+        for event in stored:
+            output(event)
+        try:
+            for event_msg in _receive_events(relay_manager, timeout, follow):
+                if store is not None:
+                    store.add_event(event_msg.event)
+                output(event_msg.event)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if store is not None:
+                store.close()
+
         notices = get_notices(relay_manager=relay_manager)
-        click.echo(
-            json.dumps(
-                {"Public key(s)": npubs, "Events": events, "Notices": notices}, indent=2
+        if stream:
+            for notice in notices:
+                click.echo(f"NOTICE: {notice}", err=True)
+        else:
+            click.echo(
+                json.dumps(
+                    {"Public key(s)": npubs, "Events": events, "Notices": notices},
+                    indent=2,
+                )
             )
-        )
     return 0
 
 
+def _receive_events(relay_manager: RelayManager, timeout: float, follow: bool):
+    """Yield inbound events as they arrive, until every connected relay sent EOSE
+    or `timeout` seconds passed; with `follow`, keep yielding new ones."""
+    message_pool = relay_manager.message_pool
+    statuses = relay_manager.connection_statuses
+    waiting = {url for url, connected in statuses.items() if connected}
+    deadline = time.monotonic() + timeout
+    while follow or (waiting and time.monotonic() < deadline):
+        try:
+            yield message_pool.get_event(timeout=EOSE_POLL_INTERVAL)
+        except queue.Empty:
+            pass
+        while message_pool.has_eose_notices():
+            waiting.discard(message_pool.get_eose_notice().url)
+
+    # a relay's stored events are queued before its EOSE
+    while message_pool.has_events():
+        yield message_pool.get_event()
+
+
 @cli.command()
 @click.option("-s", "--sec-key", "nsec", required=False, type=str)
 @click.option("-m", "--message", "message", type=str)
-@click.option("--sleep", "sleep", type=int, default=2)
+@click.option("--sleep", "sleep", type=int, default=0, hidden=True)
+@click.option("-t", "--timeout", "timeout", type=float, default=10.0)
+@click.option("-w", "--wait-for", "wait_for", type=WAIT_FOR_CHOICE, default="any")
+@click.option(
+    "-d",
+    "--difficulty",
+    "difficulty",
+    type=int,
+    default=0,
+    help="Mine a NIP-13 proof of work with this many leading zero bits.",
+)
+@click.option(
+    "--workers",
+    "workers",
+    type=int,
+    default=0,
+    help="Processes mining the proof of work, one per CPU by default.",
+)
 @click.pass_context
-def publish(ctx: dict, nsec: str, message: str, sleep: int = 2):
+def publish(
+    ctx: dict,
+    nsec: str,
+    message: str,
+    sleep: int = 0,
+    timeout: float = 10.0,
+    wait_for: str = "any",
+    difficulty: int = 0,
+    workers: int = 0,
+):
     """Sends a message."""
     if not nsec and ctx.obj.get('self'):
         try:
@@ -140,19 +278,25 @@ def publish(ctx: dict, nsec: str, message: str, sleep: int = 2):
         return 1
     private_key = PrivateKey.from_nsec(nsec)
     event = Event(content=message, public_key=private_key.public_key.hex())
+    if difficulty:
+        pow_event = PowEvent(difficulty, event)
+        event = pow_event.mine_parallel(workers)
+        click.echo(
+            f"Mined {pow_event.num_leading_zero_bits} leading zero bits "
+            f"in {pow_event.count} guesses, {pow_event.get_hashrate():.0f} guesses/s",
+            err=True,
+        )
     event.sign(private_key.hex())
 
-    msg = json.dumps([ClientMessageType.EVENT, event.to_dict()])
-
-    relay_manager = RelayManager()
+    relay_manager = RelayManager(connect_timeout=timeout)
     for relay in ctx.obj['relays']:
         relay_manager.add_relay(relay)
     with relay_manager:
-        time.sleep(sleep)  # allow the connections to open
-        relay_manager.publish_message(msg)
+        result = relay_manager.publish_event(
+            event, wait_for=_wait_for(wait_for), timeout=timeout
+        )
 
-    click.echo(json.dumps({"Message": message}, indent=2))
-    return 0
+    return _echo_published(message, result)
 
 
 @cli.command()
@@ -160,7 +304,9 @@ def publish(ctx: dict, nsec: str, message: str, sleep: int = 2):
 @click.option("-m", "--message", "message", type=str)
 @click.option("-i", "--identifier", required=False, type=str)
 @click.option("-p", "--pub-key", "receiver_npub", required=False, type=str)
-@click.option("--sleep", "sleep", type=int, default=2)
+@click.option("--sleep", "sleep", type=int, default=0, hidden=True)
+@click.option("-t", "--timeout", "timeout", type=float, default=10.0)
+@click.option("-w", "--wait-for", "wait_for", type=WAIT_FOR_CHOICE, default="any")
 @click.pass_context
 def send(
     ctx: dict,
@@ -168,7 +314,9 @@ def send(
     message: str,
     identifier: str,
     receiver_npub: str,
-    sleep: int = 2,
+    sleep: int = 0,
+    timeout: float = 10.0,
+    wait_for: str = "any",
 ):
     """Sends a encryped direct message."""
     if not nsec and ctx.obj.get('self'):
@@ -213,13 +361,25 @@ def send(
     )
     direct_message.sign(private_key.hex())
 
-    relay_manager = RelayManager()
+    relay_manager = RelayManager(connect_timeout=timeout)
     for relay in ctx.obj['relays']:
         relay_manager.add_relay(relay)
 
     with relay_manager:
-        time.sleep(sleep)  # allow the connections to open
-        relay_manager.publish_event(direct_message)
+        result = relay_manager.publish_event(
+            direct_message, wait_for=_wait_for(wait_for), timeout=timeout
+        )
 
-    click.echo(json.dumps({"Message": message}, indent=2))
-    return 0
+    return _echo_published(message, result)
+
+
+def _wait_for(wait_for: str):
+    return None if wait_for == "none" else wait_for
+
+
+def _echo_published(message: str, result) -> int:
+    output = {"Message": message}
+    if result is not None:
+        output["Relays"] = result.to_json_object()
+    click.echo(json.dumps(output, indent=2))
+    return 0 if result is None or result.ok else 1
@@ -1,12 +1,16 @@
-import json
+import os
 import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass, field
 from enum import IntEnum
 from hashlib import sha256
-from typing import List, Optional
+from typing import Iterable, List, Optional, Tuple
 
+from . import codec
+from .cache import VerifiedEventCache
 from .key import PrivateKey, PublicKey
 from .message_type import ClientMessageType
+from .utils import add_slots
 
 
 class EventKind(IntEnum):
@@ -26,6 +30,12 @@ class EventKind(IntEnum):
     RELAY_LIST_METADATA = 10002
 
 
+# Attributes that feed into the event id; assigning any of them drops the
+# memoized id and verification result.
+_ID_FIELDS = frozenset({"content", "public_key", "created_at", "kind", "tags"})
+
+
+@add_slots
 @dataclass
 class Event:
     """Event class.
@@ -36,6 +46,10 @@ class Event:
     :param kind: event kind
     :param tags: list of list of strings
     :param signature: signature, will be created after signing with a private key
+
+    The id is computed lazily and memoized. Assigning any attribute that is part
+    of the id invalidates it; in-place mutation of ``tags`` (other than through
+    ``add_pubkey_ref``/``add_event_ref``) must be followed by ``clear_cache()``.
     """
 
     content: Optional[str] = None
@@ -44,6 +58,10 @@ class Event:
     kind: Optional[int] = EventKind.TEXT_NOTE
     tags: List[List[str]] = field(default_factory=list)
     signature: Optional[str] = None
+    _id: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+    _verified: Optional[bool] = field(
+        default=None, init=False, repr=False, compare=False
+    )
 
     def __post_init__(self) -> None:
         if self.content and not isinstance(self.content, str):
@@ -61,13 +79,26 @@ class Event:
         if self.created_at is None:
             self.created_at = int(time.time())
 
+    def __setattr__(self, name, value) -> None:
+        if name in _ID_FIELDS:
+            object.__setattr__(self, "_id", None)
+            object.__setattr__(self, "_verified", None)
+        elif name == "signature":
+            object.__setattr__(self, "_verified", None)
+        object.__setattr__(self, name, value)
+
+    def clear_cache(self) -> None:
+        """Drop the memoized id and verification result, e.g. after mutating
+        `tags` in place."""
+        object.__setattr__(self, "_id", None)
+        object.__setattr__(self, "_verified", None)
+
     @staticmethod
     def serialize(
         public_key: str, created_at: int, kind: int, tags: List[List[str]], content: str
     ) -> bytes:
         data = [0, public_key, created_at, kind, tags, content]
-        data_str = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
-        return data_str.encode()
+        return codec.canonical_dumps(data)
 
     @staticmethod
     def compute_id(
@@ -79,10 +110,16 @@ class Event:
 
     @property
     def id(self) -> str:
-        # Always recompute the id to reflect the up-to-date state of the Event
-        return Event.compute_id(
-            self.public_key, self.created_at, self.kind, self.tags, self.content
-        )
+        # Computed once and reused until one of the id fields changes
+        if self._id is None:
+            object.__setattr__(
+                self,
+                "_id",
+                Event.compute_id(
+                    self.public_key, self.created_at, self.kind, self.tags, self.content
+                ),
+            )
+        return self._id
 
     def encrypt_dm(
         self, private_key_hex: str, cleartext_content: str, recipient_pubkey: str
@@ -113,6 +150,7 @@ class Event:
     def add_pubkey_ref(self, pubkey: str):
         """Adds a reference to a pubkey as a 'p' tag."""
         self.tags.append(["p", pubkey])
+        self.clear_cache()
 
     def has_pubkey_ref(self, pubkey: str) -> bool:
         """Check if a `p` tag to the given pubkey exists."""
@@ -124,6 +162,7 @@ class Event:
     def add_event_ref(self, event_id: str):
         """Adds a reference to an event_id as an 'e' tag."""
         self.tags.append(["e", event_id])
+        self.clear_cache()
 
     def has_event_ref(self, event_id: str):
         """Check if a `e` tag to the given event_id exists."""
@@ -165,8 +204,14 @@ class Event:
         return count
 
     def verify(self) -> bool:
-        pub_key = PublicKey.from_hex(self.public_key)
-        return pub_key.verify(bytes.fromhex(self.signature), bytes.fromhex(self.id))
+        """Check the signature against the id; the result is memoized."""
+        if self._verified is None:
+            pub_key = PublicKey.from_hex(self.public_key)
+            verified = pub_key.verify(
+                bytes.fromhex(self.signature), bytes.fromhex(self.id)
+            )
+            object.__setattr__(self, "_verified", verified)
+        return self._verified
 
     def to_dict(self) -> dict:
         return {
@@ -180,8 +225,21 @@ class Event:
         }
 
     @classmethod
-    def from_dict(cls, msg: dict) -> "Event":
-        return Event(
+    def from_dict(
+        cls,
+        msg: dict,
+        verify: bool = False,
+        verified_cache: Optional[VerifiedEventCache] = None,
+    ) -> "Event":
+        """Build an Event from its NIP-01 dict form.
+
+        :param verify: inbound mode; check the supplied `id` against the event
+            hash and the signature against the id, once. The outcome is kept so
+            later `verify()` calls return it without recomputing.
+        :param verified_cache: in inbound mode, skip the signature check for
+            (id, signature) pairs already in the cache and add newly verified ones
+        """
+        event = Event(
             content=msg["content"],
             public_key=msg["pubkey"],
             created_at=msg["created_at"],
@@ -189,9 +247,19 @@ class Event:
             tags=msg["tags"],
             signature=msg["sig"],
         )
+        if verify:
+            if "id" in msg and msg["id"] != event.id:
+                object.__setattr__(event, "_verified", False)
+            elif verified_cache is None:
+                event.verify()
+            elif verified_cache.contains(event.id, event.signature):
+                object.__setattr__(event, "_verified", True)
+            elif event.verify():
+                verified_cache.add(event.id, event.signature)
+        return event
 
     def to_message(self) -> str:
-        return json.dumps([ClientMessageType.EVENT, self.to_dict()])
+        return codec.dumps([ClientMessageType.EVENT, self.to_dict()])
 
     def __repr__(self):
         note_id = self.bech32()
@@ -201,6 +269,7 @@ class Event:
         return self.to_message()
 
 
+@add_slots
 @dataclass
 class EncryptedDirectMessage(Event):
     recipient_pubkey: str = None
@@ -216,7 +285,7 @@ class EncryptedDirectMessage(Event):
             raise Exception("Must specify a recipient_pubkey.")
 
         self.kind = EventKind.ENCRYPTED_DIRECT_MESSAGE
-        super().__post_init__()
+        Event.__post_init__(self)
 
         # Must specify the DM recipient's pubkey in a 'p' tag
         self.add_pubkey_ref(self.recipient_pubkey)
@@ -232,4 +301,73 @@ class EncryptedDirectMessage(Event):
                 "EncryptedDirectMessage `id` is undefined \
                 until its message is encrypted and stored in the `content` field"
             )
-        return super().id
+        return Event.id.fget(self)
+
+
+def _verify_serialized(
+    args: Tuple[str, int, int, List[List[str]], str, str]
+) -> Tuple[str, bool]:
+    """Hash and verify one event given as plain values; runs in worker processes."""
+    public_key, created_at, kind, tags, content, signature = args
+    event_id = Event.compute_id(public_key, created_at, kind, tags, content)
+    pub_key = PublicKey.from_hex(public_key)
+    return event_id, pub_key.verify(bytes.fromhex(signature), bytes.fromhex(event_id))
+
+
+def _verify_chunk(events: List[Event]) -> None:
+    for event in events:
+        event.verify()
+
+
+def verify_many(
+    events: Iterable[Event],
+    workers: int = 0,
+    processes: bool = False,
+    executor: Optional[Executor] = None,
+) -> List[bool]:
+    """Verify the signatures of a batch of events in parallel.
+
+    :param events: events to verify
+    :param workers: size of the worker pool; 0 or 1 verifies sequentially.
+        With an `executor`, the number of chunks the batch is split into,
+        the number of CPUs by default
+    :param processes: use a process pool instead of threads. Threads already
+        scale since coincurve releases the GIL while verifying.
+    :param executor: an existing executor to run on instead of a new pool
+    :return: one bool per event, in order. Results are memoized on each Event
+        like `Event.verify()`.
+    """
+    events = list(events)
+    pending = [event for event in events if event._verified is None]
+    n_chunks = workers or os.cpu_count() or 1
+
+    if executor is None and workers <= 1:
+        for event in pending:
+            event.verify()
+    elif processes or isinstance(executor, ProcessPoolExecutor):
+        args = [
+            (e.public_key, e.created_at, e.kind, e.tags, e.content, e.signature)
+            for e in pending
+        ]
+        pool = executor or ProcessPoolExecutor(max_workers=workers)
+        try:
+            chunksize = max(1, len(args) // (4 * n_chunks))
+            results = pool.map(_verify_serialized, args, chunksize=chunksize)
+            for event, (event_id, verified) in zip(pending, results):
+                object.__setattr__(event, "_id", event_id)
+                object.__setattr__(event, "_verified", verified)
+        finally:
+            if executor is None:
+                pool.shutdown()
+    else:
+        pool = executor or ThreadPoolExecutor(max_workers=workers)
+        try:
+            for _ in pool.map(
+                _verify_chunk, [pending[i::n_chunks] for i in range(n_chunks)]
+            ):
+                pass
+        finally:
+            if executor is None:
+                pool.shutdown()
+
+    return [event._verified for event in events]
@@ -0,0 +1,484 @@
+"""Append-only event log in binary segment files.
+
+Each record is a fixed header (payload length, CRC-32 of the payload, created_at
+and raw event id) followed by the event's JSON. Records are appended to the
+newest segment until it reaches `segment_size`, then a new segment is started
+and the finished one gets an index file of (id, created_at, offset) entries, so
+that opening the log reads the indexes and the headers of the last segment only.
+
+Reads go through read-only memory maps: headers are decoded in place and only
+the payloads of the requested events are copied out.
+"""
+import mmap
+import os
+import struct
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from . import codec
+from .event import Event
+from .message_pool import EventMessage, MessagePool
+
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
+
+_HEADER = struct.Struct("<IIQ32s")
+_INDEX_ENTRY = struct.Struct("<32sQQ")
+_SEGMENT_SUFFIX = ".log"
+_INDEX_SUFFIX = ".idx"
+
+
+@dataclass
+class Segment:
+    number: int
+    path: Path
+    size: int = 0
+    count: int = 0
+    since: Optional[int] = None
+    until: Optional[int] = None
+
+    def add(self, created_at: int, length: int) -> None:
+        self.size += _HEADER.size + length
+        self.count += 1
+        if self.since is None or created_at < self.since:
+            self.since = created_at
+        if self.until is None or created_at > self.until:
+            self.until = created_at
+
+    def overlaps(self, since: Optional[int], until: Optional[int]) -> bool:
+        if self.count == 0:
+            return False
+        if since is not None and self.until < since:
+            return False
+        if until is not None and self.since > until:
+            return False
+        return True
+
+    @property
+    def index_path(self) -> Path:
+        return self.path.with_suffix(_INDEX_SUFFIX)
+
+
+class EventLog:
+    """Events appended to segment files in `directory`, indexed by id.
+
+    Each event is logged once; appending an id already in the log does nothing.
+    The log can be shared between threads, e.g. fed by the receiving threads of
+    relays through `attach`.
+
+    :param directory: where segments are kept, created if needed
+    :param segment_size: size in bytes from which a new segment is started
+    """
+
+    def __init__(
+        self, directory: str, segment_size: int = DEFAULT_SEGMENT_SIZE
+    ) -> None:
+        self.directory = Path(directory)
+        self.segment_size = segment_size
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = Lock()
+        self._compact_lock = Lock()
+        self._listeners: Dict[Tuple[MessagePool, Optional[str]], Callable] = {}
+        self._index: Dict[bytes, Tuple[int, int]] = {}
+        self._segments: List[Segment] = []
+        self._active_entries: List[bytes] = []
+        self._maps: Dict[int, mmap.mmap] = {}
+        self._active: Optional[Segment] = None
+
+        # left behind by a compaction that did not finish
+        for path in self.directory.glob("*.tmp"):
+            path.unlink()
+        numbers = sorted(
+            int(path.stem) for path in self.directory.glob("*" + _SEGMENT_SUFFIX)
+        )
+        for number in numbers[:-1]:
+            self._load_sealed(self._segment(number))
+        self._active = self._segment(numbers[-1] if numbers else 0)
+        self._recover_active()
+        self._writer = open(self._active.path, "ab")
+
+    @property
+    def segments(self) -> List[Segment]:
+        return list(self._segments) + [self._active]
+
+    def append(self, event: Event) -> bool:
+        """Log an event; returns False if it was already logged."""
+        return self.append_many([event]) == 1
+
+    def append_many(self, events) -> int:
+        """Log events; returns how many were new."""
+        added = 0
+        with self._lock:
+            for event in events:
+                event_id = bytes.fromhex(event.id)
+                if event_id in self._index:
+                    continue
+                payload = codec.dumps(event.to_dict()).encode()
+                self._write(event_id, event.created_at, payload)
+                added += 1
+            self._writer.flush()
+        return added
+
+    def _write(self, event_id: bytes, created_at: int, payload: bytes) -> None:
+        record_size = _HEADER.size + len(payload)
+        if self._active.size and self._active.size + record_size > self.segment_size:
+            self._rotate()
+        offset = self._active.size
+        header = _HEADER.pack(len(payload), zlib.crc32(payload), created_at, event_id)
+        self._writer.write(header + payload)
+        self._active.add(created_at, len(payload))
+        self._index[event_id] = (self._active.number, offset)
+        self._active_entries.append(_INDEX_ENTRY.pack(event_id, created_at, offset))
+
+    def _rotate(self) -> None:
+        self._writer.flush()
+        os.fsync(self._writer.fileno())
+        self._writer.close()
+        with open(self._active.index_path, "wb") as file:
+            file.write(b"".join(self._active_entries))
+        self._drop_map(self._active.number)
+        self._segments.append(self._active)
+        self._active = self._segment(self._active.number + 1)
+        self._active_entries = []
+        self._writer = open(self._active.path, "ab")
+
+    def attach(
+        self, message_pool: MessagePool, subscription_id: Optional[str] = None
+    ) -> None:
+        """Log the events `message_pool` receives for `subscription_id`, or for
+        every subscription if None, as a message listener: consumers of the
+        pool keep receiving them."""
+        key = (message_pool, subscription_id)
+        if key in self._listeners:
+            return
+
+        def listener(message) -> None:
+            if isinstance(message, EventMessage) and subscription_id in (
+                None,
+                message.subscription_id,
+            ):
+                self.append_event_message(message)
+
+        self._listeners[key] = listener
+        message_pool.add_message_listener(listener)
+
+    def detach(
+        self, message_pool: MessagePool, subscription_id: Optional[str] = None
+    ) -> None:
+        listener = self._listeners.pop((message_pool, subscription_id), None)
+        if listener is not None:
+            message_pool.remove_message_listener(listener)
+
+    def append_event_message(self, event_message: EventMessage) -> None:
+        self.append(event_message.event)
+
+    def get_raw(self, event_id: str) -> Optional[bytes]:
+        """The JSON of a logged event, or None."""
+        with self._lock:
+            location = self._index.get(bytes.fromhex(event_id))
+            if location is None:
+                return None
+            number, offset = location
+            data = self._map(number)
+            length = _HEADER.unpack_from(data, offset)[0]
+            start = offset + _HEADER.size
+            return data[start : start + length]
+
+    def get(self, event_id: str) -> Optional[Event]:
+        raw = self.get_raw(event_id)
+        return None if raw is None else _to_event(raw)
+
+    def between(
+        self, since: Optional[int] = None, until: Optional[int] = None
+    ) -> Iterator[Event]:
+        """Yield the events with `since` <= created_at <= `until`, in log order.
+        Segments entirely outside the range are skipped."""
+        for raw in self.iter_raw(since, until):
+            yield _to_event(raw)
+
+    def iter_raw(
+        self, since: Optional[int] = None, until: Optional[int] = None
+    ) -> Iterator[bytes]:
+        """Same as `between`, yielding the events' JSON."""
+        with self._lock:
+            # a consistent snapshot, even if events are appended or the log is
+            # compacted meanwhile
+            maps = [
+                (self._map(segment.number), segment.size)
+                for segment in self.segments
+                if segment.overlaps(since, until)
+            ]
+        for data, end in maps:
+            offset = 0
+            while offset < end:
+                length, _, created_at, _ = _HEADER.unpack_from(data, offset)
+                start = offset + _HEADER.size
+                offset = start + length
+                if since is not None and created_at < since:
+                    continue
+                if until is not None and created_at > until:
+                    continue
+                yield data[start:offset]
+
+    def compact(
+        self,
+        before: Optional[int] = None,
+        keep: Optional[Callable[[Event], bool]] = None,
+    ) -> int:
+        """Rewrite the finished segments without the events created before
+        `before` or rejected by `keep`, packing the remaining ones into as few
+        segments as possible. The segment being appended to is left as is.
+
+        Segments are copied one record at a time into new files while events
+        keep being appended and read; the log is only locked to swap the new
+        files and their index entries in.
+
+        :return: the number of events removed
+        """
+        with self._compact_lock:
+            with self._lock:
+                sealed = list(self._segments)
+            if not sealed:
+                return 0
+            writer = _CompactedWriter(self, sealed[0].number)
+            removed = []
+            try:
+                for segment in sealed:
+                    removed += self._copy_kept(segment, writer, before, keep)
+                compacted, locations = writer.finish()
+            except BaseException:
+                writer.discard()
+                raise
+            if not removed:
+                writer.discard()
+                return 0
+            with self._lock:
+                self._swap(sealed, compacted)
+                for event_id in removed:
+                    del self._index[event_id]
+                self._index.update(locations)
+                self._segments[: len(sealed)] = compacted
+            return len(removed)
+
+    @staticmethod
+    def _copy_kept(
+        segment: Segment,
+        writer: "_CompactedWriter",
+        before: Optional[int],
+        keep: Optional[Callable[[Event], bool]],
+    ) -> List[bytes]:
+        """Copy the records of a sealed segment that are kept; return the ids
+        of the others."""
+        removed = []
+        if segment.size == 0:
+            return removed
+        with open(segment.path, "rb") as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            offset = 0
+            while offset < segment.size:
+                header = data[offset : offset + _HEADER.size]
+                length, _, created_at, event_id = _HEADER.unpack(header)
+                start = offset + _HEADER.size
+                offset = start + length
+                payload = data[start:offset]
+                if (before is not None and created_at < before) or (
+                    keep is not None and not keep(_to_event(payload))
+                ):
+                    removed.append(event_id)
+                    continue
+                writer.write(event_id, created_at, header, payload)
+        finally:
+            data.close()
+        return removed
+
+    def _swap(self, sealed: List[Segment], compacted: List[Segment]) -> None:
+        """Move the compacted segments in place of the old ones, one file at a
+        time. A segment without an index is rescanned on open, so a crash part
+        way leaves each segment consistent and at worst some events logged
+        twice, never lost. The caller holds `self._lock`."""
+        for segment in sealed:
+            self._drop_map(segment.number)
+        for segment in compacted:
+            if segment.index_path.exists():
+                segment.index_path.unlink()
+            os.replace(str(segment.path) + ".tmp", segment.path)
+            os.replace(str(segment.index_path) + ".tmp", segment.index_path)
+        used = {segment.number for segment in compacted}
+        for segment in sealed:
+            if segment.number not in used:
+                segment.path.unlink()
+                if segment.index_path.exists():
+                    segment.index_path.unlink()
+
+    def sync(self) -> None:
+        """Flush appended events to disk."""
+        with self._lock:
+            self._writer.flush()
+            os.fsync(self._writer.fileno())
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, event_id: str) -> bool:
+        return bytes.fromhex(event_id) in self._index
+
+    def close(self) -> None:
+        with self._lock:
+            for data in self._maps.values():
+                data.close()
+            self._maps.clear()
+            self._writer.close()
+
+    def __enter__(self) -> "EventLog":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def __repr__(self):
+        return f"EventLog({self.directory}: {len(self)} events)"
+
+    def _segment(self, number: int) -> Segment:
+        return Segment(number, self.directory / f"{number:010d}{_SEGMENT_SUFFIX}")
+
+    def _load_sealed(self, segment: Segment) -> None:
+        if not segment.index_path.exists():
+            self._scan(segment)
+        else:
+            with open(segment.index_path, "rb") as file:
+                entries = file.read()
+            times = []
+            number = segment.number
+            for event_id, created_at, offset in _INDEX_ENTRY.iter_unpack(entries):
+                self._index[event_id] = (number, offset)
+                times.append(created_at)
+            segment.size = segment.path.stat().st_size
+            segment.count = len(times)
+            if times:
+                segment.since = min(times)
+                segment.until = max(times)
+        self._segments.append(segment)
+
+    def _recover_active(self) -> None:
+        """Index the last segment and cut off a record left incomplete by a
+        crash."""
+        if not self._active.path.exists():
+            return
+        valid = self._scan(self._active, check=True)
+        if valid < self._active.path.stat().st_size:
+            os.truncate(self._active.path, valid)
+
+    def _scan(self, segment: Segment, check: bool = False) -> int:
+        """Index a segment from its record headers; return the size of its valid
+        records."""
+        size = segment.path.stat().st_size
+        if size == 0:
+            return 0
+        with open(segment.path, "rb") as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        offset = 0
+        try:
+            while offset + _HEADER.size <= size:
+                length, crc, created_at, event_id = _HEADER.unpack_from(data, offset)
+                start = offset + _HEADER.size
+                if start + length > size:
+                    break
+                if check and zlib.crc32(data[start : start + length]) != crc:
+                    break
+                segment.add(created_at, length)
+                self._index[event_id] = (segment.number, offset)
+                if segment is self._active:
+                    self._active_entries.append(
+                        _INDEX_ENTRY.pack(event_id, created_at, offset)
+                    )
+                offset = start + length
+        finally:
+            data.close()
+        return offset
+
+    def _map(self, number: int) -> mmap.mmap:
+        """A read-only map of a segment, remapped for the active segment when it
+        grew since. Maps replaced or dropped are left to be closed once no reader
+        holds them."""
+        data = self._maps.get(number)
+        active = self._active
+        size = active.size if active is not None and number == active.number else None
+        if data is not None and (size is None or len(data) >= size):
+            return data
+        path = self._segment(number).path
+        with open(path, "rb") as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps[number] = data
+        return data
+
+    def _drop_map(self, number: int) -> None:
+        self._maps.pop(number, None)
+
+
+class _CompactedWriter:
+    """Writes the records kept by a compaction to `.tmp` segment files numbered
+    from `first_number`, collecting their index entries."""
+
+    def __init__(self, log: EventLog, first_number: int) -> None:
+        self.log = log
+        self.first_number = first_number
+        self.segments: List[Segment] = []
+        self.locations: Dict[bytes, Tuple[int, int]] = {}
+        self._entries: List[bytes] = []
+        self._file = None
+
+    def write(
+        self, event_id: bytes, created_at: int, header: bytes, payload: bytes
+    ) -> None:
+        segment = self.segments[-1] if self.segments else None
+        record_size = len(header) + len(payload)
+        if segment is None or (
+            segment.size and segment.size + record_size > self.log.segment_size
+        ):
+            self._close()
+            segment = self.log._segment(self.first_number + len(self.segments))
+            self.segments.append(segment)
+            self._file = open(str(segment.path) + ".tmp", "wb")
+        offset = segment.size
+        self._file.write(header)
+        self._file.write(payload)
+        segment.add(created_at, len(payload))
+        self._entries.append(_INDEX_ENTRY.pack(event_id, created_at, offset))
+        self.locations[event_id] = (segment.number, offset)
+
+    def _close(self) -> None:
+        if self._file is None:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        index_path = str(self.segments[-1].index_path) + ".tmp"
+        with open(index_path, "wb") as file:
+            file.write(b"".join(self._entries))
+        self._entries = []
+
+    def finish(self) -> Tuple[List[Segment], Dict[bytes, Tuple[int, int]]]:
+        self._close()
+        return self.segments, self.locations
+
+    def discard(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        for segment in self.segments:
+            for path in (segment.path, segment.index_path):
+                temporary = Path(str(path) + ".tmp")
+                if temporary.exists():
+                    temporary.unlink()
+
+
+def _to_event(raw: bytes) -> Event:
+    message = codec.loads(raw)
+    event = Event.from_dict(message)
+    # the id was computed from these fields when the event was logged
+    object.__setattr__(event, "_id", message["id"])
+    return event
@@ -0,0 +1,246 @@
+"""Persistent event storage in SQLite.
+
+Events are stored with their tags in a separate indexed table, and NIP-01
+filters are executed as SQL queries, so that events already downloaded are
+served locally and relays are only asked for newer ones.
+"""
+import sqlite3
+from threading import Lock
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from . import codec
+from .event import Event
+from .filter import Filter, Filters
+from .message_pool import EventMessage, MessagePool
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    pubkey TEXT NOT NULL,
+    created_at INTEGER NOT NULL,
+    kind INTEGER NOT NULL,
+    tags TEXT NOT NULL,
+    content TEXT NOT NULL,
+    sig TEXT
+);
+CREATE INDEX IF NOT EXISTS events_created_at ON events (created_at);
+CREATE INDEX IF NOT EXISTS events_pubkey ON events (pubkey, created_at);
+CREATE INDEX IF NOT EXISTS events_kind ON events (kind, created_at);
+CREATE TABLE IF NOT EXISTS tags (
+    event INTEGER NOT NULL REFERENCES events (rowid) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    value TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tags_value ON tags (name, value, event);
+"""
+
+_COLUMNS = "id, pubkey, created_at, kind, tags, content, sig"
+
+
+def filter_to_sql(filter: Filter) -> Tuple[str, list]:
+    """Translate a filter to a query of the `events` table, matching the same
+    events as `Filter.matches`, newest first.
+
+    :return: the SQL statement and its parameters
+    """
+    where, params = _where(filter)
+    sql = f"SELECT {_COLUMNS} FROM events{where} ORDER BY created_at DESC"
+    if filter.limit:
+        sql += " LIMIT ?"
+        params.append(filter.limit)
+    return sql, params
+
+
+def _where(filter: Filter) -> Tuple[str, list]:
+    clauses = []
+    params = []
+
+    def add_in(column: str, values: list):
+        clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+        params.extend(values)
+
+    if filter.event_ids:
+        add_in("id", filter.event_ids)
+    if filter.kinds:
+        add_in("kind", filter.kinds)
+    if filter.authors:
+        add_in("pubkey", filter.authors)
+    if filter.since:
+        clauses.append("created_at >= ?")
+        params.append(filter.since)
+    if filter.until:
+        clauses.append("created_at <= ?")
+        params.append(filter.until)
+    for tag, values in filter.tags.items():
+        clauses.append(
+            "rowid IN (SELECT event FROM tags WHERE name = ? "
+            f"AND value IN ({', '.join('?' * len(values))}))"
+        )
+        params.append(tag.replace("#", ""))
+        params.extend(values)
+
+    if not clauses:
+        return "", params
+    return " WHERE " + " AND ".join(clauses), params
+
+
+class EventStore:
+    """Events kept in an SQLite database in WAL mode.
+
+    The store can be shared between threads, e.g. fed by the receiving threads
+    of relays through `attach`.
+
+    :param path: database file, created if needed; ":memory:" for a temporary
+        in-memory database
+    """
+
+    def __init__(self, path: str = ":memory:") -> None:
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = Lock()
+        self._listeners: Dict[Tuple[MessagePool, Optional[str]], Callable] = {}
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute("PRAGMA foreign_keys=ON")
+            self._connection.executescript(_SCHEMA)
+
+    def add_event(self, event: Event) -> bool:
+        """Store an event; returns False if it was already stored."""
+        return self.add_events([event]) == 1
+
+    def add_events(self, events: Iterable[Event]) -> int:
+        """Store events in a single transaction; returns how many were new."""
+        added = 0
+        with self._lock, self._connection:
+            cursor = self._connection.cursor()
+            for event in events:
+                cursor.execute(
+                    f"INSERT OR IGNORE INTO events ({_COLUMNS}) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        event.id,
+                        event.public_key,
+                        event.created_at,
+                        event.kind,
+                        codec.dumps(event.tags),
+                        event.content or "",
+                        event.signature,
+                    ),
+                )
+                if cursor.rowcount == 0:
+                    continue
+                added += 1
+                rowid = cursor.lastrowid
+                cursor.executemany(
+                    "INSERT INTO tags (event, name, value) VALUES (?, ?, ?)",
+                    [(rowid, tag[0], tag[1]) for tag in event.tags if len(tag) > 1],
+                )
+        return added
+
+    def add_event_message(self, event_message: EventMessage) -> None:
+        self.add_event(event_message.event)
+
+    def attach(
+        self, message_pool: MessagePool, subscription_id: Optional[str] = None
+    ) -> None:
+        """Store the events `message_pool` receives for `subscription_id`, or for
+        every subscription if None. The store listens to the pool's messages, so
+        the events are still queued or handed to event callbacks as before."""
+        key = (message_pool, subscription_id)
+        if key in self._listeners:
+            return
+
+        def listener(message) -> None:
+            if isinstance(message, EventMessage) and subscription_id in (
+                None,
+                message.subscription_id,
+            ):
+                self.add_event_message(message)
+
+        self._listeners[key] = listener
+        message_pool.add_message_listener(listener)
+
+    def detach(
+        self, message_pool: MessagePool, subscription_id: Optional[str] = None
+    ) -> None:
+        listener = self._listeners.pop((message_pool, subscription_id), None)
+        if listener is not None:
+            message_pool.remove_message_listener(listener)
+
+    def get_event(self, event_id: str) -> Optional[Event]:
+        events = self.query(Filter(event_ids=[event_id]))
+        return events[0] if events else None
+
+    def query(self, filters: Union[Filter, Filters]) -> List[Event]:
+        """The stored events matching any of `filters`, newest first; each
+        filter's `limit` applies to its own matches, as on a relay."""
+        if isinstance(filters, Filter):
+            filters = [filters]
+        events = {}
+        with self._lock:
+            for filter in filters:
+                sql, params = filter_to_sql(filter)
+                for row in self._connection.execute(sql, params):
+                    if row[0] not in events:
+                        events[row[0]] = _row_to_event(row)
+        return sorted(events.values(), key=lambda e: e.created_at, reverse=True)
+
+    def newest_created_at(
+        self, filters: Union[Filter, Filters, None] = None
+    ) -> Optional[int]:
+        """Creation time of the newest stored event matching any of `filters`,
+        or of any event; None if there is none."""
+        if filters is None:
+            filters = [Filter()]
+        elif isinstance(filters, Filter):
+            filters = [filters]
+        newest = None
+        with self._lock:
+            for filter in filters:
+                where, params = _where(filter)
+                sql = f"SELECT MAX(created_at) FROM events{where}"
+                created_at = self._connection.execute(sql, params).fetchone()[0]
+                if created_at is not None and (newest is None or created_at > newest):
+                    newest = created_at
+        return newest
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+    def __contains__(self, event_id: str) -> bool:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM events WHERE id = ?", (event_id,)
+            ).fetchone()
+        return row is not None
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self) -> "EventStore":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def __repr__(self):
+        return f"EventStore({self.path})"
+
+
+def _row_to_event(row: tuple) -> Event:
+    event_id, pubkey, created_at, kind, tags, content, sig = row
+    event = Event(
+        content=content,
+        public_key=pubkey,
+        created_at=created_at,
+        kind=kind,
+        tags=codec.loads(tags),
+        signature=sig,
+    )
+    # the id was computed from these fields when the event was stored
+    object.__setattr__(event, "_id", event_id)
+    return event
@@ -1,9 +1,82 @@
 import json
 from collections import UserList
-from typing import List
+from typing import Iterable, List
 
+from nostr import codec
 from nostr.event import Event, EventKind
 
+# Attributes that change what a Filter matches; assigning any of them drops the
+# compiled form.
+_MATCH_FIELDS = frozenset(
+    {
+        "event_ids",
+        "kinds",
+        "authors",
+        "since",
+        "until",
+        "event_refs",
+        "pubkey_refs",
+        "tags",
+    }
+)
+
+
+class CompiledFilter:
+    """Snapshot of a Filter using sets for O(1) membership checks.
+
+    Matches exactly the same Events as the Filter it was built from.
+    """
+
+    __slots__ = (
+        "event_ids",
+        "kinds",
+        "authors",
+        "since",
+        "until",
+        "requires_tags",
+        "tags",
+    )
+
+    def __init__(self, filter: "Filter") -> None:
+        self.event_ids = frozenset(filter.event_ids) if filter.event_ids else None
+        self.kinds = frozenset(filter.kinds) if filter.kinds else None
+        self.authors = frozenset(filter.authors) if filter.authors else None
+        self.since = filter.since
+        self.until = filter.until
+        self.requires_tags = bool(filter.event_refs or filter.pubkey_refs)
+        # Omit any NIP-01 or NIP-12 "#" chars on single-letter tags
+        self.tags = tuple(
+            (f_tag.replace("#", ""), frozenset(f_tag_values))
+            for f_tag, f_tag_values in filter.tags.items()
+        )
+
+    def matches(self, event: Event) -> bool:
+        if self.event_ids is not None and event.id not in self.event_ids:
+            return False
+        if self.kinds is not None and event.kind not in self.kinds:
+            return False
+        if self.authors is not None and event.public_key not in self.authors:
+            return False
+        if self.since and event.created_at < self.since:
+            return False
+        if self.until and event.created_at > self.until:
+            return False
+        if self.requires_tags and len(event.tags) == 0:
+            return False
+
+        for f_tag, f_tag_values in self.tags:
+            # Multiple values within f_tag_values are treated as OR search;
+            # an Event needs to match only one.
+            # Note: an Event could have multiple entries of the same tag type
+            # (e.g. a reply to multiple people) so we have to check all of them.
+            for e_tag in event.tags:
+                if e_tag[0] == f_tag and len(e_tag) > 1 and e_tag[1] in f_tag_values:
+                    break
+            else:
+                return False
+
+        return True
+
 
 class Filter:
     """NIP-01 filtering.
@@ -21,6 +94,10 @@ class Filter:
 
     # promoted to explicit support
     Filter(hashtag_refs=[hashtags])
+
+    `matches` runs against a compiled snapshot of the filter that is rebuilt
+    whenever one of its attributes is assigned. After mutating the value lists
+    in place, call `compile()` to refresh it.
     """
 
     def __init__(
@@ -60,71 +137,42 @@ class Filter:
         # any NIP-12 single-letter tags must be prefixed with "#"
         tag_key = tag if len(tag) > 1 else f"#{tag}"
         self.tags[tag_key] = values
+        self._compiled = None
+
+    def __setattr__(self, name, value) -> None:
+        if name in _MATCH_FIELDS:
+            object.__setattr__(self, "_compiled", None)
+        object.__setattr__(self, name, value)
+
+    def compile(self) -> CompiledFilter:
+        """Build the set-based snapshot used by `matches`."""
+        self._compiled = CompiledFilter(self)
+        return self._compiled
 
     @classmethod
-    def from_json(cls, filters):
-        if "ids" in filters:
-            ret = cls(filters["ids"])
-        else:
-            ret = cls("")
-        if "authors" in filters:
-            ret.authors = filters["authors"]
-        if "kinds" in filters:
-            ret.kinds = filters["kinds"]
-        if "#e" in filters:
-            ret.event_refs = filters["#e"]
-        if "#p" in filters:
-            ret.pubkey_refs = filters["#p"]
-        if "since" in filters:
-            ret.since = filters["since"]
-        if "until" in filters:
-            ret.until = filters["until"]
-        if "limit" in filters:
-            ret.limit = filters["limit"]
-        cls.tags = {}
-        if cls.event_refs:
-            cls.add_arbitrary_tag("e", cls.event_refs)
-        if cls.pubkey_refs:
-            cls.add_arbitrary_tag("p", cls.pubkey_refs)
+    def from_json(cls, filters: dict) -> "Filter":
+        """Build a Filter from its NIP-01 JSON object, as `to_json_object`
+        produces."""
+        ret = cls(
+            event_ids=filters.get("ids"),
+            kinds=filters.get("kinds"),
+            authors=filters.get("authors"),
+            since=filters.get("since"),
+            until=filters.get("until"),
+            event_refs=filters.get("#e"),
+            pubkey_refs=filters.get("#p"),
+            limit=filters.get("limit"),
+        )
+        for key, values in filters.items():
+            if key.startswith("#") and key not in ("#e", "#p"):
+                ret.add_arbitrary_tag(key[1:], values)
         return ret
 
     def matches(self, event: Event) -> bool:
-        if self.event_ids and event.id not in self.event_ids:
-            return False
-        if self.kinds and event.kind not in self.kinds:
-            return False
-        if self.authors and event.public_key not in self.authors:
-            return False
-        if self.since and event.created_at < self.since:
-            return False
-        if self.until and event.created_at > self.until:
-            return False
-        if (self.event_refs or self.pubkey_refs) and len(event.tags) == 0:
-            return False
-
-        if self.tags:
-            e_tag_identifiers = {e_tag[0] for e_tag in event.tags}
-            for f_tag, f_tag_values in self.tags.items():
-                # Omit any NIP-01 or NIP-12 "#" chars on single-letter tags
-                f_tag = f_tag.replace("#", "")
-
-                if f_tag not in e_tag_identifiers:
-                    # Event is missing a tag type that we're looking for
-                    return False
-
-                # Multiple values within f_tag_values are treated as OR search;
-                # an Event needs to match only one.
-                # Note: an Event could have multiple entries of the same tag type
-                # (e.g. a reply to multiple people) so we have to check all of them.
-                match_found = False
-                for e_tag in event.tags:
-                    if e_tag[0] == f_tag and e_tag[1] in f_tag_values:
-                        match_found = True
-                        break
-                if not match_found:
-                    return False
-
-        return True
+        compiled = self._compiled
+        if compiled is None:
+            compiled = self.compile()
+        return compiled.matches(event)
 
     def to_json_object(self) -> dict:
         res = {}
@@ -145,11 +193,24 @@ class Filter:
 
         return res
 
+    def canonical_json(self, excluded: Iterable[str] = ()) -> str:
+        """The filter's JSON object without the `excluded` keys, with sorted keys
+        and list values, so that filters selecting the same events give the same
+        string."""
+        selection = {
+            key: sorted(str(value) for value in values)
+            if isinstance(values, list)
+            else values
+            for key, values in self.to_json_object().items()
+            if key not in excluded
+        }
+        return json.dumps(selection, sort_keys=True, separators=(",", ":"))
+
     def __repr__(self):
         return f"Filters({self.to_json_object()})"
 
     def __str__(self):
-        return json.dumps(self.to_json_object())
+        return codec.dumps(self.to_json_object())
 
 
 class Filters(UserList):
@@ -171,4 +232,4 @@ class Filters(UserList):
         return f"FilterList({self.to_json_array()})"
 
     def __str__(self):
-        return json.dumps(self.to_json_array())
+        return codec.dumps(self.to_json_array())
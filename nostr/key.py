@@ -1,6 +1,7 @@
 import binascii
 import secrets
 from base64 import b64decode, b64encode
+from functools import lru_cache
 from hashlib import sha256
 from typing import Optional
 
@@ -11,6 +12,7 @@ from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 
 from . import bech32
 from .delegation import Delegation
+from .vanity import SEARCH_BATCH, VanityMiner, VanityPattern, random_secret
 
 # from .event import EncryptedDirectMessage, Event, EventKind
 
@@ -46,8 +48,7 @@ class PublicKey:
         return pk.schnorr_verify(bytes.fromhex(hash), bytes.fromhex(sig), None, True)
 
     def verify(self, sig: bytes, message: bytes) -> bool:
-        pk = secp256k1.PublicKeyXOnly(self.raw_bytes)
-        return pk.verify(sig, message)
+        return _xonly_public_key(self.raw_bytes).verify(sig, message)
 
     @classmethod
     def from_hex(cls, hex: str) -> "PublicKey":
@@ -61,6 +62,12 @@ class PublicKey:
         return cls(bytes(raw_public_key))
 
 
+@lru_cache(maxsize=4096)
+def _xonly_public_key(raw_bytes: bytes) -> secp256k1.PublicKeyXOnly:
+    """Parsed keys are reused across verifications of the same author."""
+    return secp256k1.PublicKeyXOnly(raw_bytes)
+
+
 class PrivateKey:
     def __init__(self, raw_secret: Optional[bytes] = None) -> None:
         if raw_secret:
@@ -172,21 +179,11 @@ class PrivateKey:
 def mine_vanity_key(
     prefix: Optional[str] = None, suffix: Optional[str] = None
 ) -> PrivateKey:
-    if prefix is None and suffix is None:
-        raise ValueError("Expected at least one of 'prefix' or 'suffix' arguments")
-
+    miner = VanityMiner([VanityPattern(prefix, suffix)])
     while True:
-        sk = PrivateKey()
-        if (
-            prefix is not None
-            and not sk.public_key.bech32()[5 : 5 + len(prefix)] == prefix
-        ):
-            continue
-        if suffix is not None and not sk.public_key.bech32()[-len(suffix) :] == suffix:
-            continue
-        break
-
-    return sk
+        secret, _ = miner.search(random_secret(), SEARCH_BATCH)
+        if secret is not None:
+            return PrivateKey(secret)
 
 
 @ffi.callback(
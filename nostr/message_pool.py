@@ -1,14 +1,19 @@
-import json
+from bisect import bisect_left, bisect_right
 from dataclasses import dataclass
-from queue import Queue
+from queue import Empty, Queue
 from threading import Lock
-from typing import List, Optional
+from typing import Callable, Iterator, List, Optional
 
+from . import codec
+from .bounded_queue import BoundedQueue, OverflowPolicy
+from .cache import EventDeduplicator
 from .event import Event
 from .message_type import RelayMessageType
 
 
 class EventMessage:
+    __slots__ = ("event", "subscription_id", "url")
+
     def __init__(self, event: Event, subscription_id: str, url: str) -> None:
         self.event = event
         self.subscription_id = subscription_id
@@ -19,6 +24,8 @@ class EventMessage:
 
 
 class NoticeMessage:
+    __slots__ = ("content", "url")
+
     def __init__(self, content: str, url: str) -> None:
         self.content = content
         self.url = url
@@ -28,6 +35,8 @@ class NoticeMessage:
 
 
 class EndOfStoredEventsMessage:
+    __slots__ = ("subscription_id", "url")
+
     def __init__(self, subscription_id: str, url: str) -> None:
         self.subscription_id = subscription_id
         self.url = url
@@ -37,23 +46,212 @@ class EndOfStoredEventsMessage:
 
 
 class OkMessage:
-    def __init__(self, content: str, url: str) -> None:
+    """NIP-20 command result. `content` is the raw message; `event_id`,
+    `accepted` and `message` are None if the relay sent fewer fields."""
+
+    __slots__ = ("content", "url", "event_id", "accepted", "message")
+
+    def __init__(
+        self,
+        content: str,
+        url: str,
+        event_id: Optional[str] = None,
+        accepted: Optional[bool] = None,
+        message: Optional[str] = None,
+    ) -> None:
         self.content = content
         self.url = url
+        self.event_id = event_id
+        self.accepted = accepted
+        self.message = message
+
+    @classmethod
+    def from_json(cls, message_json: list, url: str, content: str) -> "OkMessage":
+        fields = message_json[1:4] + [None] * (4 - len(message_json))
+        event_id, accepted, message = fields
+        if accepted is not None:
+            accepted = bool(accepted)
+        return cls(content, url, event_id, accepted, message)
+
+    def __repr__(self):
+        return f'OK({self.url}: {self.event_id} {self.accepted} {self.message})'
+
+
+EventCallback = Callable[[EventMessage], None]
 
 
 class MessagePool:
-    def __init__(self) -> None:
-        self.events: Queue[EventMessage] = Queue()
-        self.notices: Queue[NoticeMessage] = Queue()
-        self.eose_notices: Queue[EndOfStoredEventsMessage] = Queue()
-        self.ok_notices: Queue[OkMessage] = Queue()
-        self._unique_events: set = set()
+    def __init__(
+        self,
+        dedupe: Optional[EventDeduplicator] = None,
+        max_events: int = 0,
+        max_notices: int = 0,
+        overflow: str = OverflowPolicy.BLOCK,
+        spill_dir: Optional[str] = None,
+        router=None,
+    ) -> None:
+        """
+        :param dedupe: drops events already delivered for a subscription; defaults
+            to an exact LRU of the last 100000 (subscription, event) pairs
+        :param max_events: size limit of `events` and of each subscription's event
+            queue, 0 for no limit
+        :param max_notices: size limit of the notice, EOSE and OK queues, 0 for no
+            limit
+        :param overflow: what to do with a message for a full queue, see
+            `BoundedQueue`. "block" stalls the relay's receiving thread until the
+            consumer catches up, so do not use it when messages are consumed on
+            that same thread or event loop.
+        :param spill_dir: directory for the "spill" policy's temporary files
+        :param router: maps the events and EOSE received for a relay subscription
+            to the subscriptions they are delivered for, through its
+            `route(subscription_id, event)` and `route_eose(subscription_id)`
+            returning a list of subscription ids, or None to keep the received
+            one; see `RequestCoalescer`
+        """
+        self.router = router
+        self.max_events = max_events
+        self.max_notices = max_notices
+        self.overflow = overflow
+        self.spill_dir = spill_dir
+        self.events: Queue[EventMessage] = self._new_queue(max_events)
+        self.notices: Queue[NoticeMessage] = self._new_queue(max_notices)
+        self.eose_notices: Queue[EndOfStoredEventsMessage] = self._new_queue(
+            max_notices
+        )
+        self.ok_notices: Queue[OkMessage] = self._new_queue(max_notices)
+        if dedupe is None:
+            dedupe = EventDeduplicator()
+        self._unique_events: EventDeduplicator = dedupe
+        self._subscription_events: "dict[str, Queue[EventMessage]]" = {}
+        # drops of the queues of removed subscriptions
+        self._dropped_removed = 0
+        self._event_callbacks: "dict[Optional[str], list[EventCallback]]" = {}
+        self._ok_listeners: "dict[str, list[Callable[[OkMessage], None]]]" = {}
+        self._message_listeners: "list[Callable[[object], None]]" = []
         self.lock: Lock = Lock()
 
     def add_message(self, message: str, url: str):
         self._process_message(message, url)
 
+    def add_message_json(
+        self,
+        message_json: list,
+        url: str,
+        event: Optional[Event] = None,
+        message: Optional[str] = None,
+    ):
+        """Add a relay message that has already been decoded.
+
+        :param message_json: the decoded message
+        :param url: url of the relay that sent the message
+        :param event: the Event built from an EVENT message, if already available
+        :param message: the raw frame, if available
+        """
+        self._process_message_json(message_json, url, event, message)
+
+    def add_ok_listener(
+        self, event_id: str, callback: Callable[[OkMessage], None]
+    ) -> None:
+        """Call `callback` with every OK message received for `event_id`, from the
+        thread that received it, in addition to queueing it in `ok_notices`."""
+        with self.lock:
+            self._ok_listeners.setdefault(event_id, []).append(callback)
+
+    def remove_ok_listener(
+        self, event_id: str, callback: Callable[[OkMessage], None]
+    ) -> None:
+        with self.lock:
+            callbacks = self._ok_listeners.get(event_id, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                self._ok_listeners.pop(event_id, None)
+
+    def add_message_listener(self, callback: Callable[[object], None]) -> None:
+        """Call `callback` with every new EventMessage, NoticeMessage,
+        EndOfStoredEventsMessage and OkMessage, from the thread that received
+        it, before it is queued or handed to event callbacks."""
+        with self.lock:
+            self._message_listeners.append(callback)
+
+    def remove_message_listener(self, callback: Callable[[object], None]) -> None:
+        with self.lock:
+            if callback in self._message_listeners:
+                self._message_listeners.remove(callback)
+
+    def add_subscription(self, subscription_id: str) -> None:
+        """Queue the events of a subscription separately from `events`, so that
+        they are consumed with `get_event(subscription_id=...)` or `iter_events`
+        without competing with other subscriptions."""
+        with self.lock:
+            if subscription_id not in self._subscription_events:
+                queue = self._new_queue(self.max_events)
+                self._subscription_events[subscription_id] = queue
+
+    def remove_subscription(self, subscription_id: str) -> None:
+        """Stop queueing the subscription separately; events still queued for it
+        are dropped."""
+        with self.lock:
+            queue = self._subscription_events.pop(subscription_id, None)
+            if queue is not None:
+                queue.close()
+                self._dropped_removed += queue.dropped
+
+    def add_event_callback(
+        self, callback: EventCallback, subscription_id: Optional[str] = None
+    ) -> None:
+        """Call `callback` with each new event of `subscription_id`, or of every
+        subscription if None, from the thread that received it. Events handed to
+        a callback are not queued."""
+        with self.lock:
+            self._event_callbacks.setdefault(subscription_id, []).append(callback)
+
+    def remove_event_callback(
+        self, callback: EventCallback, subscription_id: Optional[str] = None
+    ) -> None:
+        with self.lock:
+            callbacks = self._event_callbacks.get(subscription_id, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                self._event_callbacks.pop(subscription_id, None)
+
+    def iter_events(
+        self, subscription_id: Optional[str] = None, timeout: Optional[float] = None
+    ) -> Iterator[EventMessage]:
+        """Yield events as they are received, blocking in between.
+
+        :param subscription_id: only yield the events of this subscription, which
+            is queued separately from then on (see `add_subscription`)
+        :param timeout: stop after this many seconds without an event; None to
+            wait forever
+        """
+        if subscription_id is not None:
+            self.add_subscription(subscription_id)
+        while True:
+            try:
+                yield self.get_event(timeout=timeout, subscription_id=subscription_id)
+            except Empty:
+                return
+
+    @property
+    def dropped(self) -> "dict[str, int]":
+        """Number of messages discarded because their queue was full."""
+        with self.lock:
+            subscription_queues = list(self._subscription_events.values())
+            dropped_removed = self._dropped_removed
+        return {
+            "events": self.events.dropped
+            + dropped_removed
+            + sum(queue.dropped for queue in subscription_queues),
+            "notices": self.notices.dropped,
+            "eose": self.eose_notices.dropped,
+            "ok": self.ok_notices.dropped,
+        }
+
+    def _new_queue(self, maxsize: int) -> BoundedQueue:
+        return BoundedQueue(maxsize, self.overflow, self.spill_dir)
+
     def get_all(self):
         results = {"events": [], "notices": [], "eose": [], "ok": []}
         while self.has_events():
@@ -66,20 +264,39 @@ class MessagePool:
             results["ok"].append(self.get_ok_notice())
         return results
 
-    def get_event(self):
-        return self.events.get()
+    def get_event(
+        self,
+        block: bool = True,
+        timeout: Optional[float] = None,
+        subscription_id: Optional[str] = None,
+    ) -> EventMessage:
+        """Remove and return the next event, waiting up to `timeout` seconds for
+        one if `block` is set; raises queue.Empty if there is none.
+
+        :param subscription_id: take the event from this subscription's own
+            queue, see `add_subscription`
+        """
+        return self._event_queue(subscription_id).get(block, timeout)
+
+    def get_notice(self, block: bool = True, timeout: Optional[float] = None):
+        return self.notices.get(block, timeout)
 
-    def get_notice(self):
-        return self.notices.get()
+    def get_eose_notice(self, block: bool = True, timeout: Optional[float] = None):
+        return self.eose_notices.get(block, timeout)
 
-    def get_eose_notice(self):
-        return self.eose_notices.get()
+    def get_ok_notice(self, block: bool = True, timeout: Optional[float] = None):
+        return self.ok_notices.get(block, timeout)
 
-    def get_ok_notice(self):
-        return self.ok_notices.get()
+    def has_events(self, subscription_id: Optional[str] = None):
+        return self._event_queue(subscription_id).qsize() > 0
 
-    def has_events(self):
-        return self.events.qsize() > 0
+    def _event_queue(self, subscription_id: Optional[str]) -> "Queue[EventMessage]":
+        if subscription_id is None:
+            return self.events
+        with self.lock:
+            if subscription_id not in self._subscription_events:
+                raise KeyError(f"No event queue for subscription {subscription_id}")
+            return self._subscription_events[subscription_id]
 
     def has_notices(self):
         return self.notices.qsize() > 0
@@ -91,22 +308,78 @@ class MessagePool:
         return self.ok_notices.qsize() > 0
 
     def _process_message(self, message: str, url: str):
-        message_json = json.loads(message)
+        self._process_message_json(codec.loads(message), url, message=message)
+
+    def _process_message_json(
+        self,
+        message_json: list,
+        url: str,
+        event: Optional[Event] = None,
+        message: Optional[str] = None,
+    ):
         message_type = message_json[0]
         if message_type == RelayMessageType.EVENT:
             subscription_id = message_json[1]
-            event = Event.from_dict(message_json[2])
-            with self.lock:
-                uid = subscription_id + event.id
-                if uid not in self._unique_events:
-                    self.events.put(EventMessage(event, subscription_id, url))
-                    self._unique_events.add(uid)
+            if event is None:
+                event = Event.from_dict(message_json[2])
+            subscription_ids = self._route(subscription_id, event)
+            for subscription_id in subscription_ids:
+                self._add_event(event, subscription_id, url)
         elif message_type == RelayMessageType.NOTICE:
-            self.notices.put(NoticeMessage(message_json[1], url))
+            notice = NoticeMessage(message_json[1], url)
+            self._notify_listeners(notice)
+            self.notices.put(notice)
         elif message_type == RelayMessageType.END_OF_STORED_EVENTS:
-            self.eose_notices.put(EndOfStoredEventsMessage(message_json[1], url))
+            for subscription_id in self._route(message_json[1]):
+                eose = EndOfStoredEventsMessage(subscription_id, url)
+                self._notify_listeners(eose)
+                self.eose_notices.put(eose)
         elif message_type == RelayMessageType.OK:
-            self.ok_notices.put(OkMessage(message, url))
+            if message is None:
+                message = codec.dumps(message_json)
+            ok = OkMessage.from_json(message_json, url, message)
+            self._notify_listeners(ok)
+            self.ok_notices.put(ok)
+            if not isinstance(ok.event_id, str):
+                return
+            with self.lock:
+                callbacks = list(self._ok_listeners.get(ok.event_id, ()))
+            for callback in callbacks:
+                callback(ok)
+
+    def _route(
+        self, subscription_id: str, event: Optional[Event] = None
+    ) -> "list[str]":
+        router = self.router
+        if router is None:
+            return [subscription_id]
+        if event is None:
+            routed = router.route_eose(subscription_id)
+        else:
+            routed = router.route(subscription_id, event)
+        return [subscription_id] if routed is None else routed
+
+    def _add_event(self, event: Event, subscription_id: str, url: str) -> None:
+        with self.lock:
+            if self._unique_events.seen(subscription_id, event.id):
+                return
+            callbacks = self._event_callbacks.get(subscription_id, [])
+            callbacks = callbacks + self._event_callbacks.get(None, [])
+            queue = self._subscription_events.get(subscription_id, self.events)
+            listeners = list(self._message_listeners)
+        event_message = EventMessage(event, subscription_id, url)
+        for listener in listeners:
+            listener(event_message)
+        if not callbacks:
+            queue.put(event_message)
+        for callback in callbacks:
+            callback(event_message)
+
+    def _notify_listeners(self, message) -> None:
+        with self.lock:
+            listeners = list(self._message_listeners)
+        for listener in listeners:
+            listener(message)
 
     def __repr__(self):
         return (
@@ -117,32 +390,154 @@ class MessagePool:
         )
 
 
+class _TimeIndex:
+    """Event messages sorted by `created_at`, in chunks of a few hundred.
+
+    Adding a message older than the newest one only shifts the chunk it goes
+    into, and queries bisect the chunks' last creation times, then a chunk.
+    Messages created at the same time keep their insertion order.
+    """
+
+    _CHUNK_SIZE = 512
+
+    def __init__(self) -> None:
+        self._times: List[List[int]] = []
+        self._messages: List[List[EventMessage]] = []
+        # creation time of the last message of each chunk
+        self._maxes: List[int] = []
+        self._len = 0
+
+    def add(self, message: EventMessage) -> None:
+        created_at = message.event.created_at
+        self._len += 1
+        if not self._maxes:
+            self._times.append([created_at])
+            self._messages.append([message])
+            self._maxes.append(created_at)
+            return
+        if created_at >= self._maxes[-1]:
+            i = len(self._maxes) - 1
+            times = self._times[i]
+            position = len(times)
+        else:
+            # the first chunk ending after `created_at`
+            i = bisect_right(self._maxes, created_at)
+            times = self._times[i]
+            position = bisect_right(times, created_at)
+        times.insert(position, created_at)
+        self._messages[i].insert(position, message)
+        self._maxes[i] = times[-1]
+        if len(times) > 2 * self._CHUNK_SIZE:
+            messages = self._messages[i]
+            self._times[i + 1 : i + 1] = [times[self._CHUNK_SIZE :]]
+            self._messages[i + 1 : i + 1] = [messages[self._CHUNK_SIZE :]]
+            del times[self._CHUNK_SIZE :]
+            del messages[self._CHUNK_SIZE :]
+            self._maxes.insert(i, times[-1])
+
+    def newest(self) -> Optional[EventMessage]:
+        return self._messages[-1][-1] if self._messages else None
+
+    def oldest(self) -> Optional[EventMessage]:
+        return self._messages[0][0] if self._messages else None
+
+    def between(
+        self, since: Optional[int] = None, until: Optional[int] = None
+    ) -> List[EventMessage]:
+        first = 0 if since is None else bisect_left(self._maxes, since)
+        last = len(self._maxes) - 1
+        if until is not None:
+            last = min(bisect_right(self._maxes, until), last)
+        result = []
+        for i in range(first, last + 1):
+            times = self._times[i]
+            start = 0 if since is None else bisect_left(times, since)
+            end = len(times) if until is None else bisect_right(times, until)
+            result += self._messages[i][start:end]
+        return result
+
+    def __len__(self) -> int:
+        return self._len
+
+
 @dataclass
 class EventMessageStore:
+    """Event messages indexed by subscription id, relay url, author, kind, event
+    id and creation time.
+
+    Lookups by key are dict accesses; the newest event and time ranges are found
+    by bisecting messages kept sorted by `created_at` in chunks, so that adding
+    events out of order, such as the stored events a relay sends newest first,
+    stays cheap. An event received from several relays or subscriptions is
+    stored once per message; `get_event` returns the first of them.
+
+    :param eventMessages: initial messages, in insertion order; add further
+        messages with `add_event` rather than to this list, so they get indexed
+    """
+
     eventMessages: Optional[List[EventMessage]] = None
 
+    def __post_init__(self) -> None:
+        self._by_subscription: "dict[str, List[EventMessage]]" = {}
+        self._by_url: "dict[str, List[EventMessage]]" = {}
+        self._by_author: "dict[str, List[EventMessage]]" = {}
+        self._by_kind: "dict[int, List[EventMessage]]" = {}
+        self._by_id: "dict[str, EventMessage]" = {}
+        self._by_time = _TimeIndex()
+        messages, self.eventMessages = self.eventMessages, None
+        if messages:
+            self.add_event(messages)
+
     def add_event(self, event):
+        """Add an EventMessage, or a list of them."""
         if self.eventMessages is None:
             self.eventMessages = []
-        if isinstance(event, list):
-            self.eventMessages += event
-        else:
-            self.eventMessages.append(event)
-
-    def get_newest_event(self):
-        if not self.eventMessages:
-            return None
-        return max(self.eventMessages, key=lambda x: x.event.date_time())
+        messages = event if isinstance(event, list) else [event]
+        for message in messages:
+            self._index(message)
+        self.eventMessages += messages
+
+    def _index(self, message: EventMessage) -> None:
+        event = message.event
+        self._by_subscription.setdefault(message.subscription_id, []).append(message)
+        self._by_url.setdefault(message.url, []).append(message)
+        self._by_author.setdefault(event.public_key, []).append(message)
+        self._by_kind.setdefault(event.kind, []).append(message)
+        self._by_id.setdefault(event.id, message)
+        self._by_time.add(message)
+
+    def get_newest_event(self) -> Optional[EventMessage]:
+        return self._by_time.newest()
+
+    def get_oldest_event(self) -> Optional[EventMessage]:
+        return self._by_time.oldest()
+
+    def get_events_between(
+        self, since: Optional[int] = None, until: Optional[int] = None
+    ) -> List[EventMessage]:
+        """Messages with `since` <= created_at <= `until`, oldest first."""
+        return self._by_time.between(since, until)
+
+    def get_event(self, event_id: str) -> Optional[EventMessage]:
+        return self._by_id.get(event_id)
 
     def get_events_by_url(self, url):
-        return [event for event in self.eventMessages if event.url == url]
+        return list(self._by_url.get(url, ()))
 
     def get_events_by_id(self, subscription_id):
-        return [
-            event
-            for event in self.eventMessages
-            if event.subscription_id == subscription_id
-        ]
+        return list(self._by_subscription.get(subscription_id, ()))
+
+    def get_events_by_author(self, public_key: str) -> List[EventMessage]:
+        return list(self._by_author.get(public_key, ()))
+
+    def get_events_by_kind(self, kind: int) -> List[EventMessage]:
+        return list(self._by_kind.get(kind, ()))
+
+    def __len__(self):
+        return len(self._by_time)
+
+    def __contains__(self, event_id: str) -> bool:
+        return event_id in self._by_id
 
     def __repr__(self):
         if not self.eventMessages:
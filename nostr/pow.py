@@ -1,11 +1,33 @@
+import json
+import multiprocessing
+import os
+import signal
 import time
-from dataclasses import dataclass, field
+from dataclasses import asdict, dataclass, field
+from hashlib import sha256
+from pathlib import Path
+from queue import Empty
+from typing import Callable, List, Optional, Tuple
 
 from .event import Event
 from .key import PrivateKey
+from .vanity import (
+    SEARCH_BATCH,
+    VanityMiner,
+    VanityPattern,
+    add_to_secret,
+    random_secret,
+    x_coordinates,
+)
 
 BECH32_CHARS = '023456789acdefghjklmnpqrstuvwxyz'
 
+# digits of the zero-padded nonce written by NonceMiner
+NONCE_WIDTH = 16
+# NonceMiner hashes nonces in blocks of 10**NONCE_BLOCK_DIGITS, between which
+# mining workers check for another worker's success
+NONCE_BLOCK_DIGITS = 4
+
 
 def zero_bits(b: int) -> int:
     n = 0
@@ -21,15 +43,15 @@ def zero_bits(b: int) -> int:
 
 
 def count_leading_zero_bits(hex_str: str) -> int:
-    total = 0
-    for i in range(0, len(hex_str) - 2, 2):
-        bits = zero_bits(int(hex_str[i : i + 2], 16))
-        total += bits
+    # the last byte is not counted
+    hex_str = hex_str[:-2]
+    if not hex_str:
+        return 0
+    return len(hex_str) * 4 - int(hex_str, 16).bit_length()
 
-        if bits != 8:
-            break
 
-    return total
+def count_leading_zero_bits_bytes(digest: bytes) -> int:
+    return len(digest) * 8 - int.from_bytes(digest, "big").bit_length()
 
 
 def _guess_event(event: Event) -> Event:
@@ -37,6 +59,291 @@ def _guess_event(event: Event) -> Event:
     return num_leading_zero_bits, event
 
 
+class NonceMiner:
+    """Searches the NIP-13 nonce of an event, hashing only what changes.
+
+    The event is serialized once with a `NONCE_WIDTH` digit nonce as the first
+    tag. The SHA-256 state after the constant prefix before the nonce, and after
+    each block's leading nonce digits, is computed once and copied for each
+    guess, which then only hashes the last nonce digits and the rest of the
+    event. Digests are compared to the difficulty target as raw bytes.
+
+    :param tags: the event's tags, without the nonce tag
+    """
+
+    def __init__(
+        self,
+        public_key: str,
+        created_at: int,
+        kind: int,
+        tags: List[List[str]],
+        content: str,
+        difficulty: int,
+    ) -> None:
+        self.difficulty = difficulty
+        placeholder = "0" * NONCE_WIDTH
+        tags = [["nonce", placeholder, str(difficulty)]] + tags
+        serialized = Event.serialize(public_key, created_at, kind, tags, content)
+        prefix = Event.serialize(public_key, created_at, kind, [], "")
+        prefix = prefix[: prefix.index(b",[]")] + b',[["nonce","'
+        assert (
+            serialized[len(prefix) : len(prefix) + NONCE_WIDTH] == placeholder.encode()
+        )
+
+        self._prefix = sha256(prefix)
+        suffix = serialized[len(prefix) + NONCE_WIDTH :]
+        low_width = NONCE_BLOCK_DIGITS
+        self._high_format = b"%%0%dd" % (NONCE_WIDTH - low_width)
+        self._tails = [b"%0*d" % (low_width, low) + suffix for low in range(self.block)]
+        # a digest is below the target iff it has `difficulty` leading zero bits
+        if difficulty > 0:
+            self._target = (1 << (256 - difficulty)).to_bytes(32, "big")
+        else:
+            self._target = b"\xff" * 33
+
+    @property
+    def block(self) -> int:
+        return 10**NONCE_BLOCK_DIGITS
+
+    def nonce_tag(self, nonce: int) -> List[str]:
+        return ["nonce", str(nonce).zfill(NONCE_WIDTH), str(self.difficulty)]
+
+    def search_block(self, block: int) -> Optional[int]:
+        """Try the nonces block * self.block ... (block + 1) * self.block - 1 and
+        return the first one reaching the difficulty, if any."""
+        state = self._prefix.copy()
+        state.update(self._high_format % block)
+        target = self._target
+        for low, tail in enumerate(self._tails):
+            guess = state.copy()
+            guess.update(tail)
+            if guess.digest() < target:
+                return block * self.block + low
+        return None
+
+    def search_block_best(
+        self, block: int, best: Optional[bytes] = None
+    ) -> Tuple[Optional[int], Optional[bytes]]:
+        """Like `search_block`, but also keep the nonce whose digest has the most
+        leading zero bits when none reaches the difficulty.
+
+        :param best: digest to beat
+        :return: the nonce and its digest, the first one reaching the difficulty
+            or else the lowest one if it beats `best`, else None, None
+        """
+        state = self._prefix.copy()
+        state.update(self._high_format % block)
+        best = best or b"\xff" * 33
+        best_low = None
+        target = self._target
+        for low, tail in enumerate(self._tails):
+            guess = state.copy()
+            guess.update(tail)
+            digest = guess.digest()
+            if digest < best:
+                best = digest
+                best_low = low
+                if digest < target:
+                    break
+        if best_low is None:
+            return None, None
+        return block * self.block + best_low, best
+
+
+class KeyMiner:
+    """Searches secret keys whose x-only public key has `difficulty` leading
+    zero bits, deriving consecutive keys by point addition (see `nostr.vanity`).
+    Public keys are compared to the difficulty target as raw bytes."""
+
+    def __init__(self, difficulty: int) -> None:
+        self.difficulty = difficulty
+        if difficulty > 0:
+            self._target = (1 << (256 - difficulty)).to_bytes(32, "big")
+        else:
+            self._target = b"\xff" * 33
+
+    def search(
+        self, raw_secret: bytes, count: int, best: Optional[bytes] = None
+    ) -> Tuple[int, Optional[bytes], Optional[bytes]]:
+        """Try the `count` secret keys following `raw_secret`, `raw_secret`
+        included, stopping at the first one reaching the difficulty.
+
+        :param best: x-only public key to beat
+        :return: the number of keys tried, and the secret key and x-only public
+            key with the most leading zero bits if they beat `best`, else None
+        """
+        best = best or b"\xff" * 33
+        best_offset = None
+        target = self._target
+        tried = 0
+        for offset, x in enumerate(x_coordinates(raw_secret, count)):
+            tried += 1
+            if x < best:
+                best = x
+                best_offset = offset
+                if x < target:
+                    break
+        if best_offset is None:
+            return tried, None, None
+        return tried, add_to_secret(raw_secret, best_offset), best
+
+
+def _mine_key_worker(difficulty: int, best_bits, stop, counter, found):
+    """Search keys from random starting points, putting (bits, secret) on `found`
+    whenever a key has more leading zero bits than `best_bits`, shared by all
+    workers, until one reaches `difficulty` or `stop` is set. Runs in a worker
+    process."""
+    miner = KeyMiner(difficulty)
+    while not stop.is_set():
+        tried, secret, x = miner.search(random_secret(), SEARCH_BATCH)
+        with counter.get_lock():
+            counter.value += tried
+        if secret is None:
+            continue
+        bits = count_leading_zero_bits_bytes(x)
+        with best_bits.get_lock():
+            if bits <= best_bits.value:
+                continue
+            best_bits.value = bits
+        found.put((bits, secret))
+        if bits >= difficulty:
+            stop.set()
+            return
+
+
+def _mine_event_worker(
+    fields: tuple,
+    difficulty: int,
+    offset: int,
+    step: int,
+    best_bits,
+    stop,
+    counter,
+    found,
+):
+    """Search nonce blocks offset, offset + step, ..., putting (bits, nonce) on
+    `found` whenever a nonce gives more leading zero bits than `best_bits`, shared
+    by all workers, until one reaches `difficulty` or `stop` is set. Runs in a
+    worker process."""
+    miner = NonceMiner(*fields, difficulty)
+    block = offset
+    while not stop.is_set():
+        nonce, digest = miner.search_block_best(block)
+        block += step
+        bits = count_leading_zero_bits_bytes(digest) if nonce is not None else 0
+        with counter.get_lock():
+            if bits >= difficulty:
+                counter.value += nonce % miner.block + 1
+            else:
+                counter.value += miner.block
+        if nonce is None:
+            continue
+        with best_bits.get_lock():
+            if bits <= best_bits.value:
+                continue
+            best_bits.value = bits
+        found.put((bits, nonce))
+        if bits >= difficulty:
+            stop.set()
+            return
+
+
+def _mine_vanity_worker(patterns: list, stop, counter, found):
+    """Search keys from random starting points until one matches `patterns`, a
+    list of (prefix, suffix), or `stop` is set. Runs in a worker process."""
+    miner = VanityMiner([VanityPattern(prefix, suffix) for prefix, suffix in patterns])
+    while not stop.is_set():
+        start = random_secret()
+        secret, pattern = miner.search(start, SEARCH_BATCH)
+        with counter.get_lock():
+            if secret is None:
+                counter.value += SEARCH_BATCH
+            else:
+                offset = int.from_bytes(secret, "big") - int.from_bytes(start, "big")
+                counter.value += offset + 1
+        if secret is not None:
+            found.put((secret, pattern.prefix, pattern.suffix))
+            stop.set()
+            return
+
+
+def _worker_main(target, *args):
+    # the parent stops the workers on Ctrl-C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    target(*args)
+
+
+def _run_workers(
+    target,
+    worker_args: List[tuple],
+    max_duration: float = 0,
+    on_result: Optional[Callable[[object], bool]] = None,
+    on_progress: Optional[Callable[[int, float], None]] = None,
+    interval: float = 1.0,
+):
+    """Run `target(*args, stop, counter, found)` on a process for each `args` of
+    `worker_args`, until one of them puts a result on `found` or `max_duration`
+    seconds passed, and stop them all.
+
+    :param on_result: called with each result; unless it returns True, the
+        workers keep running
+    :param on_progress: called every `interval` seconds with the sum of the
+        counters and the elapsed time
+    :return: the accepted result or None, the sum of the counters and the
+        duration
+    """
+    context = multiprocessing.get_context()
+    stop = context.Event()
+    found = context.Queue()
+    counters = [context.Value("Q", 0) for _ in worker_args]
+    processes = [
+        context.Process(
+            target=_worker_main,
+            args=(target,) + args + (stop, counter, found),
+            daemon=True,
+        )
+        for args, counter in zip(worker_args, counters)
+    ]
+
+    start = time.perf_counter()
+    deadline = start + max_duration if max_duration else None
+    next_progress = start + interval
+    for process in processes:
+        process.start()
+    result = None
+    try:
+        while True:
+            timeout = None
+            if on_progress is not None:
+                timeout = max(next_progress - time.perf_counter(), 0)
+            if deadline is not None:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                timeout = remaining if timeout is None else min(timeout, remaining)
+            try:
+                candidate = found.get(timeout=timeout)
+            except Empty:
+                pass
+            else:
+                if on_result is None or on_result(candidate):
+                    result = candidate
+                    break
+            now = time.perf_counter()
+            if on_progress is not None and now >= next_progress:
+                count = sum(counter.value for counter in counters)
+                on_progress(count, now - start)
+                next_progress = now + interval
+    finally:
+        stop.set()
+        for process in processes:
+            process.join(1)
+            if process.is_alive():
+                process.terminate()
+    duration = time.perf_counter() - start
+    return result, sum(counter.value for counter in counters), duration
+
+
 def _guess_key():
     sk = PrivateKey()
     num_leading_zero_bits = count_leading_zero_bits(sk.public_key.hex())
@@ -136,6 +443,7 @@ class PowEvent(Pow):
         self.difficulty = difficulty
         self.n_pattern = self.difficulty
         self.event.tags[0][2] = str(self.difficulty)
+        self.event.clear_cache()
 
     def increase_difficulty(self):
         self.set_difficulty(self.num_leading_zero_bits + 1)
@@ -151,6 +459,7 @@ class PowEvent(Pow):
         ):
             self.count += 1
             event.tags[0][1] = str(self.count)
+            event.clear_cache()
             num_leading_zero_bits, event = self.operation(event)
             if num_leading_zero_bits > self.num_leading_zero_bits:
                 self.event = event
@@ -162,6 +471,48 @@ class PowEvent(Pow):
         self.results.append((self.num_leading_zero_bits, self.event))
         return self.event
 
+    def mine_parallel(self, workers: int = 0, max_duration: float = 0) -> Event:
+        """Mine on several processes, each trying its own share of the nonces,
+        and stop them all once one succeeds.
+
+        :param workers: number of processes, 0 for one per CPU
+        :param max_duration: give up after this many seconds, 0 for no limit
+        :return: the event with the most leading zero bits so far
+        """
+        workers = workers or os.cpu_count() or 1
+        best_bits = multiprocessing.get_context().Value("i", self.num_leading_zero_bits)
+        event = self.event
+        fields = (
+            event.public_key,
+            event.created_at,
+            event.kind,
+            event.tags[1:],
+            event.content,
+        )
+
+        def on_result(result) -> bool:
+            bits, nonce = result
+            if bits > self.num_leading_zero_bits:
+                event.tags[0][1] = str(nonce).zfill(NONCE_WIDTH)
+                event.clear_cache()
+                self.num_leading_zero_bits = bits
+            return self.num_leading_zero_bits >= self.difficulty
+
+        if self.num_leading_zero_bits < self.difficulty:
+            _, count, duration = _run_workers(
+                _mine_event_worker,
+                [
+                    (fields, self.difficulty, i, workers, best_bits)
+                    for i in range(workers)
+                ],
+                max_duration,
+                on_result,
+            )
+            self.duration += duration
+            self.count += count
+        self.results.append((self.num_leading_zero_bits, self.event))
+        return self.event
+
     def get_expected_time(self, hashrate=None) -> float:
         if hashrate is None:
             if self.count > 10000 and self.duration > 0:
@@ -173,6 +524,44 @@ class PowEvent(Pow):
         return self.get_expected_guesses() / hashrate
 
 
+@dataclass
+class MiningProgress:
+    """Snapshot of a key mining run, saved to resume it after an interruption.
+
+    It holds the best secret key found so far, so `save` makes the file
+    readable by its owner only.
+    """
+
+    difficulty: int
+    count: int = 0
+    duration: float = 0
+    best_bits: int = 0
+    best_secret: Optional[str] = None
+
+    @property
+    def hashrate(self) -> float:
+        return self.count / self.duration if self.duration > 0 else 0
+
+    def save(self, path) -> None:
+        path = Path(path)
+        path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        temporary = path.with_name(path.name + ".tmp")
+        fd = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.fchmod(fd, 0o600)
+        with os.fdopen(fd, "w") as file:
+            json.dump(asdict(self), file)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path) -> Optional["MiningProgress"]:
+        """Read a snapshot, or return None if there is none at `path`."""
+        try:
+            with open(path) as file:
+                return cls(**json.load(file))
+        except FileNotFoundError:
+            return None
+
+
 @dataclass
 class PowKey(Pow):
     difficulty: int = 8
@@ -197,19 +586,32 @@ class PowKey(Pow):
     def increase_difficulty(self):
         self.set_difficulty(self.num_leading_zero_bits + 1)
 
+    def _found(self, bits: int, secret: bytes) -> None:
+        if bits > self.num_leading_zero_bits:
+            self.num_leading_zero_bits = bits
+            self.sk = PrivateKey(secret)
+
     def mine(self, max_count: int = 0, max_duration: int = 0) -> PrivateKey:
+        """Search consecutive keys from random starting points.
+
+        :return: the key with the most leading zero bits so far
+        """
         start = time.perf_counter()
         count = 0
         duration = 0
-        num_leading_zero_bits = self.num_leading_zero_bits
-        while num_leading_zero_bits < self.difficulty and (
+        miner = KeyMiner(self.difficulty)
+        best = self.sk.public_key.raw_bytes
+        while self.num_leading_zero_bits < self.difficulty and (
             not self._stop_mining(count, max_count, duration, max_duration)
         ):
-            num_leading_zero_bits, sk = self.operation()
-            if num_leading_zero_bits > self.num_leading_zero_bits:
-                self.sk = sk
-                self.num_leading_zero_bits = num_leading_zero_bits
-            count += 1
+            batch = SEARCH_BATCH
+            if max_count > 0:
+                batch = min(batch, max_count - count + 1)
+            tried, secret, x = miner.search(random_secret(), batch, best)
+            if secret is not None:
+                best = x
+                self._found(count_leading_zero_bits_bytes(x), secret)
+            count += tried
             duration = time.perf_counter() - start
         self.count += count
         end = time.perf_counter()
@@ -217,6 +619,87 @@ class PowKey(Pow):
         self.results.append((self.num_leading_zero_bits, self.sk))
         return self.sk
 
+    def mine_parallel(
+        self,
+        workers: int = 0,
+        max_duration: float = 0,
+        progress_file: Optional[str] = None,
+        on_progress: Optional[Callable[[MiningProgress], None]] = None,
+        interval: float = 1.0,
+    ) -> PrivateKey:
+        """Mine on several processes and stop them all once one succeeds.
+
+        :param workers: number of processes, 0 for one per CPU
+        :param max_duration: give up after this many seconds, 0 for no limit
+        :param progress_file: save a `MiningProgress` there every `interval`
+            seconds and when mining stops, even on KeyboardInterrupt; see
+            `resume`
+        :param on_progress: called with a `MiningProgress` every `interval`
+            seconds
+        :return: the key with the most leading zero bits so far
+        """
+        workers = workers or os.cpu_count() or 1
+        best_bits = multiprocessing.get_context().Value("i", self.num_leading_zero_bits)
+        count, duration = self.count, self.duration
+
+        def on_result(result) -> bool:
+            self._found(*result)
+            return self.num_leading_zero_bits >= self.difficulty
+
+        def on_snapshot(run_count: int, elapsed: float) -> None:
+            self.count = count + run_count
+            self.duration = duration + elapsed
+            progress = self.progress()
+            if progress_file is not None:
+                progress.save(progress_file)
+            if on_progress is not None:
+                on_progress(progress)
+
+        try:
+            if self.num_leading_zero_bits < self.difficulty:
+                _, run_count, elapsed = _run_workers(
+                    _mine_key_worker,
+                    [(self.difficulty, best_bits)] * workers,
+                    max_duration,
+                    on_result,
+                    on_snapshot,
+                    interval,
+                )
+                self.count = count + run_count
+                self.duration = duration + elapsed
+        finally:
+            if progress_file is not None:
+                self.progress().save(progress_file)
+        self.results.append((self.num_leading_zero_bits, self.sk))
+        return self.sk
+
+    def progress(self) -> MiningProgress:
+        return MiningProgress(
+            self.difficulty,
+            self.count,
+            self.duration,
+            self.num_leading_zero_bits,
+            self.sk.hex(),
+        )
+
+    def resume(self, progress: MiningProgress) -> None:
+        """Continue from a snapshot of a previous run: its count, duration and
+        best key are kept.
+
+        :raises ValueError: if the snapshot is for another difficulty
+        """
+        if progress.difficulty != self.difficulty:
+            raise ValueError(
+                f"Progress is for difficulty {progress.difficulty}, "
+                f"not {self.difficulty}"
+            )
+        self.count = progress.count
+        self.duration = progress.duration
+        if progress.best_secret is not None:
+            self.sk = PrivateKey(bytes.fromhex(progress.best_secret))
+            public_key = self.sk.public_key.raw_bytes
+            self.num_leading_zero_bits = count_leading_zero_bits_bytes(public_key)
+
     def get_expected_time(self, hashrate=None) -> float:
         if hashrate is None:
             if self.count > 10000 and self.duration > 0:
@@ -230,65 +713,98 @@ class PowKey(Pow):
 
 @dataclass
 class PowVanityKey(Pow):
+    """Mines a key whose npub starts with `prefix` and/or ends with `suffix`
+    after "npub1".
+
+    :param patterns: alternative (prefix, suffix) pairs, any match is accepted
+    """
+
     prefix: str = None
     suffix: str = None
+    patterns: List[Tuple[Optional[str], Optional[str]]] = None
 
     def __post_init__(self):
         self.n_pattern = 0
         self.operation = _guess_vanity_key
         self.n_options = len(BECH32_CHARS)
         self.mode = "vanity_key"
-        if self.prefix is None and self.suffix is None:
+        self.patterns = list(self.patterns or [])
+        if self.prefix is not None or self.suffix is not None:
+            self.patterns.insert(0, (self.prefix, self.suffix))
+        if not self.patterns:
             raise ValueError("Expected at least one of 'prefix' or 'suffix' arguments")
 
-        for pattern in [self.prefix, self.suffix]:
-            if pattern is not None:
-                self.n_pattern += len(pattern)
-                missing_chars = [c for c in pattern if c not in BECH32_CHARS]
-                if len(missing_chars) > 0:
-                    raise ValueError(
-                        f"{missing_chars} not in valid "
-                        f"list of bech32 chars: ({BECH32_CHARS})"
-                    )
+        # the likeliest pattern dominates the expected number of guesses
+        self.n_pattern = min(
+            len(prefix or "") + len(suffix or "") for prefix, suffix in self.patterns
+        )
+        self._miner = VanityMiner(
+            [VanityPattern(prefix, suffix) for prefix, suffix in self.patterns]
+        )
         self.reset()
 
     def reset(self):
         self.count = 0
         self.duration = 0
         self.results = []
+        self.sk = None
+        self.vk = None
 
-    def _check_vanity(self):
-        if (
-            self.prefix is not None
-            and not self.vk[5 : 5 + len(self.prefix)] == self.prefix
-        ):
-            return False
-        if self.suffix is not None and not self.vk[-len(self.suffix) :] == self.suffix:
-            return False
-        return True
+    def _found(self, secret: bytes) -> PrivateKey:
+        self.sk = PrivateKey(secret)
+        self.vk = self.sk.public_key.bech32()
+        self.results.append((self.vk, self.sk))
+        return self.sk
 
     def mine(self, max_count: int = 0, max_duration: int = 0) -> PrivateKey:
+        """Search consecutive keys from random starting points.
+
+        :return: the matching key, or None if none was found within the limits
+        """
         start = time.perf_counter()
         count = 0
         duration = 0
-        self.vk, self.sk = self.operation()
-        while not self._check_vanity() and (
-            not self._stop_mining(count, max_count, duration, max_duration)
-        ):
-            self.vk, self.sk = self.operation()
-            count += 1
+        while not self._stop_mining(count, max_count, duration, max_duration):
+            batch = SEARCH_BATCH
+            if max_count > 0:
+                batch = min(batch, max_count - count + 1)
+            first = random_secret()
+            secret, _ = self._miner.search(first, batch)
+            if secret is not None:
+                count += int.from_bytes(secret, "big") - int.from_bytes(first, "big")
+                self.count += count + 1
+                self.duration += time.perf_counter() - start
+                return self._found(secret)
+            count += batch
             duration = time.perf_counter() - start
         self.count += count
-        end = time.perf_counter()
-        self.duration += end - start
-        if self._check_vanity():
-            self.results.append((self.vk, self.sk))
-        return self.sk
+        self.duration += time.perf_counter() - start
+        return None
+
+    def mine_parallel(self, workers: int = 0, max_duration: float = 0) -> PrivateKey:
+        """Search on several processes and stop them all once one succeeds.
+
+        :param workers: number of processes, 0 for one per CPU
+        :param max_duration: give up after this many seconds, 0 for no limit
+        :return: the matching key, or None if none was found in time
+        """
+        workers = workers or os.cpu_count() or 1
+        result, count, duration = _run_workers(
+            _mine_vanity_worker, [(self.patterns,)] * workers, max_duration
+        )
+        self.count += count
+        self.duration += duration
+        if result is None:
+            return None
+        secret, _prefix, _suffix = result
+        return self._found(secret)
 
     def get_expected_time(self, hashrate=None):
         if hashrate is None:
             if self.count > 10000 and self.duration > 0:
                 hashrate = self.get_hashrate()
             else:
-                hashrate = self.estimate_hashrate()
+                start = time.perf_counter()
+                self._miner.search(random_secret(), SEARCH_BATCH)
+                hashrate = SEARCH_BATCH / (time.perf_counter() - start)
         return self.get_expected_guesses() / hashrate
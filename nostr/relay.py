@@ -2,9 +2,11 @@ import json
 import logging
 import threading
 import time
+from collections import deque
+from concurrent.futures import Executor, Future
 from dataclasses import dataclass
 from threading import Lock
-from typing import Optional, Union
+from typing import Callable, Optional, Tuple, Union
 
 from websocket import (
     WebSocketApp,
@@ -12,6 +14,8 @@ from websocket import (
     setdefaulttimeout,
 )
 
+from . import codec
+from .cache import VerifiedEventCache
 from .event import Event
 from .filter import Filters
 from .message_pool import MessagePool
@@ -25,6 +29,10 @@ logger.addHandler(logging.StreamHandler())
 setdefaulttimeout(5)
 
 
+class RelayException(Exception):
+    pass
+
+
 @dataclass
 class RelayPolicy:
     should_read: bool = True
@@ -41,7 +49,108 @@ class RelayProxyConnectionConfig:
     type: Optional[str] = None
 
 
-class Relay:
+class BaseRelay:
+    """Subscriptions and inbound message validation shared by the threaded
+    `Relay` and `nostr.aio.AsyncRelay`."""
+
+    def __init__(
+        self,
+        url: str,
+        message_pool: MessagePool,
+        policy: RelayPolicy = RelayPolicy(),
+        subscriptions: "dict[str, Subscription]" = None,
+        verified_cache: Optional[VerifiedEventCache] = None,
+    ) -> None:
+        self.url = url
+        self.policy = policy
+        self.message_pool = message_pool
+        self.subscriptions = subscriptions or {}
+        self.verified_cache = verified_cache
+        self.lock: Lock = Lock()
+
+    def add_subscription(self, id, filters: Filters):
+        with self.lock:
+            self.subscriptions[id] = Subscription(id, filters)
+
+    def close_subscription(self, id: str) -> None:
+        with self.lock:
+            self.subscriptions.pop(id)
+
+    def update_subscription(self, id: str, filters: Filters) -> None:
+        with self.lock:
+            subscription = self.subscriptions[id]
+            subscription.filters = filters
+
+    def __repr__(self):
+        return json.dumps(self.to_json_object(), indent=2)
+
+    def to_json_object(self) -> dict:
+        return {
+            "url": self.url,
+            "policy": self.policy.to_json_object(),
+            "subscriptions": [
+                subscription.to_json_object()
+                for subscription in self.subscriptions.values()
+            ],
+        }
+
+    def _is_valid_message(self, message: str) -> bool:
+        return self._parse_message(message) is not None
+
+    def _parse_message(
+        self, message: str, build_event: bool = True
+    ) -> Optional[Tuple[list, Optional[Event]]]:
+        """Decode and validate a relay frame.
+
+        Returns the decoded message and, for EVENT messages when `build_event` is
+        set, the verified Event, or None if the frame should be dropped.
+        """
+        message = message.strip("\n")
+        if not message or message[0] != "[" or message[-1] != "]":
+            return None
+
+        message_json = codec.loads(message)
+        message_type = message_json[0]
+        if not RelayMessageType.is_valid(message_type):
+            return None
+
+        event = None
+        if message_type == RelayMessageType.EVENT:
+            if not len(message_json) == 3:
+                return None
+
+            subscription_id = message_json[1]
+            with self.lock:
+                if subscription_id not in self.subscriptions:
+                    return None
+
+            if build_event:
+                event = self._build_event(message_json)
+                if event is None:
+                    return None
+
+        return message_json, event
+
+    def _build_event(self, message_json: list) -> Optional[Event]:
+        """Build the Event of an EVENT message, or None if it fails verification or
+        does not match its subscription."""
+        event = Event.from_dict(
+            message_json[2], verify=True, verified_cache=self.verified_cache
+        )
+
+        if not event.verify():
+            return None
+
+        with self.lock:
+            subscription = self.subscriptions.get(message_json[1])
+
+        if subscription is None or not subscription.filters.match(event):
+            return None
+
+        return event
+
+
+class Relay(BaseRelay):
     reconnect: bool = True
     error_counter: int = 0
     error_threshold: int = 10
@@ -54,16 +163,26 @@ class Relay:
         ssl_options: dict = None,
         proxy_config: Union[None, RelayProxyConnectionConfig] = None,
         subscriptions: "dict[str, Subscription]" = None,
+        verify_executor: Optional[Executor] = None,
+        verified_cache: Optional[VerifiedEventCache] = None,
     ) -> None:
-        self.url = url
-        self.policy = policy
-        self.message_pool = message_pool
-        self.subscriptions = subscriptions or {}
+        """
+        :param verify_executor: when set, inbound events are built and verified on
+            this executor instead of the websocket thread; messages still reach
+            the message pool in the order they were received. Each event is
+            submitted as soon as it arrives rather than batched for
+            `verify_many`, so none waits for a batch to fill.
+        :param verified_cache: signatures already verified, possibly shared with
+            other relays
+        """
+        super().__init__(url, message_pool, policy, subscriptions, verified_cache)
+        self.verify_executor = verify_executor
+        self._inbound: deque = deque()
+        self._inbound_lock: Lock = Lock()
 
         self.ssl_options = ssl_options
         self.proxy_config = proxy_config
 
-        self.lock: Lock = Lock()
         self.ws: WebSocketApp = WebSocketApp(
             self.url,
             on_open=self._on_open,
@@ -75,6 +194,8 @@ class Relay:
             on_pong=self._on_pong,
         )
         self.active = False
+        self.on_connection_change: Optional[Callable[[], None]] = None
+        self._connected = threading.Event()
 
     def connect(self):
         if not self.is_connected:
@@ -109,14 +230,19 @@ class Relay:
             time.sleep(1)
             self.connect()
 
-    def open_connections(self, ssl_options: dict = None):
+    def wait_until_connected(self, timeout: Optional[float] = None) -> bool:
+        """Block until the websocket handshake completed, or `timeout` seconds
+        passed; returns whether the relay is connected."""
+        return self._connected.wait(timeout) and self.is_connected
+
+    def open_connections(self, ssl_options: dict = None, timeout: float = 10.0):
         if ssl_options is None:
             ssl_options = {}
         self.ssl_options = ssl_options
         if not self.is_connected:
             threading.Thread(target=self.connect, name=f"{self.url}-thread").start()
-        time.sleep(2)
-        assert self.is_connected
+        if not self.wait_until_connected(timeout):
+            raise RelayException(f"Could not connect to {self.url} within {timeout}s")
 
     def close(self):
         if self.ws.sock:
@@ -132,44 +258,69 @@ class Relay:
             self.active = False
             logger.exception(f"failed to send message to {self.url}")
 
-    def add_subscription(self, id, filters: Filters):
-        with self.lock:
-            self.subscriptions[id] = Subscription(id, filters)
-
-    def close_subscription(self, id: str) -> None:
-        with self.lock:
-            self.subscriptions.pop(id)
-
-    def update_subscription(self, id: str, filters: Filters) -> None:
-        with self.lock:
-            subscription = self.subscriptions[id]
-            subscription.filters = filters
-
-    def __repr__(self):
-        return json.dumps(self.to_json_object(), indent=2)
-
-    def to_json_object(self) -> dict:
-        return {
-            "url": self.url,
-            "policy": self.policy.to_json_object(),
-            "subscriptions": [
-                subscription.to_json_object()
-                for subscription in self.subscriptions.values()
-            ],
-        }
-
     def _on_open(self, class_obj):
         self.active = time.time()
+        self._set_connected(True)
         # print(f"OPEN: {self.url}")
 
     def _on_close(self, class_obj, status_code, message):
         # print(f"CLOSE: {self.url} - {message}")
         self.active = False
+        self._set_connected(False)
+
+    def _set_connected(self, connected: bool):
+        if connected:
+            self._connected.set()
+        else:
+            self._connected.clear()
+        if self.on_connection_change is not None:
+            self.on_connection_change()
 
     def _on_message(self, class_obj, message: str = None):
         self.active = time.time()
-        if self._is_valid_message(message):
-            self.message_pool.add_message(message, self.url)
+        if self.verify_executor is not None:
+            self._dispatch_message(message)
+            return
+        parsed = self._parse_message(message)
+        if parsed is not None:
+            message_json, event = parsed
+            self.message_pool.add_message_json(message_json, self.url, event, message)
+
+    def _dispatch_message(self, message: str):
+        parsed = self._parse_message(message, build_event=False)
+        if parsed is None:
+            return
+        message_json, _ = parsed
+        future = None
+        if message_json[0] == RelayMessageType.EVENT:
+            future = self.verify_executor.submit(self._build_event, message_json)
+        with self._inbound_lock:
+            self._inbound.append((future, message_json, message))
+        if future is None:
+            self._drain_inbound()
+        else:
+            future.add_done_callback(self._drain_inbound)
+
+    def _drain_inbound(self, future: Optional[Future] = None):
+        """Forward dispatched messages to the pool, up to the first event that is
+        still being verified."""
+        with self._inbound_lock:
+            while self._inbound:
+                future, message_json, message = self._inbound[0]
+                if future is not None and not future.done():
+                    break
+                self._inbound.popleft()
+                event = None
+                if future is not None:
+                    try:
+                        event = future.result()
+                    except Exception:
+                        logger.exception(f"invalid event from {self.url}")
+                    if event is None:
+                        continue
+                self.message_pool.add_message_json(
+                    message_json, self.url, event, message
+                )
 
     def _on_data(self, class_obj, message: str, data_type, continue_flag):
         print(f"DATA: {self.url} - {message}")
@@ -177,6 +328,7 @@ class Relay:
     def _on_error(self, class_obj, error):
         # print(f"ERROR: {self.url}")
         self.active = False
+        self._set_connected(False)
         self.error_counter += 1
         if not self.error_threshold or self.error_counter <= self.error_threshold:
             self.check_reconnect()
@@ -186,35 +338,3 @@ class Relay:
 
     def _on_pong(self, class_obj, message):
         self.active = time.time()
-
-    def _is_valid_message(self, message: str) -> bool:
-        message = message.strip("\n")
-        if not message or message[0] != "[" or message[-1] != "]":
-            return False
-
-        message_json = json.loads(message)
-        message_type = message_json[0]
-        if not RelayMessageType.is_valid(message_type):
-            return False
-
-        if message_type == RelayMessageType.EVENT:
-            if not len(message_json) == 3:
-                return False
-
-            subscription_id = message_json[1]
-            with self.lock:
-                if subscription_id not in self.subscriptions:
-                    return False
-
-            event = Event.from_dict(message_json[2])
-
-            if not event.verify():
-                return False
-
-            with self.lock:
-                subscription = self.subscriptions[subscription_id]
-
-            if not subscription.filters.match(event):
-                return False
-
-        return True
@@ -1,29 +1,133 @@
-import json
 import ssl
 import threading
 import time
-from dataclasses import dataclass
-from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from threading import Condition, Lock
+from typing import Dict, List, Optional
 
+from . import codec
+from .bounded_queue import OverflowPolicy
+from .cache import VerifiedEventCache
+from .coalesce import RequestCoalescer
 from .event import Event
-from .filter import Filters
-from .message_pool import MessagePool
-from .relay import Relay, RelayPolicy, RelayProxyConnectionConfig
+from .filter import Filter, Filters
+from .message_pool import EndOfStoredEventsMessage, EventMessage, MessagePool, OkMessage
+from .message_type import ClientMessageType
+from .relay import Relay, RelayException, RelayPolicy, RelayProxyConnectionConfig
 from .request import Request
+from .sync_state import SyncState
 
+WAIT_FOR = ("all", "quorum", "any")
 
-class RelayException(Exception):
-    pass
+
+def _required(wait_for: str, total: int) -> int:
+    return {"all": total, "quorum": total // 2 + 1, "any": 1}[wait_for]
+
+
+@dataclass
+class PublishResult:
+    """Per-relay NIP-20 OK replies to a published event.
+
+    :param event_id: id of the published event
+    :param relays: urls the event was sent to
+    :param wait_for: "all", "quorum" or "any" of `relays` must accept the event
+    :param oks: OK message received from each relay that replied
+    """
+
+    event_id: str
+    relays: List[str]
+    wait_for: str = "all"
+    oks: Dict[str, OkMessage] = field(default_factory=dict)
+
+    @property
+    def accepted(self) -> List[str]:
+        return [url for url, ok in self.oks.items() if ok.accepted]
+
+    @property
+    def rejected(self) -> Dict[str, str]:
+        """Urls of the relays that refused the event, with their reason."""
+        return {url: ok.message for url, ok in self.oks.items() if not ok.accepted}
+
+    @property
+    def pending(self) -> List[str]:
+        return [url for url in self.relays if url not in self.oks]
+
+    @property
+    def ok(self) -> bool:
+        """Whether enough relays accepted the event."""
+        return len(self.accepted) >= max(1, _required(self.wait_for, len(self.relays)))
+
+    @property
+    def done(self) -> bool:
+        """Whether the outcome is known: enough relays accepted the event, or too
+        many refused it for that to still happen."""
+        required = max(1, _required(self.wait_for, len(self.relays)))
+        return self.ok or len(self.accepted) + len(self.pending) < required
+
+    def to_json_object(self) -> dict:
+        return {
+            url: None
+            if url not in self.oks
+            else {"accepted": self.oks[url].accepted, "message": self.oks[url].message}
+            for url in self.relays
+        }
 
 
 @dataclass
 class RelayManager:
+    """Manages connections to a set of relays sharing one message pool.
+
+    :param error_threshold: errors tolerated per relay before giving up reconnecting
+    :param verify_workers: verify inbound events on a pool of this many threads
+        shared by all relays, instead of on each relay's websocket thread
+    :param verified_cache_size: number of verified (id, signature) pairs
+        remembered across relays so duplicate copies skip verification; 0 disables
+    :param connect_timeout: default seconds `open_connections` waits for relays
+    :param max_events: size limit of the message pool's event queues, 0 for none
+    :param overflow: what the message pool does with events for a full queue,
+        see `BoundedQueue`
+    :param sync_state: remembers the newest event received per relay and filter;
+        requests sent to a relay then start from it, and the state is saved to
+        its file when connections are closed
+    :param coalesce: share relay subscriptions between the subscriptions added
+        with `add_subscription_on_all_relays`, merging their filters where
+        possible, and deliver each event under the ids of the subscriptions it
+        matches; see `RequestCoalescer`
+    :param max_subscriptions: relay subscriptions open at once per relay when
+        coalescing, 0 for no limit
+    """
+
     error_threshold: int = 0
+    verify_workers: int = 0
+    verified_cache_size: int = 65536
+    connect_timeout: float = 10.0
+    max_events: int = 0
+    overflow: str = OverflowPolicy.BLOCK
+    sync_state: Optional[SyncState] = None
+    coalesce: bool = False
+    max_subscriptions: int = 0
 
     def __post_init__(self):
         self.relays: dict[str, Relay] = {}
-        self.message_pool: MessagePool = MessagePool()
+        self.coalescer: Optional[RequestCoalescer] = None
+        if self.coalesce:
+            self.coalescer = RequestCoalescer(self.max_subscriptions)
+        self.message_pool: MessagePool = MessagePool(
+            max_events=self.max_events, overflow=self.overflow, router=self.coalescer
+        )
         self.lock: Lock = Lock()
+        self._connection_changed: Condition = Condition()
+        self.verify_executor = None
+        self.verified_cache = None
+        if self.verified_cache_size > 0:
+            self.verified_cache = VerifiedEventCache(self.verified_cache_size)
+        if self.verify_workers > 0:
+            self.verify_executor = ThreadPoolExecutor(
+                max_workers=self.verify_workers, thread_name_prefix="verify"
+            )
+        if self.sync_state is not None:
+            self.message_pool.add_message_listener(self._observe_sync)
 
     def add_relay(
         self,
@@ -32,9 +136,18 @@ class RelayManager:
         ssl_options: dict = None,
         proxy_config: RelayProxyConnectionConfig = None,
     ):
-        relay = Relay(url, self.message_pool, policy, ssl_options, proxy_config)
+        relay = Relay(
+            url,
+            self.message_pool,
+            policy,
+            ssl_options,
+            proxy_config,
+            verify_executor=self.verify_executor,
+            verified_cache=self.verified_cache,
+        )
         if self.error_threshold:
             relay.error_threshold = self.error_threshold
+        relay.on_connection_change = self._notify_connection_change
 
         with self.lock:
             self.relays[url] = relay
@@ -57,24 +170,72 @@ class RelayManager:
                 if relay.policy.should_read:
                     relay.add_subscription(id, filters)
 
-    def close_subscription(self):
-        for relay in self.relays.values():
-            relay.close_subscription(id)
+    def close_subscription(self, id: str):
+        with self.lock:
+            for relay in self.relays.values():
+                if id in relay.subscriptions:
+                    relay.close_subscription(id)
 
     def __enter__(self):
         # NOTE: This disables ssl certificate verification
         self.open_connections({"cert_reqs": ssl.CERT_NONE})
+        return self
 
-    def open_connections(self, ssl_options: dict = None):
+    def open_connections(
+        self,
+        ssl_options: dict = None,
+        timeout: Optional[float] = None,
+        wait_for: str = "all",
+    ) -> List[str]:
+        """Connect to the relays and return as soon as enough of them are up.
+
+        :param timeout: seconds to wait for the relays to connect, defaults to
+            `connect_timeout`
+        :param wait_for: "all" waits for every relay and then removes the ones
+            that did not connect within `timeout`; "quorum" returns once a
+            majority, "any" once one relay is connected, while the others keep
+            connecting in the background
+        :return: urls of the connected relays
+        :raises RelayException: if no relay, or fewer than `wait_for` requires,
+            connected within `timeout`
+        """
+        if timeout is None:
+            timeout = self.connect_timeout
+        if wait_for not in WAIT_FOR:
+            raise ValueError(f"wait_for must be one of {WAIT_FOR}, not {wait_for!r}")
         for relay in self.relays.values():
             if not relay.is_connected:
                 threading.Thread(
                     target=relay.connect,
                     name=f"{relay.url}-thread",
                 ).start()
-        time.sleep(2)
-        self.remove_closed_relays()
-        assert all(self.connection_statuses.values())
+
+        total = len(self.relays)
+        required = _required(wait_for, total)
+        deadline = time.monotonic() + timeout
+        with self._connection_changed:
+            self._connection_changed.wait_for(
+                lambda: self._connected_count() >= min(required, total),
+                max(0.0, deadline - time.monotonic()),
+            )
+
+        if wait_for == "all":
+            self.remove_closed_relays()
+            required = 1 if total else 0
+        connected = [url for url, up in self.connection_statuses.items() if up]
+        if len(connected) < required:
+            raise RelayException(
+                f"{len(connected)} of {total} relays connected within {timeout}s, "
+                f"{wait_for} required"
+            )
+        return connected
+
+    def _connected_count(self) -> int:
+        return sum(self.connection_statuses.values())
+
+    def _notify_connection_change(self):
+        with self._connection_changed:
+            self._connection_changed.notify_all()
 
     def __exit__(self, type, value, traceback):
         self.close_connections()
@@ -82,6 +243,10 @@ class RelayManager:
     def close_connections(self):
         for relay in self.relays.values():
             relay.close()
+        if self.verify_executor is not None:
+            self.verify_executor.shutdown(wait=False)
+        if self.sync_state is not None and self.sync_state.path:
+            self.sync_state.save()
 
         assert not any(self.connection_statuses.values())
 
@@ -101,33 +266,50 @@ class RelayManager:
                         is not configured to read from"
                     )
                 relay.add_subscription(id, filters)
-                request = Request(id, filters)
-                relay.publish(request.to_message())
+                relay.publish(self._request_message(url, id, filters))
             else:
                 raise RelayException(f"Invalid relay url: no connection to {url}")
 
     def add_subscription_on_all_relays(self, id: str, filters: Filters):
+        """Subscribe on the readable relays. When coalescing, the subscription
+        joins a shared relay subscription whose REQ is sent again with the
+        merged filters."""
         with self.lock:
-            for relay in self.relays.values():
-                if relay.policy.should_read:
-                    relay.add_subscription(id, filters)
-                    request = Request(id, filters)
-                    relay.publish(request.to_message())
+            if self.coalescer is not None:
+                if id in self.coalescer.subscriptions:
+                    self._update_on_all_relays(*self.coalescer.remove(id))
+                id, filters = self.coalescer.add(id, filters)
+            self._update_on_all_relays(id, filters)
 
     def close_subscription_on_relay(self, url: str, id: str):
         with self.lock:
             if url in self.relays:
                 relay = self.relays[url]
                 relay.close_subscription(id)
-                relay.publish(json.dumps(["CLOSE", id]))
+                relay.publish(codec.dumps(["CLOSE", id]))
             else:
                 raise RelayException(f"Invalid relay url: no connection to {url}")
 
     def close_subscription_on_all_relays(self, id: str):
+        """Unsubscribe on all relays. When coalescing, the shared relay
+        subscription is only closed once none of its subscriptions is left, and
+        requested again with the remaining filters until then."""
         with self.lock:
-            for relay in self.relays.values():
+            filters = None
+            if self.coalescer is not None and id in self.coalescer.subscriptions:
+                id, filters = self.coalescer.remove(id)
+            self._update_on_all_relays(id, filters)
+
+    def _update_on_all_relays(self, id: str, filters: Optional[Filters]):
+        """Send a REQ for `filters` to the readable relays, or a CLOSE to all
+        relays if None. The caller holds `self.lock`."""
+        for relay in self.relays.values():
+            if filters is None:
                 relay.close_subscription(id)
-                relay.publish(json.dumps(["CLOSE", id]))
+                relay.publish(codec.dumps(["CLOSE", id]))
+            elif relay.policy.should_read:
+                relay.add_subscription(id, filters)
+                relay.publish(self._request_message(relay.url, id, filters))
 
     def close_all_relay_connections(self):
         with self.lock:
@@ -145,13 +327,61 @@ class RelayManager:
         return dict(zip(self.relays.keys(), statuses))
 
     def publish_message(self, message: str):
+        """Send a message to the writable relays. With a `sync_state`, a REQ is
+        rewritten for each relay to start from the newest event it sent."""
+        request = None
+        if self.sync_state is not None:
+            message_json = codec.loads(message)
+            if message_json[0] == ClientMessageType.REQUEST:
+                filters = Filters([Filter.from_json(f) for f in message_json[2:]])
+                request = message_json[1], filters
         with self.lock:
             for relay in self.relays.values():
                 if relay.policy.should_write:
+                    if request is not None:
+                        message = self._request_message(relay.url, *request)
                     relay.publish(message)
 
-    def publish_event(self, event: Event):
-        """Verifies that the Event is publishable before submitting it to relays."""
+    def _request_message(self, url: str, id: str, filters: Filters) -> str:
+        if self.sync_state is not None:
+            filters = self.sync_state.rewrite(url, filters)
+        return Request(id, filters).to_message()
+
+    def _observe_sync(self, message) -> None:
+        if isinstance(message, EndOfStoredEventsMessage):
+            self.sync_state.end_of_stored_events(message.url, message.subscription_id)
+            return
+        if not isinstance(message, EventMessage):
+            return
+        relay = self.relays.get(message.url)
+        if relay is None:
+            return
+        # a coalesced event is recorded for the merged filters its REQ carried,
+        # which are the ones rewritten when that REQ is sent again
+        subscription_id = message.subscription_id
+        if self.coalescer is not None:
+            subscription_id = self.coalescer.relay_subscription_of(subscription_id)
+        with relay.lock:
+            subscription = relay.subscriptions.get(subscription_id)
+        if subscription is None or not subscription.filters:
+            return
+        event = message.event
+        for filter in subscription.filters:
+            if filter.matches(event):
+                self.sync_state.observe(
+                    message.url, message.subscription_id, filter, event.created_at
+                )
+
+    def publish_event(
+        self, event: Event, wait_for: Optional[str] = None, timeout: float = 10.0
+    ) -> Optional[PublishResult]:
+        """Verifies that the Event is publishable before submitting it to relays.
+
+        :param wait_for: None to return right away; otherwise "all", "quorum" or
+            "any" of the writable relays must accept the event, and the call
+            returns as soon as the outcome is known or `timeout` seconds passed
+        :return: the relays' OK replies when `wait_for` is set
+        """
         if event.signature is None:
             raise RelayException(f"Could not publish {event.id}: must be signed")
 
@@ -161,4 +391,31 @@ class RelayManager:
                 failed to verify signature {event.signature}"
             )
 
-        self.publish_message(event.to_message())
+        if wait_for is None:
+            self.publish_message(event.to_message())
+            return None
+
+        if wait_for not in WAIT_FOR:
+            raise ValueError(f"wait_for must be one of {WAIT_FOR}, not {wait_for!r}")
+        with self.lock:
+            urls = [url for url, r in self.relays.items() if r.policy.should_write]
+        result = PublishResult(event.id, urls, wait_for)
+        done = threading.Event()
+        result_lock = Lock()
+
+        def on_ok(ok: OkMessage):
+            with result_lock:
+                if ok.url in urls:
+                    result.oks[ok.url] = ok
+                if result.done:
+                    done.set()
+
+        self.message_pool.add_ok_listener(event.id, on_ok)
+        try:
+            self.publish_message(event.to_message())
+            if not result.done:
+                done.wait(timeout)
+        finally:
+            self.message_pool.remove_ok_listener(event.id, on_ok)
+        with result_lock:
+            return PublishResult(event.id, urls, wait_for, dict(result.oks))
@@ -1,4 +1,8 @@
-from .filter import Filters
+from collections import defaultdict
+from typing import Iterable
+
+from .event import Event
+from .filter import CompiledFilter, Filters
 
 
 class Subscription:
@@ -18,3 +22,103 @@ class Subscription:
             "batch": self.batch,
             "paused": self.paused,
         }
+
+
+class SubscriptionIndex:
+    """Finds the subscriptions whose filters match an Event.
+
+    Every filter is indexed under a single, most selective attribute: event ids,
+    then authors, then tag values, then kinds. Filters with none of those are
+    checked against every Event. Candidates found by hash lookups are then
+    confirmed with the compiled filter, so results equal `Filters.match` on each
+    subscription.
+
+    Filters are compiled when added; re-add a subscription after changing its
+    filters.
+
+    Not thread-safe: lock around `add`, `remove` and `match` when they are
+    called from several threads.
+    """
+
+    def __init__(self, subscriptions: Iterable[Subscription] = ()) -> None:
+        self.subscriptions: "dict[str, Subscription]" = {}
+        self._compiled: "dict[tuple, CompiledFilter]" = {}
+        self._by_id: "dict[str, set]" = defaultdict(set)
+        self._by_author: "dict[str, set]" = defaultdict(set)
+        self._by_tag: "dict[tuple, set]" = defaultdict(set)
+        self._by_kind: "dict[int, set]" = defaultdict(set)
+        self._unindexed: set = set()
+        for subscription in subscriptions:
+            self.add(subscription)
+
+    def _postings(self, compiled: CompiledFilter):
+        """Index lists and keys a filter is stored under."""
+        if compiled.event_ids is not None:
+            return self._by_id, compiled.event_ids
+        if compiled.authors is not None:
+            return self._by_author, compiled.authors
+        if compiled.tags:
+            f_tag, f_tag_values = compiled.tags[0]
+            return self._by_tag, [(f_tag, value) for value in f_tag_values]
+        if compiled.kinds is not None:
+            return self._by_kind, compiled.kinds
+        return None, None
+
+    def add(self, subscription: Subscription) -> None:
+        if subscription.id in self.subscriptions:
+            self.remove(subscription.id)
+        self.subscriptions[subscription.id] = subscription
+        for i, filter in enumerate(subscription.filters or []):
+            key = (subscription.id, i)
+            compiled = filter.compile()
+            self._compiled[key] = compiled
+            index, values = self._postings(compiled)
+            if index is None:
+                self._unindexed.add(key)
+                continue
+            for value in values:
+                index[value].add(key)
+
+    def remove(self, subscription_id: str) -> None:
+        subscription = self.subscriptions.pop(subscription_id)
+        for i in range(len(subscription.filters or [])):
+            key = (subscription_id, i)
+            compiled = self._compiled.pop(key)
+            index, values = self._postings(compiled)
+            if index is None:
+                self._unindexed.discard(key)
+                continue
+            for value in values:
+                keys = index[value]
+                keys.discard(key)
+                if not keys:
+                    del index[value]
+
+    def _candidates(self, event: Event) -> set:
+        candidates = set(self._unindexed)
+        if self._by_id:
+            candidates.update(self._by_id.get(event.id, ()))
+        candidates.update(self._by_author.get(event.public_key, ()))
+        candidates.update(self._by_kind.get(event.kind, ()))
+        if self._by_tag:
+            for e_tag in event.tags:
+                if len(e_tag) > 1:
+                    candidates.update(self._by_tag.get((e_tag[0], e_tag[1]), ()))
+        return candidates
+
+    def match(self, event: Event) -> "set[str]":
+        """Ids of the subscriptions with at least one filter matching the Event."""
+        matched = set()
+        for key in self._candidates(event):
+            if key[0] not in matched and self._compiled[key].matches(event):
+                matched.add(key[0])
+        return matched
+
+    def __len__(self):
+        return len(self.subscriptions)
+
+    def __repr__(self):
+        return (
+            f"SubscriptionIndex({len(self)} subscriptions, "
+            f"{len(self._compiled)} filters)"
+        )
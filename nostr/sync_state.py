@@ -0,0 +1,128 @@
+"""Newest event received per relay and filter, to only request newer ones.
+
+The state is kept per (relay url, filter fingerprint), the fingerprint ignoring
+the filter's `since`, `until` and `limit`, and saved as JSON between runs.
+"""
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Optional, Set, Tuple
+
+from .filter import Filter, Filters
+
+# attributes that do not change which events a filter selects over time
+_WINDOW_KEYS = ("since", "until", "limit")
+
+logger = logging.getLogger(__name__)
+
+
+def fingerprint(filter: Filter) -> str:
+    """A digest of what `filter` selects, regardless of order within its lists
+    and of its time window."""
+    encoded = filter.canonical_json(_WINDOW_KEYS)
+    return hashlib.sha256(encoded.encode()).hexdigest()[:32]
+
+
+class SyncState:
+    """Newest `created_at` received per (relay url, filter).
+
+    Events received for a subscription before its relay sent EOSE only count
+    once EOSE arrives, since a relay sends its stored events newest first and an
+    interrupted run would otherwise skip the older ones next time.
+
+    :param path: JSON file the state is loaded from and saved to, if any
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path
+        self.lock = Lock()
+        self._newest: Dict[str, Dict[str, int]] = {}
+        # newest created_at per (url, subscription id, fingerprint) before EOSE
+        self._pending: Dict[Tuple[str, str, str], int] = {}
+        self._stored_events_sent: Set[Tuple[str, str]] = set()
+
+    @classmethod
+    def load(cls, path: str) -> "SyncState":
+        """The state saved at `path`, or an empty one if there is none or it
+        cannot be read, which only means requesting the events again."""
+        state = cls(path)
+        try:
+            with open(path) as file:
+                newest = json.load(file)
+            if not isinstance(newest, dict):
+                raise ValueError(f"expected an object, got {type(newest).__name__}")
+        except FileNotFoundError:
+            return state
+        except ValueError as e:
+            logger.warning(f"ignoring corrupt sync state {path}: {e}")
+            return state
+        state._newest = newest
+        return state
+
+    def save(self, path: Optional[str] = None) -> None:
+        path = Path(path or self.path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self.lock:
+            content = json.dumps(self._newest, indent=2, sort_keys=True)
+        temporary = path.with_name(path.name + ".tmp")
+        temporary.write_text(content)
+        os.replace(temporary, path)
+
+    def get(self, url: str, filter: Filter) -> Optional[int]:
+        with self.lock:
+            return self._newest.get(url, {}).get(fingerprint(filter))
+
+    def update(self, url: str, filter: Filter, created_at: int) -> None:
+        self._update(url, fingerprint(filter), created_at)
+
+    def _update(self, url: str, key: str, created_at: int) -> None:
+        with self.lock:
+            newest = self._newest.setdefault(url, {})
+            if created_at > newest.get(key, created_at - 1):
+                newest[key] = created_at
+
+    def rewrite(self, url: str, filters: Filters) -> Filters:
+        """Copies of `filters` starting at the newest event already received from
+        `url` for each of them. `since` is inclusive, so events of that second
+        are requested again rather than missed."""
+        rewritten = Filters()
+        for filter in filters:
+            newest = self.get(url, filter)
+            if newest is not None and (not filter.since or filter.since < newest):
+                filter = Filter.from_json(filter.to_json_object())
+                filter.since = newest
+            rewritten.append(filter)
+        return rewritten
+
+    def observe(
+        self, url: str, subscription_id: str, filter: Filter, created_at: int
+    ) -> None:
+        """Record an event received from `url` for a subscription's filter."""
+        key = fingerprint(filter)
+        with self.lock:
+            if (url, subscription_id) not in self._stored_events_sent:
+                pending_key = (url, subscription_id, key)
+                newest = self._pending.get(pending_key, created_at)
+                self._pending[pending_key] = max(newest, created_at)
+                return
+        self._update(url, key, created_at)
+
+    def end_of_stored_events(self, url: str, subscription_id: str) -> None:
+        """Commit the events received for the subscription until its EOSE."""
+        with self.lock:
+            self._stored_events_sent.add((url, subscription_id))
+            committed = [
+                (key[2], created_at)
+                for key, created_at in self._pending.items()
+                if key[:2] == (url, subscription_id)
+            ]
+            for key, _ in committed:
+                del self._pending[(url, subscription_id, key)]
+        for key, created_at in committed:
+            self._update(url, key, created_at)
+
+    def __repr__(self):
+        return f"SyncState({self.path}: {len(self._newest)} relays)"
@@ -1,3 +1,4 @@
+import dataclasses
 import json
 
 
@@ -8,3 +9,26 @@ class obj:
 
 def dict2obj(d):
     return json.loads(json.dumps(d), object_hook=obj)
+
+
+def add_slots(cls):
+    """Recreate a dataclass with `__slots__` for its fields, like
+    `dataclass(slots=True)` on Python 3.10+.
+
+    Instances then have no per-instance `__dict__`. Methods of the class must not
+    use zero-argument `super()`, which would still refer to the original class.
+    """
+    cls_dict = dict(cls.__dict__)
+    field_names = tuple(f.name for f in dataclasses.fields(cls))
+    inherited = {
+        name for base in cls.__mro__[1:] for name in getattr(base, "__slots__", ())
+    }
+    cls_dict["__slots__"] = tuple(name for name in field_names if name not in inherited)
+    for name in field_names:
+        # drop the class attributes holding defaults, they would shadow the slots
+        cls_dict.pop(name, None)
+    cls_dict.pop("__dict__", None)
+    cls_dict.pop("__weakref__", None)
+    new_cls = type(cls)(cls.__name__, cls.__bases__, cls_dict)
+    new_cls.__qualname__ = cls.__qualname__
+    return new_cls
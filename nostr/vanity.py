@@ -0,0 +1,207 @@
+"""Vanity npub search.
+
+Successive keys are derived by point addition, secret k + 1 having public key
+P + G, instead of a full scalar multiplication per key. Prefixes are compared
+on the leading bits of the x coordinate and suffixes on its trailing bits and
+on the bech32 checksum, which is computed from per-byte tables since it is an
+affine function of the key bits; no key is bech32 encoded.
+"""
+import secrets
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import coincurve as secp256k1
+from coincurve._libsecp256k1 import ffi, lib
+
+from . import bech32
+
+CURVE_ORDER = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+GENERATOR = secp256k1.PublicKey.from_secret((1).to_bytes(32, "big"))
+HRP = "npub"
+# 5-bit groups encoding a 32 byte key, the last one holds 1 bit and padding
+DATA_LENGTH = 52
+CHECKSUM_LENGTH = 6
+# consecutive keys tried from each random starting key
+SEARCH_BATCH = 10000
+
+
+def _checksum_tables() -> Tuple[int, List[List[int]]]:
+    """Return the checksum of the zero key and, for each key byte and value, what
+    it XORs into the checksum."""
+    hrp = bech32.bech32_hrp_expand(HRP)
+
+    def checksum(x: int) -> int:
+        data = bech32.convertbits(x.to_bytes(32, "big"), 8, 5)
+        return bech32.bech32_polymod(hrp + data + [0] * CHECKSUM_LENGTH) ^ 1
+
+    base = checksum(0)
+    bits = [checksum(1 << (255 - i)) ^ base for i in range(256)]
+    tables = []
+    for byte in range(32):
+        table = [0] * 256
+        for value in range(1, 256):
+            low = value & -value
+            table[value] = table[value ^ low] ^ bits[byte * 8 + 8 - low.bit_length()]
+        tables.append(table)
+    return base, tables
+
+
+_CHECKSUM_BASE, _CHECKSUM_TABLES = _checksum_tables()
+
+
+def npub_checksum(x: bytes) -> int:
+    """The 30-bit bech32 checksum of the npub of x-only key `x`."""
+    checksum = _CHECKSUM_BASE
+    for table, value in zip(_CHECKSUM_TABLES, x):
+        checksum ^= table[value]
+    return checksum
+
+
+def _values(pattern: str) -> int:
+    value = 0
+    for char in pattern:
+        value = value << 5 | bech32.CHARSET.index(char)
+    return value
+
+
+class VanityPattern:
+    """Characters an npub must start with after "npub1" and/or end with."""
+
+    def __init__(self, prefix: Optional[str] = None, suffix: Optional[str] = None):
+        if not prefix and not suffix:
+            raise ValueError("Expected at least one of 'prefix' or 'suffix' arguments")
+        for pattern in [prefix, suffix]:
+            missing_chars = [c for c in pattern or "" if c not in bech32.CHARSET]
+            if missing_chars:
+                raise ValueError(
+                    f"{missing_chars} not in valid "
+                    f"list of bech32 chars: ({bech32.CHARSET})"
+                )
+        self.prefix = prefix or None
+        self.suffix = suffix or None
+
+        # prefix: leading bits of the key
+        prefix = prefix or ""
+        if len(prefix) >= DATA_LENGTH:
+            raise ValueError(f"Prefix {prefix!r} is longer than the key")
+        self.prefix_shift = 256 - 5 * len(prefix)
+        self.prefix_value = _values(prefix)
+
+        # suffix: trailing bits of the key shifted by the padding, and checksum
+        suffix = suffix or ""
+        if len(suffix) > DATA_LENGTH - len(prefix) + CHECKSUM_LENGTH:
+            raise ValueError(f"Suffix {suffix!r} overlaps the prefix")
+        checksum = suffix[-CHECKSUM_LENGTH:]
+        data = suffix[: len(suffix) - len(checksum)]
+        self.checksum_mask = (1 << 5 * len(checksum)) - 1
+        self.checksum_value = _values(checksum)
+        self.data_mask = (1 << 5 * len(data)) - 1
+        self.data_value = _values(data)
+        if self.data_value & 0xF:
+            raise ValueError(
+                f"Suffix {suffix!r} cannot occur: the last key character is "
+                f"{bech32.CHARSET[0]!r} or {bech32.CHARSET[16]!r}"
+            )
+
+    @property
+    def needs_checksum(self) -> bool:
+        return self.checksum_mask != 0
+
+    def matches(self, x: int, checksum: Optional[int] = None) -> bool:
+        """Whether the npub of x-only key `x` matches; `checksum` is required if
+        `needs_checksum`."""
+        return (
+            x >> self.prefix_shift == self.prefix_value
+            and (x << 4) & self.data_mask == self.data_value
+            and (
+                checksum is None or checksum & self.checksum_mask == self.checksum_value
+            )
+        )
+
+    def __repr__(self):
+        return f"VanityPattern(prefix={self.prefix!r}, suffix={self.suffix!r})"
+
+
+class VanityMiner:
+    """Tries consecutive secret keys against several patterns at once.
+
+    :param patterns: an npub matching any of them is accepted
+    """
+
+    def __init__(self, patterns: Sequence[VanityPattern]) -> None:
+        if not patterns:
+            raise ValueError("Expected at least one pattern")
+        self.patterns = list(patterns)
+        # prefix-only patterns are looked up by their leading bits
+        self._prefixes: Dict[int, Dict[int, VanityPattern]] = {}
+        self._others = []
+        for pattern in self.patterns:
+            if pattern.suffix is None:
+                by_value = self._prefixes.setdefault(pattern.prefix_shift, {})
+                by_value.setdefault(pattern.prefix_value, pattern)
+            else:
+                self._others.append(pattern)
+        self._needs_checksum = any(p.needs_checksum for p in self._others)
+
+    def search(
+        self, raw_secret: bytes, count: int
+    ) -> Tuple[Optional[bytes], Optional[VanityPattern]]:
+        """Try the `count` secret keys following `raw_secret`, `raw_secret`
+        included, and return the first matching one with its pattern."""
+        prefixes = list(self._prefixes.items())
+        others = self._others
+        needs_checksum = self._needs_checksum
+
+        for offset, x_bytes in enumerate(x_coordinates(raw_secret, count)):
+            x = int.from_bytes(x_bytes, "big")
+            match = None
+            for shift, by_value in prefixes:
+                match = by_value.get(x >> shift)
+                if match is not None:
+                    break
+            if match is None and others:
+                checksum = npub_checksum(x_bytes) if needs_checksum else None
+                for pattern in others:
+                    if pattern.matches(x, checksum):
+                        match = pattern
+                        break
+            if match is not None:
+                return add_to_secret(raw_secret, offset), match
+        return None, None
+
+
+def x_coordinates(raw_secret: bytes, count: int) -> Iterator[bytes]:
+    """Yield the x-only public keys of the `count` secret keys following
+    `raw_secret`, `raw_secret` included."""
+    ctx = GENERATOR.context.ctx
+    combine = lib.secp256k1_ec_pubkey_combine
+    serialize = lib.secp256k1_ec_pubkey_serialize
+    compressed = lib.SECP256K1_EC_COMPRESSED
+    current = ffi.new("secp256k1_pubkey *")
+    following = ffi.new("secp256k1_pubkey *")
+    ffi.memmove(current, secp256k1.PublicKey.from_secret(raw_secret).public_key, 64)
+    summands = ffi.new("secp256k1_pubkey *[2]")
+    summands[1] = GENERATOR.public_key
+    output = ffi.new("unsigned char[33]")
+    output_length = ffi.new("size_t *", 33)
+    buffer = ffi.buffer(output)
+
+    for _ in range(count):
+        serialize(ctx, output, output_length, current, compressed)
+        yield buffer[1:]
+        summands[0] = current
+        combine(ctx, following, summands, 2)
+        current, following = following, current
+
+
+def add_to_secret(raw_secret: bytes, offset: int) -> bytes:
+    """The secret key `offset` keys after `raw_secret`."""
+    secret = (int.from_bytes(raw_secret, "big") + offset) % CURVE_ORDER
+    return secret.to_bytes(32, "big")
+
+
+def random_secret(batch: int = SEARCH_BATCH) -> bytes:
+    """A random secret key that stays valid for the next `batch` increments."""
+    while True:
+        secret = secrets.token_bytes(32)
+        if 0 < int.from_bytes(secret, "big") < CURVE_ORDER - batch:
+            return secret
@@ -1,10 +1,14 @@
 import json
+import os
+import tempfile
 import unittest
 from unittest.mock import ANY
 
 from click.testing import CliRunner
 
-from nostr.commands.key import convert, create
+from nostr.commands.key import convert, create, mine, progress_file_for, vanity
+from nostr.key import PrivateKey
+from nostr.pow import MiningProgress, count_leading_zero_bits
 
 
 class TestCLIKey(unittest.TestCase):
@@ -56,3 +60,86 @@ class TestCLIKey(unittest.TestCase):
         # THEN
         self.assertEqual(result.exit_code, 0)
         self.assertEqual(json.loads(result.output), {"npub": ANY, "hex": hex})
+
+    def test_vanity(self):
+        # GIVEN
+        runner = CliRunner()
+
+        # WHEN
+        result = runner.invoke(
+            vanity, ['-p', '2', '-p', '3', '-s', 'x', '--workers', 1]
+        )
+
+        # THEN
+        self.assertEqual(result.exit_code, 0)
+        output = json.loads(result.output)
+        npub = output["Public key"]
+        self.assertTrue(npub[5] in "23" and npub.endswith("x"))
+        self.assertEqual(
+            PrivateKey.from_nsec(output["Private key"]).public_key.bech32(), npub
+        )
+
+    def test_vanity_invalid_pattern(self):
+        # GIVEN
+        runner = CliRunner()
+
+        # WHEN
+        result = runner.invoke(vanity, ['-p', 'b'])
+
+        # THEN
+        self.assertEqual(result.exit_code, 2)
+
+    def test_mine(self):
+        # GIVEN
+        runner = CliRunner()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "progress.json")
+
+            # WHEN
+            result = runner.invoke(
+                mine, ['-d', 8, '--workers', 1, '--progress-file', path]
+            )
+
+            # THEN
+            self.assertEqual(result.exit_code, 0)
+            output = json.loads(result.output)
+            self.assertGreaterEqual(count_leading_zero_bits(output["Hex"]), 8)
+            self.assertFalse(os.path.exists(path))
+
+    def test_mine_resume(self):
+        # GIVEN
+        runner = CliRunner()
+        private_key = PrivateKey()
+        while private_key.public_key.raw_bytes[0] >= 0x80:
+            private_key = PrivateKey()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "progress.json")
+            MiningProgress(1, 1000, 1.0, 1, private_key.hex()).save(path)
+
+            # WHEN
+            result = runner.invoke(mine, ['-d', 1, '--progress-file', path])
+
+            # THEN
+            self.assertEqual(result.exit_code, 0)
+            self.assertIn("Resuming", result.output)
+            output = json.loads(result.output[result.output.index("{") :])
+            self.assertEqual(output["Private key"], private_key.bech32())
+            self.assertEqual(output["Guesses"], 1000)
+
+    def test_mine_refuses_progress_of_other_difficulty(self):
+        # GIVEN
+        runner = CliRunner()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "progress.json")
+            MiningProgress(30, 1000, 1.0, 12, PrivateKey().hex()).save(path)
+
+            # WHEN
+            result = runner.invoke(mine, ['-d', 10, '--progress-file', path])
+
+            # THEN
+            self.assertIn("difficulty 30", result.output)
+            self.assertNotIn("Private key", result.output)
+            self.assertEqual(MiningProgress.load(path).difficulty, 30)
+
+    def test_mine_default_progress_file_per_difficulty(self):
+        self.assertNotEqual(progress_file_for(10), progress_file_for(30))
@@ -1,4 +1,7 @@
 import json
+import os
+import tempfile
+import time
 import unittest
 from unittest import mock
 from unittest.mock import ANY, MagicMock, patch
@@ -7,7 +10,15 @@ from click.testing import CliRunner
 
 from nostr.commands.message import cli
 from nostr.event import Event
-from nostr.message_pool import EventMessage
+from nostr.key import PrivateKey
+from nostr.message_pool import EventMessage, MessagePool, OkMessage
+from nostr.pow import count_leading_zero_bits
+from nostr.relay_manager import PublishResult
+
+RELAY = "wss://any.relay"
+PUBLISHED = PublishResult(
+    "id", [RELAY], "any", {RELAY: OkMessage("", RELAY, "id", True, "")}
+)
 
 
 class TestCLIMessage(unittest.TestCase):
@@ -22,6 +33,7 @@ class TestCLIMessage(unittest.TestCase):
         mock_relay_manager.return_value = mock_manager
         mock_manager.__enter__.return_value = mock_manager
         mock_manager.add_relay.return_value = None
+        mock_manager.publish_event.return_value = PUBLISHED
 
         # WHEN
         result = runner.invoke(
@@ -32,9 +44,37 @@ class TestCLIMessage(unittest.TestCase):
 
         # THEN
         self.assertEqual(result.exit_code, 0)
-        self.assertEqual(json.loads(result.output), {"Message": message})
+        self.assertEqual(
+            json.loads(result.output),
+            {"Message": message, "Relays": {RELAY: {"accepted": True, "message": ""}}},
+        )
         mock_manager.add_relay.assert_has_calls([mock.call(ANY), mock.call(ANY)])
-        mock_manager.publish_message.assert_called()
+        mock_manager.publish_event.assert_called()
+
+    @patch('nostr.commands.message.RelayManager', autospec=True)
+    def test_publish_with_pow(self, mock_relay_manager):
+        # GIVEN
+        nsec = "nsec1lrjqzalcev9ard0274pu8ynwx0xzzexh56sfn0c97rumh8f2tfcqd3lf8h"
+        runner = CliRunner()
+
+        mock_manager = MagicMock()
+        mock_relay_manager.return_value = mock_manager
+        mock_manager.__enter__.return_value = mock_manager
+        mock_manager.publish_event.return_value = PUBLISHED
+
+        # WHEN
+        result = runner.invoke(
+            cli,
+            ['publish', '-s', nsec, '-m', "pow", '-d', 8, '--workers', 1],
+            catch_exceptions=False,
+        )
+
+        # THEN
+        self.assertEqual(result.exit_code, 0)
+        event = mock_manager.publish_event.call_args.args[0]
+        self.assertEqual(event.tags[0][0], "nonce")
+        self.assertGreaterEqual(count_leading_zero_bits(event.id), 8)
+        self.assertTrue(event.verify())
 
     @patch('nostr.commands.message.RelayManager', autospec=True)
     def test_send(self, mock_relay_manager):
@@ -48,6 +88,7 @@ class TestCLIMessage(unittest.TestCase):
         mock_relay_manager.return_value = mock_manager
         mock_manager.__enter__.return_value = mock_manager
         mock_manager.add_relay.return_value = None
+        mock_manager.publish_event.return_value = PUBLISHED
 
         # WHEN
         result = runner.invoke(
@@ -57,7 +98,10 @@ class TestCLIMessage(unittest.TestCase):
 
         # THEN
         self.assertEqual(result.exit_code, 0)
-        self.assertEqual(json.loads(result.output), {"Message": message})
+        self.assertEqual(
+            json.loads(result.output),
+            {"Message": message, "Relays": {RELAY: {"accepted": True, "message": ""}}},
+        )
         mock_manager.add_relay.assert_has_calls([mock.call(ANY), mock.call(ANY)])
         mock_manager.publish_event.assert_called()
 
@@ -97,3 +141,124 @@ class TestCLIMessage(unittest.TestCase):
         mock_manager.message_pool.get_event.assert_called()
         mock_manager.message_pool.has_notices.assert_called()
         mock_manager.message_pool.get_notice.assert_not_called()
+
+    @patch('nostr.commands.message.RelayManager', autospec=True)
+    def test_receive_stream_until_eose(self, mock_relay_manager):
+        # GIVEN
+        npub = "npub1mg2nzunrsk9df94zr3uudhzltnu6lzq2muax09xmhu5gxxrvnkqsvpjg3p"
+        runner = CliRunner()
+        relays = ["wss://relay1", "wss://relay2"]
+
+        mock_manager = MagicMock()
+        mock_relay_manager.return_value = mock_manager
+        mock_manager.__enter__.return_value = mock_manager
+        mock_manager.connection_statuses = {url: True for url in relays}
+        message_pool = MessagePool()
+        mock_manager.message_pool = message_pool
+        events = [Event(content="first"), Event(content="second")]
+        for event, url in zip(events, relays):
+            message_pool.add_message(json.dumps(["EVENT", "sub", event.to_dict()]), url)
+            message_pool.add_message(json.dumps(["EOSE", "sub"]), url)
+
+        # WHEN
+        start = time.monotonic()
+        result = runner.invoke(cli, ['receive', '-p', npub, '--stream', '-t', 5])
+
+        # THEN
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual(result.exit_code, 0)
+        lines = result.output.splitlines()
+        self.assertEqual(
+            [json.loads(line) for line in lines], [e.to_dict() for e in events]
+        )
+
+    @patch('nostr.commands.message.RelayManager', autospec=True)
+    def test_receive_timeout_without_eose(self, mock_relay_manager):
+        # GIVEN
+        npub = "npub1mg2nzunrsk9df94zr3uudhzltnu6lzq2muax09xmhu5gxxrvnkqsvpjg3p"
+        runner = CliRunner()
+
+        mock_manager = MagicMock()
+        mock_relay_manager.return_value = mock_manager
+        mock_manager.__enter__.return_value = mock_manager
+        mock_manager.connection_statuses = {"wss://relay1": True}
+        mock_manager.message_pool = MessagePool()
+
+        # WHEN
+        start = time.monotonic()
+        result = runner.invoke(cli, ['receive', '-p', npub, '-t', 0.3])
+
+        # THEN
+        self.assertGreaterEqual(time.monotonic() - start, 0.3)
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(json.loads(result.output)["Events"], [])
+
+    @patch('nostr.commands.message.RelayManager', autospec=True)
+    def test_receive_with_db(self, mock_relay_manager):
+        # GIVEN
+        private_key = PrivateKey()
+        npub = private_key.public_key.bech32()
+        runner = CliRunner()
+        relay = "wss://relay1"
+        events = [
+            Event(content=f"note {i}", public_key=private_key.public_key.hex())
+            for i in range(2)
+        ]
+        events[0].created_at = 1000
+        events[1].created_at = 2000
+
+        def receive(path, new_events):
+            mock_manager = MagicMock()
+            mock_relay_manager.return_value = mock_manager
+            mock_manager.__enter__.return_value = mock_manager
+            mock_manager.connection_statuses = {relay: True}
+            message_pool = MessagePool()
+            mock_manager.message_pool = message_pool
+            for event in new_events:
+                message = json.dumps(["EVENT", "sub", event.to_dict()])
+                message_pool.add_message(message, relay)
+            message_pool.add_message(json.dumps(["EOSE", "sub"]), relay)
+            result = runner.invoke(cli, ['receive', '-p', npub, '--db', path])
+            request = json.loads(mock_manager.publish_message.call_args.args[0])
+            return result, request[2]
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "events.db")
+
+            # WHEN
+            first, first_filter = receive(path, events[:1])
+            second, second_filter = receive(path, events[1:])
+
+        # THEN
+        self.assertEqual(first.exit_code, 0)
+        self.assertNotIn("since", first_filter)
+        self.assertEqual(json.loads(first.output)["Events"], ["note 0"])
+        self.assertEqual(second.exit_code, 0)
+        self.assertEqual(second_filter["since"], 1000)
+        self.assertEqual(json.loads(second.output)["Events"], ["note 0", "note 1"])
+
+    @patch('nostr.commands.message.RelayManager', autospec=True)
+    def test_receive_with_sync(self, mock_relay_manager):
+        # GIVEN
+        npub = "npub1mg2nzunrsk9df94zr3uudhzltnu6lzq2muax09xmhu5gxxrvnkqsvpjg3p"
+        runner = CliRunner()
+        mock_manager = MagicMock()
+        mock_relay_manager.return_value = mock_manager
+        mock_manager.__enter__.return_value = mock_manager
+        mock_manager.message_pool = MessagePool()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "sync.json")
+
+            # WHEN
+            result = runner.invoke(
+                cli, ['receive', '-p', npub, '--sync', '--sync-file', path]
+            )
+            plain = runner.invoke(cli, ['receive', '-p', npub])
+
+        # THEN
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(plain.exit_code, 0)
+        first, second = mock_relay_manager.call_args_list
+        self.assertEqual(first.kwargs["sync_state"].path, path)
+        self.assertIsNone(second.kwargs["sync_state"])
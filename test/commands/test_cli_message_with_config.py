@@ -9,7 +9,13 @@ from click.testing import CliRunner
 
 from nostr.commands.message import cli
 from nostr.event import Event
-from nostr.message_pool import EventMessage
+from nostr.message_pool import EventMessage, OkMessage
+from nostr.relay_manager import PublishResult
+
+RELAY = "wss://any.relay"
+PUBLISHED = PublishResult(
+    "id", [RELAY], "any", {RELAY: OkMessage("", RELAY, "id", True, "")}
+)
 
 
 class TestCLIMessageWithConfig(unittest.TestCase):
@@ -28,6 +34,7 @@ class TestCLIMessageWithConfig(unittest.TestCase):
         mock_relay_manager.return_value = mock_manager
         mock_manager.__enter__.return_value = mock_manager
         mock_manager.add_relay.return_value = None
+        mock_manager.publish_event.return_value = PUBLISHED
 
         # WHEN
         result = runner.invoke(
@@ -38,9 +45,12 @@ class TestCLIMessageWithConfig(unittest.TestCase):
 
         # THEN
         self.assertEqual(result.exit_code, 0)
-        self.assertEqual(json.loads(result.output), {"Message": message})
+        self.assertEqual(
+            json.loads(result.output),
+            {"Message": message, "Relays": {RELAY: {"accepted": True, "message": ""}}},
+        )
         mock_manager.add_relay.assert_has_calls([mock.call(ANY), mock.call(ANY)])
-        mock_manager.publish_message.assert_called()
+        mock_manager.publish_event.assert_called()
 
     @patch('nostr.commands.message.RelayManager', autospec=True)
     def test_send(self, mock_relay_manager):
@@ -52,6 +62,7 @@ class TestCLIMessageWithConfig(unittest.TestCase):
         mock_relay_manager.return_value = mock_manager
         mock_manager.__enter__.return_value = mock_manager
         mock_manager.add_relay.return_value = None
+        mock_manager.publish_event.return_value = PUBLISHED
 
         # WHEN
         result = runner.invoke(
@@ -61,7 +72,10 @@ class TestCLIMessageWithConfig(unittest.TestCase):
 
         # THEN
         self.assertEqual(result.exit_code, 0)
-        self.assertEqual(json.loads(result.output), {"Message": message})
+        self.assertEqual(
+            json.loads(result.output),
+            {"Message": message, "Relays": {RELAY: {"accepted": True, "message": ""}}},
+        )
         mock_manager.add_relay.assert_has_calls([mock.call(ANY), mock.call(ANY)])
         mock_manager.publish_event.assert_called()
 
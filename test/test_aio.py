@@ -0,0 +1,107 @@
+import asyncio
+import json
+import unittest
+
+from nostr.event import Event
+from nostr.filter import Filter, Filters
+from nostr.key import PrivateKey
+from nostr.relay_manager import RelayException
+
+try:
+    from websockets.asyncio.server import serve
+
+    from nostr.aio import AsyncRelayManager
+except ImportError:  # pragma: no cover
+    serve = None
+
+
+class StubRelay:
+    """In-process relay answering REQ with stored events and EOSE, and EVENT
+    with OK."""
+
+    def __init__(self, events):
+        self.events = events
+        self.received = []
+
+    async def handler(self, ws):
+        async for message in ws:
+            message_json = json.loads(message)
+            self.received.append(message_json)
+            if message_json[0] == "REQ":
+                subscription_id = message_json[1]
+                for event in self.events:
+                    await ws.send(json.dumps(["EVENT", subscription_id, event]))
+                await ws.send(json.dumps(["EOSE", subscription_id]))
+            elif message_json[0] == "EVENT":
+                await ws.send(json.dumps(["OK", message_json[1]["id"], True, ""]))
+
+
+@unittest.skipIf(serve is None, "websockets is not installed")
+class TestAsyncRelayManager(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.pk = PrivateKey()
+        events = []
+        for i in range(5):
+            event = Event(content=f"event {i}")
+            event.sign(self.pk.hex())
+            events.append(event.to_dict())
+        self.stub = StubRelay(events)
+        self.server = await serve(self.stub.handler, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        self.urls = [f"ws://127.0.0.1:{port}/{i}" for i in range(2)]
+
+    async def asyncTearDown(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def test_subscribe_and_iterate(self):
+        async with AsyncRelayManager() as manager:
+            for url in self.urls:
+                manager.add_relay(url)
+            await manager.open_connections()
+            self.assertTrue(all(manager.connection_statuses.values()))
+
+            await manager.add_subscription_on_all_relays("sub", Filters([Filter()]))
+            received = [message async for message in manager.events(timeout=0.5)]
+
+        # copies from the second relay are deduplicated by the pool
+        self.assertEqual(len(received), 5)
+        self.assertEqual({message.subscription_id for message in received}, {"sub"})
+        eose = manager.message_pool.get_all()["eose"]
+        self.assertEqual({notice.url for notice in eose}, set(self.urls))
+        self.assertFalse(any(manager.connection_statuses.values()))
+
+    async def test_publish_event(self):
+        event = Event(content="Hello, world!")
+        async with AsyncRelayManager() as manager:
+            manager.add_relay(self.urls[0])
+            await manager.open_connections()
+            with self.assertRaisesRegex(RelayException, "must be signed"):
+                await manager.publish_event(event)
+
+            event.sign(self.pk.hex())
+            await manager.publish_event(event)
+            await asyncio.sleep(0.1)
+
+        self.assertEqual(self.stub.received, [["EVENT", event.to_dict()]])
+        self.assertTrue(manager.message_pool.has_ok_notices())
+
+    async def test_publish_event_wait_for_ok(self):
+        event = Event(content="Hello, world!")
+        event.sign(self.pk.hex())
+        async with AsyncRelayManager() as manager:
+            for url in self.urls:
+                manager.add_relay(url)
+            await manager.open_connections()
+            result = await manager.publish_event(event, wait_for="all", timeout=5)
+
+        self.assertTrue(result.ok)
+        self.assertEqual(set(result.accepted), set(self.urls))
+
+    async def test_unreachable_relay_removed(self):
+        manager = AsyncRelayManager(connect_timeout=1)
+        manager.add_relay(self.urls[0])
+        manager.add_relay("ws://127.0.0.1:1")
+        await manager.open_connections()
+        self.assertEqual(list(manager.relays), [self.urls[0]])
+        await manager.close_connections()
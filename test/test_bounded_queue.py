@@ -0,0 +1,84 @@
+import threading
+import time
+import unittest
+from queue import Empty, Full
+
+from nostr.bounded_queue import BoundedQueue, OverflowPolicy
+from nostr.event import Event
+from nostr.message_pool import EventMessage
+
+
+class TestBoundedQueue(unittest.TestCase):
+    def drain(self, queue):
+        items = []
+        while True:
+            try:
+                items.append(queue.get_nowait())
+            except Empty:
+                return items
+
+    def test_unknown_policy(self):
+        with self.assertRaisesRegex(ValueError, "Unknown overflow policy"):
+            BoundedQueue(1, "ignore")
+
+    def test_unbounded(self):
+        for policy in ("block", "drop-oldest", "drop-newest", "spill"):
+            with self.subTest(policy=policy):
+                queue = BoundedQueue(0, policy)
+                for i in range(100):
+                    queue.put(i)
+                self.assertEqual(self.drain(queue), list(range(100)))
+                self.assertEqual(queue.dropped, 0)
+
+    def test_drop_oldest(self):
+        queue = BoundedQueue(3, OverflowPolicy.DROP_OLDEST)
+        for i in range(5):
+            queue.put(i)
+        self.assertEqual(queue.qsize(), 3)
+        self.assertEqual(queue.dropped, 2)
+        self.assertEqual(self.drain(queue), [2, 3, 4])
+
+    def test_drop_newest(self):
+        queue = BoundedQueue(3, OverflowPolicy.DROP_NEWEST)
+        for i in range(5):
+            queue.put(i)
+        self.assertEqual(queue.dropped, 2)
+        self.assertEqual(self.drain(queue), [0, 1, 2])
+
+    def test_block(self):
+        queue = BoundedQueue(1, OverflowPolicy.BLOCK)
+        queue.put(0)
+        with self.assertRaises(Full):
+            queue.put(1, timeout=0.05)
+
+        def consume():
+            time.sleep(0.05)
+            queue.get()
+
+        thread = threading.Thread(target=consume)
+        thread.start()
+        queue.put(1, timeout=1)
+        thread.join()
+        self.assertEqual(self.drain(queue), [1])
+        self.assertEqual(queue.dropped, 0)
+
+    def test_spill_keeps_order(self):
+        queue = BoundedQueue(4, OverflowPolicy.SPILL)
+        messages = [
+            EventMessage(Event(content=str(i)), "sub", "ws://relay") for i in range(10)
+        ]
+        for message in messages[:7]:
+            queue.put(message)
+        self.assertEqual((len(queue.queue), queue.qsize(), queue.spilled), (4, 7, 3))
+        received = [queue.get_nowait() for _ in range(5)]
+        for message in messages[7:]:
+            queue.put(message)
+        received += self.drain(queue)
+
+        self.assertEqual(
+            [message.event.content for message in received],
+            [message.event.content for message in messages],
+        )
+        self.assertEqual(received[9].event.id, messages[9].event.id)
+        self.assertEqual(queue.dropped, 0)
+        queue.close()
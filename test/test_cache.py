@@ -0,0 +1,68 @@
+import unittest
+from unittest.mock import patch
+
+from nostr.cache import EventDeduplicator, VerifiedEventCache
+
+
+class TestVerifiedEventCache(unittest.TestCase):
+    def test_hits_and_misses(self):
+        cache = VerifiedEventCache()
+        self.assertFalse(cache.contains("aa" * 32, "bb" * 64))
+        cache.add("aa" * 32, "bb" * 64)
+        self.assertTrue(cache.contains("aa" * 32, "bb" * 64))
+        # same id with another signature is a different entry
+        self.assertFalse(cache.contains("aa" * 32, "cc" * 64))
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_lru_eviction(self):
+        cache = VerifiedEventCache(capacity=2)
+        cache.add("01" * 32, "00" * 64)
+        cache.add("02" * 32, "00" * 64)
+        # touch the oldest entry so the second one gets evicted
+        self.assertTrue(cache.contains("01" * 32, "00" * 64))
+        cache.add("03" * 32, "00" * 64)
+        self.assertEqual(len(cache), 2)
+        self.assertTrue(cache.contains("01" * 32, "00" * 64))
+        self.assertFalse(cache.contains("02" * 32, "00" * 64))
+        self.assertTrue(cache.contains("03" * 32, "00" * 64))
+
+
+class TestEventDeduplicator(unittest.TestCase):
+    def test_per_subscription(self):
+        dedupe = EventDeduplicator()
+        self.assertFalse(dedupe.seen("sub1", "aa" * 32))
+        self.assertTrue(dedupe.seen("sub1", "aa" * 32))
+        self.assertFalse(dedupe.seen("sub2", "aa" * 32))
+        self.assertEqual(len(dedupe), 2)
+
+    def test_capacity(self):
+        dedupe = EventDeduplicator(capacity=2)
+        for i in range(3):
+            dedupe.seen("sub", f"{i:064x}")
+        self.assertEqual(len(dedupe), 2)
+        # the oldest entry was evicted
+        self.assertFalse(dedupe.seen("sub", f"{0:064x}"))
+        self.assertTrue(dedupe.seen("sub", f"{2:064x}"))
+
+    @patch("nostr.cache.time.monotonic")
+    def test_ttl(self, monotonic):
+        dedupe = EventDeduplicator(capacity=0, ttl=60)
+        monotonic.return_value = 0
+        dedupe.seen("sub", "aa" * 32)
+        monotonic.return_value = 30
+        dedupe.seen("sub", "bb" * 32)
+        monotonic.return_value = 61
+        self.assertTrue(dedupe.seen("sub", "bb" * 32))
+        self.assertEqual(len(dedupe), 1)
+        self.assertFalse(dedupe.seen("sub", "aa" * 32))
+
+    def test_bloom(self):
+        dedupe = EventDeduplicator(capacity=1000, bloom=True)
+        ids = [f"{i:064x}" for i in range(2500)]
+        self.assertFalse(any(dedupe.seen("sub", event_id) for event_id in ids))
+        # the last generations are remembered, the oldest was rotated out
+        self.assertTrue(all(dedupe.seen("sub", event_id) for event_id in ids[-1000:]))
+        self.assertLessEqual(len(dedupe), 2000)
+
+        with self.assertRaises(ValueError):
+            EventDeduplicator(capacity=0, bloom=True)
@@ -0,0 +1,163 @@
+import sys
+import threading
+import unittest
+
+from nostr.coalesce import RequestCoalescer, merge_filters
+from nostr.event import Event
+from nostr.filter import Filter, Filters
+from nostr.message_pool import MessagePool
+
+
+def json_array(filters):
+    return [filter.to_json_object() for filter in filters]
+
+
+class TestMergeFilters(unittest.TestCase):
+    def test_union_of_authors(self):
+        filters = [
+            Filter(authors=["a"], kinds=[1], since=10),
+            Filter(authors=["b", "a"], kinds=[1], since=10),
+            Filter(authors=["c"], kinds=[0], since=10),
+        ]
+        self.assertEqual(
+            json_array(merge_filters(filters)),
+            [
+                {"authors": ["a", "b"], "kinds": [1], "since": 10},
+                {"authors": ["c"], "kinds": [0], "since": 10},
+            ],
+        )
+        # the original filters are left as they were
+        self.assertEqual(filters[0].authors, ["a"])
+
+    def test_union_of_event_ids(self):
+        filters = [Filter(event_ids=["x"]), Filter(event_ids=["y"])]
+        self.assertEqual(json_array(merge_filters(filters)), [{"ids": ["x", "y"]}])
+
+    def test_any_author_absorbs_authors(self):
+        filters = [Filter(authors=["a"], kinds=[1]), Filter(kinds=[1])]
+        self.assertEqual(json_array(merge_filters(filters)), [{"kinds": [1]}])
+
+    def test_incompatible_filters_are_kept(self):
+        filters = [
+            Filter(authors=["a"], kinds=[1]),
+            Filter(authors=["b"], kinds=[1], until=5),
+            Filter(authors=["c"], kinds=[1], pubkey_refs=["p"]),
+            Filter(authors=["a"], event_ids=["x"]),
+            Filter(authors=["b"], event_ids=["y"]),
+        ]
+        self.assertEqual(len(merge_filters(filters)), len(filters))
+
+    def test_limited_filters_are_not_merged(self):
+        filters = [Filter(authors=["a"], limit=5), Filter(authors=["b"], limit=5)]
+        self.assertEqual(merge_filters(filters), filters)
+
+    def test_keeps_arbitrary_tags(self):
+        first, second = Filter(authors=["a"]), Filter(authors=["b"])
+        for filter in (first, second):
+            filter.add_arbitrary_tag("t", ["nostr"])
+        self.assertEqual(
+            json_array(merge_filters([first, second])),
+            [{"authors": ["a", "b"], "#t": ["nostr"]}],
+        )
+
+
+class TestRequestCoalescer(unittest.TestCase):
+    def test_compatible_subscriptions_share_a_request(self):
+        coalescer = RequestCoalescer()
+        id1, _ = coalescer.add("a", Filters([Filter(authors=["a"], kinds=[1])]))
+        id2, filters2 = coalescer.add("b", Filters([Filter(authors=["b"], kinds=[1])]))
+        self.assertEqual(id1, id2)
+        self.assertEqual(
+            filters2.to_json_array(), [{"authors": ["a", "b"], "kinds": [1]}]
+        )
+
+        id3, _ = coalescer.add("c", Filters([Filter(kinds=[0])]))
+        self.assertNotEqual(id3, id1)
+        self.assertEqual(len(coalescer.relay_subscriptions), 2)
+
+    def test_subscription_limit(self):
+        coalescer = RequestCoalescer(max_subscriptions=2)
+        ids = {
+            coalescer.add(str(kind), Filters([Filter(kinds=[kind])]))[0]
+            for kind in range(5)
+        }
+        self.assertEqual(len(ids), 2)
+        requested = [
+            f.to_json_object()
+            for filters in coalescer.relay_subscriptions.values()
+            for f in filters
+        ]
+        self.assertEqual(len(requested), 5)
+
+    def test_remove(self):
+        coalescer = RequestCoalescer()
+        id, _ = coalescer.add("a", Filters([Filter(authors=["a"])]))
+        coalescer.add("b", Filters([Filter(authors=["b"])]))
+        removed_id, filters = coalescer.remove("a")
+        self.assertEqual(removed_id, id)
+        self.assertEqual(filters.to_json_array(), [{"authors": ["b"]}])
+        self.assertEqual(coalescer.remove("b"), (id, None))
+        self.assertEqual(coalescer.relay_subscriptions, {})
+
+        coalescer.add("c", Filters())
+        with self.assertRaises(ValueError):
+            coalescer.add("c", Filters())
+
+    def test_route(self):
+        coalescer = RequestCoalescer()
+        id, _ = coalescer.add("a", Filters([Filter(authors=["a"], kinds=[1])]))
+        coalescer.add("b", Filters([Filter(authors=["b"], kinds=[1])]))
+        coalescer.add("any", Filters([Filter(kinds=[1])]))
+        event = Event(public_key="b", kind=1)
+        self.assertEqual(coalescer.route(id, event), ["b", "any"])
+        self.assertEqual(coalescer.route_eose(id), ["a", "b", "any"])
+        self.assertIsNone(coalescer.route("other", event))
+        self.assertEqual(coalescer.relay_subscription_of("a"), id)
+        self.assertEqual(coalescer.relay_subscription_of("other"), "other")
+
+    def test_message_pool_router(self):
+        coalescer = RequestCoalescer()
+        id, _ = coalescer.add("a", Filters([Filter(authors=["a"])]))
+        coalescer.add("b", Filters([Filter(authors=["b"])]))
+        pool = MessagePool(router=coalescer)
+        event = Event(public_key="a", kind=1)
+        pool.add_message_json(["EVENT", id, event.to_dict()], "wss://relay")
+        pool.add_message_json(["EVENT", id, event.to_dict()], "wss://relay")
+        pool.add_message_json(["EOSE", id], "wss://relay")
+        pool.add_message_json(["EVENT", "other", event.to_dict()], "wss://relay")
+
+        results = pool.get_all()
+        self.assertEqual([m.subscription_id for m in results["events"]], ["a", "other"])
+        self.assertEqual([m.subscription_id for m in results["eose"]], ["a", "b"])
+
+    def test_route_while_subscribing(self):
+        """Events are routed on relay threads while subscriptions change."""
+        coalescer = RequestCoalescer()
+        id, _ = coalescer.add("a", Filters([Filter(authors=["a"])]))
+        event = Event(public_key="a", kind=1)
+        stop = threading.Event()
+        errors = []
+
+        def subscribe():
+            try:
+                while not stop.is_set():
+                    for i in range(20):
+                        coalescer.add(str(i), Filters([Filter(authors=[str(i)])]))
+                    for i in range(20):
+                        coalescer.remove(str(i))
+            except Exception as e:
+                errors.append(e)
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        thread = threading.Thread(target=subscribe)
+        thread.start()
+        try:
+            for _ in range(5000):
+                self.assertEqual(coalescer.route(id, event), ["a"])
+                self.assertEqual(coalescer.route_eose(id)[0], "a")
+        finally:
+            stop.set()
+            thread.join()
+            sys.setswitchinterval(interval)
+        self.assertEqual(errors, [])
@@ -0,0 +1,123 @@
+import importlib.util
+import json
+import unittest
+from hashlib import sha256
+
+from nostr import codec
+from nostr.event import Event, EventKind
+
+PUBKEY = "f3c25355c29f64ea8e9b4e11b583ac0a7d0d8235f156cffec2b73e5756aab206"
+
+# (public_key, created_at, kind, tags, content, expected id)
+KNOWN_EVENTS = [
+    (
+        "da15317263858ad496a21c79c6dc5f5cf9af880adf3a6794dbbf2883186c9d81",
+        1671406583,
+        EventKind.TEXT_NOTE,
+        [],
+        "Hello Nostr!",
+        "23411895658d374ec922adf774a70172290b2c738ae67815bd8945e5d8fff3bb",
+    ),
+    (
+        PUBKEY,
+        1674819397,
+        EventKind.ENCRYPTED_DIRECT_MESSAGE,
+        [["p", "a1db8e8b047e1350958a55e0a853151d0e1f685fa5cf3772e01bccc5aa5cb2eb"]],
+        "VOqWLiW4wv8+fDsNC00a1w==?iv=LSIH1sk13Mw09PV8Z80sag==",
+        "46c76ec67d03babdb840254b3667585143cc499497b0a6a40aedc9ce2de41670",
+    ),
+]
+
+CONTENTS = [
+    "",
+    "plain ascii",
+    "héllo ünïcode",
+    "日本語のテキスト",
+    "emoji 🤙🏽 and zwj 👩\u200d👩\u200d👧",
+    "\x00\x01\x1f control chars",
+    "\b\f\n\r\t short escapes",
+    'quote " backslash \\ slash /',
+    "\u2028\u2029 line separators",
+    "\x7f delete",
+    "\ufeff byte order mark",
+    "</script><>&'",
+    "a" * 4096,
+]
+
+TAGS = [
+    [],
+    [["e", "5c83da77af1dec6d7289834998ad7aafbd9e2191396d75ec3cc27f5a77226f36"]],
+    [["p", PUBKEY, "wss://relay.example.com/"], ["t", "nostr"]],
+    [["nonce", "776797", "20"]],
+    [["t", "ünïcode"], ["r", "https://example.com/?a=1&b=2"]],
+    [["emoji", "🤙", "\n"]],
+]
+
+KINDS = [0, EventKind.TEXT_NOTE, EventKind.RELAY_LIST_METADATA, 30023]
+
+CREATED_AT = [0, 1674819397, 2**32, 2**63 - 1, 2**70]
+
+
+def _reference_id(public_key, created_at, kind, tags, content):
+    data = [0, public_key, created_at, kind, tags, content]
+    serialized = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+    return sha256(serialized.encode()).hexdigest()
+
+
+def _corpus():
+    for content in CONTENTS:
+        for tags in TAGS:
+            yield PUBKEY, 1674819397, EventKind.TEXT_NOTE, tags, content
+    for kind in KINDS:
+        for created_at in CREATED_AT:
+            yield PUBKEY, created_at, kind, TAGS[2], CONTENTS[4]
+
+
+def _available_backends():
+    return [
+        name
+        for name in codec.BACKENDS
+        if name == "json" or importlib.util.find_spec(name) is not None
+    ]
+
+
+class TestCodec(unittest.TestCase):
+    def setUp(self):
+        self.default_backend = codec.get_backend()
+
+    def tearDown(self):
+        codec.set_backend(self.default_backend)
+
+    def test_unknown_backend(self):
+        with self.assertRaisesRegex(ValueError, "Unknown JSON backend"):
+            codec.set_backend("yaml")
+
+    def test_event_ids_match_across_backends(self):
+        """Every backend must hash events exactly like the stdlib serialization."""
+        for backend in _available_backends():
+            codec.set_backend(backend)
+            for args in _corpus():
+                with self.subTest(backend=backend, args=args):
+                    self.assertEqual(Event.compute_id(*args), _reference_id(*args))
+            for *args, expected in KNOWN_EVENTS:
+                with self.subTest(backend=backend, args=args):
+                    self.assertEqual(Event.compute_id(*args), expected)
+
+    def test_roundtrip_across_backends(self):
+        message = ["EVENT", "sub", {"content": CONTENTS[4], "tags": TAGS[2], "n": 1}]
+        for backend in _available_backends():
+            codec.set_backend(backend)
+            with self.subTest(backend=backend):
+                self.assertEqual(codec.loads(codec.dumps(message)), message)
+                self.assertEqual(json.loads(codec.dumps(message)), message)
+
+    def test_stdlib_fallback(self):
+        """Values a backend rejects are handled like the stdlib would."""
+        for backend in _available_backends():
+            codec.set_backend(backend)
+            with self.subTest(backend=backend):
+                self.assertEqual(codec.loads('["\\ud800"]'), ["\ud800"])
+                with self.assertRaises(ValueError):
+                    codec.loads("[")
+                with self.assertRaises(UnicodeEncodeError):
+                    codec.canonical_dumps(["\ud800"])
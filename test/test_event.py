@@ -1,10 +1,12 @@
+import pickle
 import time
 import unittest
-from unittest.mock import ANY
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import ANY, patch
 
 import pytest
 
-from nostr.event import EncryptedDirectMessage, Event, EventKind
+from nostr.event import EncryptedDirectMessage, Event, EventKind, verify_many
 from nostr.key import PrivateKey
 
 
@@ -54,6 +56,48 @@ class TestEvent(unittest.TestCase):
         # Recomputed id should now be different
         assert event.id != event_id
 
+    def test_event_id_is_memoized(self):
+        """Should hash the Event once while none of the id fields change."""
+        event = Event(content="some event")
+        with patch.object(Event, "compute_id", wraps=Event.compute_id) as compute:
+            event_id = event.id
+            self.assertEqual(event.id, event_id)
+            event.to_dict()
+            self.assertEqual(compute.call_count, 1)
+
+    def test_event_id_invalidated_on_change(self):
+        """Should recompute the id after any id field or tag list changes."""
+        event = Event(content="some event")
+        ids = {event.id}
+
+        event.content = "other content"
+        ids.add(event.id)
+        event.kind = EventKind.REACTION
+        ids.add(event.id)
+        event.add_pubkey_ref("some_pubkey")
+        ids.add(event.id)
+        event.add_event_ref("some_event_id")
+        ids.add(event.id)
+        event.tags[0][1] = "other_pubkey"
+        event.clear_cache()
+        ids.add(event.id)
+        self.assertEqual(len(ids), 6)
+
+        # the signature is not part of the id
+        event.signature = "signature"
+        self.assertIn(event.id, ids)
+
+    def test_slots(self):
+        """Events should not carry a per-instance __dict__ and survive pickling."""
+        event = Event(content="some event")
+        self.assertFalse(hasattr(event, "__dict__"))
+        with self.assertRaises(AttributeError):
+            event.undefined_attribute = 1
+
+        copy = pickle.loads(pickle.dumps(event))
+        self.assertEqual(copy, event)
+        self.assertEqual(copy.id, event.id)
+
     def test_add_event_ref(self):
         """Should add an 'e' tag for each event_ref added."""
         some_event_id = "some_event_id"
@@ -113,6 +157,51 @@ class TestEvent(unittest.TestCase):
         actual = event.to_dict()
         self.assertEqual(actual, {**expected, **{"id": ANY}})
 
+    def test_from_dict_verify(self):
+        """Inbound mode should check the wire id and signature exactly once."""
+        event = Event(content="Hello, world!")
+        event.sign(self.sender_pk.hex())
+        wire = event.to_dict()
+
+        with patch("nostr.event.PublicKey.verify", return_value=True) as verify:
+            inbound = Event.from_dict(wire, verify=True)
+            self.assertTrue(inbound.verify())
+            self.assertTrue(inbound.verify())
+            self.assertEqual(verify.call_count, 1)
+
+        # a relay lying about the id fails without checking the signature
+        with patch("nostr.event.PublicKey.verify") as verify:
+            forged = Event.from_dict({**wire, "id": "00" * 32}, verify=True)
+            self.assertFalse(forged.verify())
+            verify.assert_not_called()
+
+        # changing the event after verification requires a new check
+        inbound = Event.from_dict(wire, verify=True)
+        inbound.content = "Tampered"
+        self.assertFalse(inbound.verify())
+
+    def test_verify_many(self):
+        """Batch verification should match Event.verify for every pool type."""
+        events = []
+        for i in range(8):
+            event = Event(content=f"event {i}")
+            event.sign(self.sender_pk.hex())
+            events.append(event.to_dict())
+        events[3]["content"] = "Tampered"
+        events[5]["sig"] = "00" * 64
+        expected = [i not in (3, 5) for i in range(8)]
+
+        for kwargs in [{}, {"workers": 4}, {"workers": 2, "processes": True}]:
+            with self.subTest(**kwargs):
+                batch = [Event.from_dict(event) for event in events]
+                self.assertEqual(verify_many(batch, **kwargs), expected)
+                self.assertEqual([event.verify() for event in batch], expected)
+                self.assertEqual(batch[0].id, events[0]["id"])
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            batch = [Event.from_dict(event) for event in events]
+            self.assertEqual(verify_many(batch, executor=executor), expected)
+
     def test_decrypt_event(self):
         dm1 = Event.from_dict(
             {
@@ -170,6 +259,13 @@ class TestEncryptedDirectMessage(unittest.TestCase):
     #     with self.assertRaisesRegex(Exception, "cannot use"):
     #         Event(content="My message!", kind=EventKind.ENCRYPTED_DIRECT_MESSAGE)
 
+    def test_slots(self):
+        dm = EncryptedDirectMessage(
+            cleartext_content="Secret message!", recipient_pubkey=self.recipient_pubkey
+        )
+        self.assertFalse(hasattr(dm, "__dict__"))
+        self.assertIsInstance(dm, Event)
+
     def test_recipient_p_tag(self):
         """Should generate recipient 'p' tag."""
         dm = EncryptedDirectMessage(
@@ -0,0 +1,173 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from nostr.event import Event
+from nostr.event_log import EventLog
+from nostr.message_pool import MessagePool
+
+
+class TestEventLog(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+        self.events = [
+            Event(content=f"event {i}", public_key="ab" * 32, created_at=1000 + i)
+            for i in range(50)
+        ]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_append_and_get(self):
+        with EventLog(self.path) as log:
+            self.assertEqual(log.append_many(self.events), 50)
+            self.assertFalse(log.append(self.events[0]))
+            self.assertEqual(len(log), 50)
+            event = log.get(self.events[7].id)
+            self.assertEqual(event.to_dict(), self.events[7].to_dict())
+            self.assertEqual(json.loads(log.get_raw(self.events[7].id))["id"], event.id)
+            self.assertIn(self.events[3].id, log)
+            self.assertIsNone(log.get("00" * 32))
+
+    def test_rotation_and_reopen(self):
+        with EventLog(self.path, segment_size=2000) as log:
+            log.append_many(self.events)
+            self.assertGreater(len(log.segments), 5)
+            for segment in log.segments:
+                self.assertLessEqual(segment.size, 2000)
+        index_files = [f for f in os.listdir(self.path) if f.endswith(".idx")]
+        self.assertTrue(index_files)
+
+        with EventLog(self.path, segment_size=2000) as log:
+            self.assertEqual(len(log), 50)
+            self.assertEqual(log.get(self.events[0].id).content, "event 0")
+            self.assertEqual(log.get(self.events[-1].id).content, "event 49")
+            log.append(Event(content="more", created_at=2000))
+            self.assertEqual(len(log), 51)
+
+    def test_between(self):
+        with EventLog(self.path, segment_size=2000) as log:
+            log.append_many(self.events)
+            events = list(log.between(1010, 1014))
+            self.assertEqual([e.created_at for e in events], list(range(1010, 1015)))
+            self.assertEqual(len(list(log.between())), 50)
+            self.assertEqual(len(list(log.between(since=1045))), 5)
+            self.assertEqual(list(log.between(until=999)), [])
+
+    def test_recover_incomplete_record(self):
+        with EventLog(self.path) as log:
+            log.append_many(self.events[:3])
+            active = log.segments[-1].path
+        with open(active, "ab") as file:
+            file.write(b"\x10\x00\x00\x00truncated")
+
+        with EventLog(self.path) as log:
+            self.assertEqual(len(log), 3)
+            log.append(self.events[3])
+            self.assertEqual(len(list(log.between())), 4)
+
+    def test_compact(self):
+        with EventLog(self.path, segment_size=2000) as log:
+            log.append_many(self.events)
+            segments = len(log.segments)
+            removed = log.compact(
+                before=1020, keep=lambda event: event.created_at % 2 == 0
+            )
+            sealed_events = sum(segment.count for segment in log.segments[:-1])
+            self.assertGreater(removed, 20)
+            self.assertLess(len(log.segments), segments)
+            self.assertIsNone(log.get(self.events[0].id))
+            self.assertEqual(log.get(self.events[20].id).content, "event 20")
+            self.assertEqual(len(log), 50 - removed)
+
+        with EventLog(self.path, segment_size=2000) as log:
+            self.assertEqual(len(log), 50 - removed)
+            self.assertEqual(
+                sum(segment.count for segment in log.segments[:-1]), sealed_events
+            )
+            self.assertEqual(len(list(log.between())), 50 - removed)
+
+    def test_compact_interrupted(self):
+        """Events kept by a compaction that stops while swapping segments are
+        still in the log when it is opened again."""
+        keep = [event for event in self.events if event.created_at % 2 == 0]
+        for replaced in range(4):
+            with self.subTest(replaced=replaced):
+                with tempfile.TemporaryDirectory() as path:
+                    log = EventLog(path, segment_size=2000)
+                    log.append_many(self.events)
+                    replace = os.replace
+                    calls = []
+
+                    def crash(source, destination):
+                        if len(calls) == replaced:
+                            raise OSError("crash")
+                        calls.append(source)
+                        replace(source, destination)
+
+                    with patch("nostr.event_log.os.replace", side_effect=crash):
+                        with self.assertRaises(OSError):
+                            log.compact(keep=lambda e: e.created_at % 2 == 0)
+                    log.close()
+
+                    with EventLog(path, segment_size=2000) as log:
+                        for event in keep:
+                            self.assertEqual(log.get(event.id).content, event.content)
+
+    def test_append_while_compacting(self):
+        """Events can be appended and read while a compaction runs."""
+        extra = [
+            Event(content=f"extra {i}", public_key="cd" * 32, created_at=2000 + i)
+            for i in range(30)
+        ]
+        with EventLog(self.path, segment_size=2000) as log:
+            log.append_many(self.events)
+
+            def keep(event):
+                if extra:
+                    log.append(extra.pop())
+                self.assertIsNotNone(log.get(self.events[1].id))
+                return event.created_at % 2 == 0
+
+            appended = list(extra)
+            removed = log.compact(keep=keep)
+            self.assertGreater(removed, 20)
+            self.assertEqual(len(log), 80 - removed)
+            self.assertEqual(log.get(self.events[0].id).content, "event 0")
+            self.assertIsNone(log.get(self.events[1].id))
+            for event in appended:
+                self.assertEqual(log.get(event.id).content, event.content)
+
+        with EventLog(self.path, segment_size=2000) as log:
+            self.assertEqual(len(log), 80 - removed)
+            self.assertEqual(len(list(log.between())), 80 - removed)
+
+    def test_removes_files_of_unfinished_compaction(self):
+        with EventLog(self.path) as log:
+            log.append_many(self.events)
+        for name in ("0000000000.log.tmp", "0000000000.idx.tmp"):
+            with open(os.path.join(self.path, name), "wb") as file:
+                file.write(b"partial")
+        with EventLog(self.path) as log:
+            self.assertEqual(len(log), 50)
+        self.assertFalse([name for name in os.listdir(self.path) if ".tmp" in name])
+
+    def test_attach_message_pool(self):
+        message_pool = MessagePool()
+        with EventLog(self.path) as log:
+            log.attach(message_pool)
+            event = self.events[0]
+            message_pool.add_message(
+                json.dumps(["EVENT", "sub", event.to_dict()]), "wss://relay1"
+            )
+            log.detach(message_pool)
+            self.assertIn(event.id, log)
+            # the event is still queued for the pool's consumers
+            self.assertEqual(message_pool.get_event(block=False).event.id, event.id)
+            message_pool.add_message(
+                json.dumps(["EVENT", "sub", self.events[1].to_dict()]), "wss://relay1"
+            )
+            self.assertNotIn(self.events[1].id, log)
@@ -0,0 +1,111 @@
+import json
+import os
+import tempfile
+import unittest
+
+from nostr.event import Event, EventKind
+from nostr.event_store import EventStore
+from nostr.filter import Filter, Filters
+from nostr.key import PrivateKey
+from nostr.message_pool import MessagePool
+
+
+class TestEventStore(unittest.TestCase):
+    def setUp(self):
+        self.keys = [PrivateKey().public_key.hex() for _ in range(3)]
+        self.events = []
+        for i in range(30):
+            event = Event(
+                content=f"event {i}",
+                public_key=self.keys[i % 3],
+                created_at=1000 + i,
+                kind=[EventKind.TEXT_NOTE, EventKind.SET_METADATA][i % 2],
+            )
+            if i % 5 == 0:
+                event.add_pubkey_ref(self.keys[0])
+            if i % 7 == 0:
+                event.add_event_ref(f"{i:064x}")
+            self.events.append(event)
+        self.store = EventStore()
+        self.store.add_events(self.events)
+
+    def tearDown(self):
+        self.store.close()
+
+    def assert_query_matches(self, filter: Filter):
+        expected = [e for e in self.events if filter.matches(e)]
+        expected.sort(key=lambda e: e.created_at, reverse=True)
+        if filter.limit:
+            expected = expected[: filter.limit]
+        self.assertEqual(
+            [e.id for e in self.store.query(filter)], [e.id for e in expected]
+        )
+
+    def test_query_matches_filter(self):
+        filters = [
+            Filter(),
+            Filter(authors=[self.keys[1]]),
+            Filter(kinds=[EventKind.SET_METADATA], since=1010, until=1020),
+            Filter(event_ids=[self.events[3].id, self.events[4].id]),
+            Filter(pubkey_refs=[self.keys[0]]),
+            Filter(pubkey_refs=[self.keys[0]], event_refs=[f"{0:064x}"]),
+            Filter(authors=self.keys[:2], limit=4),
+        ]
+        tagged = Filter()
+        tagged.add_arbitrary_tag("e", [f"{7:064x}", f"{14:064x}"])
+        filters.append(tagged)
+        for filter in filters:
+            with self.subTest(filter=filter):
+                self.assert_query_matches(filter)
+
+    def test_query_several_filters(self):
+        filters = Filters(
+            [Filter(authors=[self.keys[0]], limit=2), Filter(kinds=[0], limit=2)]
+        )
+        events = self.store.query(filters)
+        self.assertEqual([e.created_at for e in events], [1029, 1027, 1024])
+
+    def test_stored_events(self):
+        event = self.events[5]
+        stored = self.store.get_event(event.id)
+        self.assertEqual(stored.to_dict(), event.to_dict())
+        self.assertIn(event.id, self.store)
+        self.assertEqual(len(self.store), 30)
+        self.assertFalse(self.store.add_event(event))
+        self.assertIsNone(self.store.get_event("0" * 64))
+
+    def test_newest_created_at(self):
+        self.assertEqual(self.store.newest_created_at(), 1029)
+        self.assertEqual(
+            self.store.newest_created_at(Filter(authors=[self.keys[1]], limit=1)),
+            1028,
+        )
+        self.assertIsNone(self.store.newest_created_at(Filter(authors=["x"])))
+        self.assertIsNone(EventStore().newest_created_at())
+
+    def test_persistent_wal_database(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "events.db")
+            with EventStore(path) as store:
+                store.add_events(self.events[:3])
+                mode = store._connection.execute("PRAGMA journal_mode").fetchone()
+                self.assertEqual(mode[0], "wal")
+            with EventStore(path) as store:
+                self.assertEqual(len(store), 3)
+
+    def test_attach_message_pool(self):
+        store = EventStore()
+        message_pool = MessagePool()
+        store.attach(message_pool)
+        event = self.events[0]
+        message = json.dumps(["EVENT", "sub", event.to_dict()])
+        message_pool.add_message(message, "wss://relay1")
+        self.assertIn(event.id, store)
+        # the event is still delivered to the pool's consumers
+        self.assertEqual(message_pool.get_event(block=False).event.id, event.id)
+        store.detach(message_pool)
+        message_pool.add_message(
+            json.dumps(["EVENT", "sub", self.events[1].to_dict()]), "wss://relay1"
+        )
+        self.assertEqual(len(store), 1)
+        store.close()
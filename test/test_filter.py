@@ -372,6 +372,31 @@ class TestFilter(unittest.TestCase):
         for event in self.pk1_thread[:1] + self.pk2_thread + self.pk1_pk2_dms[1:]:
             assert filter.matches(event) is False
 
+    def test_compiled_filter(self):
+        """Should match through frozensets and refresh when the filter changes."""
+        follows = [PrivateKey().public_key.hex() for _ in range(1000)]
+        filter = Filter(authors=follows, kinds=[EventKind.TEXT_NOTE])
+        compiled = filter.compile()
+        self.assertIsInstance(compiled.authors, frozenset)
+        self.assertIsInstance(compiled.kinds, frozenset)
+        assert filter.matches(self.pk1_thread[0]) is False
+
+        # assigning an attribute recompiles automatically
+        filter.authors = follows + [self.pk1.public_key.hex()]
+        assert filter.matches(self.pk1_thread[0])
+
+        # in-place mutation needs an explicit compile()
+        filter.authors.remove(self.pk1.public_key.hex())
+        assert filter.matches(self.pk1_thread[0])
+        filter.compile()
+        assert filter.matches(self.pk1_thread[0]) is False
+
+        # tags added later are taken into account
+        filter = Filter(kinds=[EventKind.TEXT_NOTE])
+        assert filter.matches(self.pk2_thread[1])
+        filter.add_arbitrary_tag("e", [self.pk1_thread[0].id])
+        assert filter.matches(self.pk2_thread[1]) is False
+
     def test_event_refs_json(self):
         """Should insert event_refs as "#e" in json."""
         filter = Filter(event_refs=["some_event_id"])
@@ -397,6 +422,25 @@ class TestFilter(unittest.TestCase):
         filter.add_arbitrary_tag("foo", ["bar"])
         assert "foo" in filter.to_json_object().keys()
 
+    def test_from_json(self):
+        """Should rebuild an equivalent Filter from its json."""
+        filter = Filter(
+            event_ids=["id"],
+            kinds=[1],
+            authors=["author"],
+            since=10,
+            until=20,
+            event_refs=["event"],
+            pubkey_refs=["pubkey"],
+            limit=5,
+        )
+        filter.add_arbitrary_tag("t", ["nostr"])
+        rebuilt = Filter.from_json(filter.to_json_object())
+        assert rebuilt.to_json_object() == filter.to_json_object()
+        assert rebuilt.event_refs == ["event"]
+        assert rebuilt.pubkey_refs == ["pubkey"]
+        assert Filter.from_json({}).to_json_object() == {}
+
 
 # Inherit from TestFilter to get all the same test data
 class TestFilters(TestFilter):
@@ -418,3 +462,12 @@ class TestFilters(TestFilter):
         # Should not match anything in pk2's solo thread
         assert filters.match(self.pk2_thread[0]) is False
         assert filters.match(self.pk2_thread[1]) is False
+
+    def test_canonical_json(self):
+        """Should not depend on the order of list values and leave out the
+        excluded keys."""
+        filter = Filter(authors=["b", "a"], kinds=[1], limit=5)
+        assert filter.canonical_json() == (
+            Filter(authors=["a", "b"], kinds=[1], limit=5).canonical_json()
+        )
+        assert filter.canonical_json(("authors", "limit")) == '{"kinds":["1"]}'
@@ -1,9 +1,14 @@
 import json
+import random
+import threading
+import time
 import unittest
 import uuid
+from queue import Empty
 
+from nostr.cache import EventDeduplicator
 from nostr.event import Event
-from nostr.message_pool import MessagePool
+from nostr.message_pool import EventMessage, EventMessageStore, MessagePool
 
 
 class TestMessagePool(unittest.TestCase):
@@ -64,3 +69,199 @@ class TestMessagePool(unittest.TestCase):
         self.assertEqual(len(results), 1)
         self.assertEqual(results[0].url, url)
         self.assertEqual(results[0].content, '["OK", "Test OK"]')
+
+    def test_ok_fields(self):
+        mp = MessagePool()
+        received = []
+        mp.add_ok_listener("abc", received.append)
+        mp.add_message('["OK", "abc", false, "blocked: spam"]', "ws://relay")
+        mp.add_message('["OK", "other", true, ""]', "ws://relay")
+        mp.remove_ok_listener("abc", received.append)
+        mp.add_message('["OK", "abc", true, ""]', "ws://relay")
+
+        self.assertEqual(len(received), 1)
+        ok = received[0]
+        self.assertEqual(
+            (ok.url, ok.event_id, ok.accepted, ok.message),
+            ("ws://relay", "abc", False, "blocked: spam"),
+        )
+        self.assertEqual(len(mp.get_all()["ok"]), 3)
+
+    def test_event_json(self):
+        mp = MessagePool()
+        e = Event()
+        url = "ws://relay"
+        message_json = ["EVENT", uuid.uuid1().hex, e.to_dict()]
+        mp.add_message_json(message_json, url, event=e)
+        results = mp.get_all()["events"]
+        self.assertEqual(len(results), 1)
+        self.assertIs(results[0].event, e)
+
+    def test_duplicate_events(self):
+        mp = MessagePool(dedupe=EventDeduplicator(capacity=2))
+        events = [Event(content=f"event {i}") for i in range(3)]
+        url = "ws://relay"
+        for e in events + events[-1:]:
+            mp.add_message(json.dumps(["EVENT", "sub", e.to_dict()]), url)
+        self.assertEqual(len(mp.get_all()["events"]), 3)
+        self.assertEqual(len(mp._unique_events), 2)
+
+
+def event_message(subscription_id, content):
+    return json.dumps(["EVENT", subscription_id, Event(content=content).to_dict()])
+
+
+class TestMessagePoolConsumers(unittest.TestCase):
+    def test_subscription_queues(self):
+        mp = MessagePool()
+        mp.add_subscription("quiet")
+        for i in range(3):
+            mp.add_message(event_message("hot", f"hot {i}"), "ws://relay")
+        mp.add_message(event_message("quiet", "quiet"), "ws://relay")
+
+        self.assertTrue(mp.has_events("quiet"))
+        self.assertEqual(mp.get_event(subscription_id="quiet").event.content, "quiet")
+        self.assertFalse(mp.has_events("quiet"))
+        self.assertEqual(len(mp.get_all()["events"]), 3)
+        with self.assertRaises(KeyError):
+            mp.get_event(subscription_id="unknown")
+
+    def test_get_event_timeout(self):
+        mp = MessagePool()
+        start = time.monotonic()
+        with self.assertRaises(Empty):
+            mp.get_event(timeout=0.1)
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+        with self.assertRaises(Empty):
+            mp.get_event(block=False)
+
+    def test_iter_events_blocks_until_received(self):
+        mp = MessagePool()
+        mp.add_subscription("sub")
+
+        def produce():
+            for i in range(3):
+                time.sleep(0.02)
+                mp.add_message(event_message("sub", str(i)), "ws://relay")
+
+        thread = threading.Thread(target=produce)
+        thread.start()
+        contents = [m.event.content for m in mp.iter_events("sub", timeout=0.5)]
+        thread.join()
+        self.assertEqual(contents, ["0", "1", "2"])
+
+    def test_event_callbacks(self):
+        mp = MessagePool()
+        received, received_all = [], []
+        mp.add_event_callback(received.append, "sub")
+        mp.add_event_callback(received_all.append)
+        mp.add_message(event_message("sub", "a"), "ws://relay")
+        mp.add_message(event_message("other", "b"), "ws://relay")
+
+        self.assertEqual([m.event.content for m in received], ["a"])
+        self.assertEqual([m.event.content for m in received_all], ["a", "b"])
+        self.assertFalse(mp.has_events())
+
+        mp.remove_event_callback(received.append, "sub")
+        mp.remove_event_callback(received_all.append)
+        mp.add_message(event_message("sub", "c"), "ws://relay")
+        self.assertEqual(len(received), 1)
+        self.assertEqual(mp.get_event(block=False).event.content, "c")
+
+    def test_bounded_queues(self):
+        mp = MessagePool(max_events=2, max_notices=1, overflow="drop-oldest")
+        mp.add_subscription("sub")
+        for i in range(4):
+            mp.add_message(event_message("sub", str(i)), "ws://relay")
+            mp.add_message(event_message("other", str(i)), "ws://relay")
+            mp.add_message(json.dumps(["NOTICE", str(i)]), "ws://relay")
+
+        self.assertEqual(mp.dropped, {"events": 4, "notices": 3, "eose": 0, "ok": 0})
+        contents = [m.event.content for m in mp.iter_events("sub", timeout=0)]
+        self.assertEqual(contents, ["2", "3"])
+        self.assertEqual(mp.get_notice().content, "3")
+
+        # drops of a removed subscription's queue are still counted
+        mp.remove_subscription("sub")
+        self.assertEqual(mp.dropped["events"], 4)
+
+
+class TestEventMessageStore(unittest.TestCase):
+    def setUp(self):
+        self.messages = [
+            EventMessage(Event("a", "author1", 30, kind=1), "sub1", "wss://relay1"),
+            EventMessage(Event("b", "author2", 10, kind=0), "sub1", "wss://relay2"),
+            EventMessage(Event("c", "author1", 20, kind=1), "sub2", "wss://relay1"),
+        ]
+
+    def test_empty_store(self):
+        store = EventMessageStore()
+        self.assertIsNone(store.get_newest_event())
+        self.assertEqual(store.get_events_by_url("wss://relay1"), [])
+        self.assertEqual(len(store), 0)
+        self.assertEqual(repr(store), "EventMessageStore()")
+
+    def test_indexes(self):
+        store = EventMessageStore()
+        store.add_event(self.messages[0])
+        store.add_event(self.messages[1:])
+        a, b, c = self.messages
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store.get_events_by_url("wss://relay1"), [a, c])
+        self.assertEqual(store.get_events_by_id("sub1"), [a, b])
+        self.assertEqual(store.get_events_by_author("author1"), [a, c])
+        self.assertEqual(store.get_events_by_kind(0), [b])
+        self.assertIs(store.get_event(c.event.id), c)
+        self.assertIn(b.event.id, store)
+        self.assertEqual(store.eventMessages, self.messages)
+
+    def test_created_at_order(self):
+        store = EventMessageStore(list(self.messages))
+        a, b, c = self.messages
+        self.assertIs(store.get_newest_event(), a)
+        self.assertIs(store.get_oldest_event(), b)
+        self.assertEqual(store.get_events_between(), [b, c, a])
+        self.assertEqual(store.get_events_between(since=20), [c, a])
+        self.assertEqual(store.get_events_between(until=20), [b, c])
+        self.assertEqual(store.get_events_between(11, 29), [c])
+
+    def test_added_between_queries(self):
+        """Events added newest first, or older than the ones already queried,
+        are merged in creation order; ties keep their insertion order."""
+        store = EventMessageStore()
+        a, b, c = self.messages
+        store.add_event(a)
+        self.assertIs(store.get_newest_event(), a)
+        store.add_event(c)
+        store.add_event(b)
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store.get_events_between(), [b, c, a])
+        d = EventMessage(Event("d", "author3", 20, kind=1), "sub2", "wss://relay1")
+        e = EventMessage(Event("e", "author3", 40, kind=1), "sub2", "wss://relay1")
+        store.add_event([e, d])
+        self.assertEqual(store.get_events_between(), [b, c, d, a, e])
+        self.assertIs(store.get_newest_event(), e)
+
+    def test_many_events_out_of_order(self):
+        """Time queries stay exact across the store's internal chunks."""
+        rng = random.Random(0)
+        messages = [
+            EventMessage(Event(str(i), "author", rng.randrange(300)), "sub", "wss://r")
+            for i in range(3000)
+        ]
+        store = EventMessageStore()
+        for message in messages:
+            store.add_event(message)
+        # a stable sort keeps messages created at the same time in insertion order
+        ordered = sorted(messages, key=lambda m: m.event.created_at)
+        self.assertEqual(store.get_events_between(), ordered)
+        self.assertIs(store.get_oldest_event(), ordered[0])
+        self.assertIs(store.get_newest_event(), ordered[-1])
+        for since, until in [(0, 0), (10, 10), (100, 200), (None, 150), (299, None)]:
+            expected = [
+                m
+                for m in ordered
+                if (since is None or m.event.created_at >= since)
+                and (until is None or m.event.created_at <= until)
+            ]
+            self.assertEqual(store.get_events_between(since, until), expected)
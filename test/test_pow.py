@@ -1,9 +1,13 @@
+import os
+import stat
+import tempfile
 import unittest
 
 from nostr import pow
 from nostr.event import Event, EventKind
 from nostr.key import PrivateKey
-from nostr.pow import Pow, PowEvent, PowKey, PowVanityKey
+from nostr.pow import KeyMiner, MiningProgress, Pow, PowEvent, PowKey, PowVanityKey
+from nostr.vanity import add_to_secret
 
 
 class TestPow(unittest.TestCase):
@@ -20,6 +24,73 @@ class TestPow(unittest.TestCase):
         event = p.mine()
         self.assertTrue(pow.count_leading_zero_bits(event.id) >= difficulty)
 
+    def test_count_leading_zero_bits_bytes(self):
+        self.assertEqual(pow.count_leading_zero_bits_bytes(bytes.fromhex("048d")), 5)
+        self.assertEqual(pow.count_leading_zero_bits_bytes(bytes.fromhex("0000")), 16)
+        self.assertEqual(pow.count_leading_zero_bits_bytes(bytes.fromhex("ff00")), 0)
+
+    def test_nonce_miner(self):
+        """A nonce found from the precomputed prefix gives the event id."""
+        public_key = PrivateKey().public_key.hex()
+        tags = [["p", public_key], ["t", "ünïcode \n"]]
+        miner = pow.NonceMiner(public_key, 1674819397, 1, tags, "hé\"llo", 12)
+        nonce = next(
+            n
+            for n in (miner.search_block(block) for block in range(1000))
+            if n is not None
+        )
+        event = Event(
+            public_key=public_key,
+            created_at=1674819397,
+            kind=1,
+            tags=[miner.nonce_tag(nonce)] + tags,
+            content="hé\"llo",
+        )
+        self.assertEqual(len(event.tags[0][1]), pow.NONCE_WIDTH)
+        self.assertGreaterEqual(pow.count_leading_zero_bits(event.id), 12)
+
+    def test_mine_event_parallel(self):
+        """Mining on several processes stops once one finds a valid nonce."""
+        public_key = PrivateKey().public_key.hex()
+        difficulty = 8
+        event = Event(content='test', public_key=public_key, kind=EventKind.TEXT_NOTE)
+        event.add_pubkey_ref(public_key)
+        p = PowEvent(difficulty, event)
+        mined = p.mine_parallel(workers=2)
+        self.assertGreaterEqual(pow.count_leading_zero_bits(mined.id), difficulty)
+        self.assertEqual(mined.tags[0][0], "nonce")
+        self.assertEqual(mined.tags[0][2], str(difficulty))
+        self.assertEqual(mined.tags[1:], event.tags)
+        self.assertGreater(p.count, 0)
+        self.assertGreater(p.get_hashrate(), 0)
+
+    def test_mine_event_parallel_max_duration(self):
+        event = Event(content='test', public_key=PrivateKey().public_key.hex())
+        p = PowEvent(200, event)
+        mined = p.mine_parallel(workers=1, max_duration=0.2)
+        self.assertLess(p.num_leading_zero_bits, 200)
+        self.assertLess(p.duration, 5)
+        # the best nonce found in time is kept
+        self.assertGreater(p.num_leading_zero_bits, 0)
+        self.assertEqual(pow.count_leading_zero_bits(mined.id), p.num_leading_zero_bits)
+        self.assertEqual(mined.tags[0][2], "200")
+
+    def test_nonce_miner_best_in_block(self):
+        """Without a nonce reaching the difficulty, the lowest digest is kept."""
+        public_key = PrivateKey().public_key.hex()
+        miner = pow.NonceMiner(public_key, 0, 1, [], "test", 256)
+        self.assertIsNone(miner.search_block(0))
+        nonce, digest = miner.search_block_best(0)
+        event = Event(
+            public_key=public_key,
+            created_at=0,
+            kind=1,
+            tags=[miner.nonce_tag(nonce)],
+            content="test",
+        )
+        self.assertEqual(event.id, digest.hex())
+        self.assertEqual(miner.search_block_best(0, digest), (None, None))
+
     def test_mine_key(self):
         """Test mining a public key with specific difficulty."""
         difficulty = 8
@@ -27,6 +98,53 @@ class TestPow(unittest.TestCase):
         sk = p.mine()
         self.assertTrue(pow.count_leading_zero_bits(sk.public_key.hex()) >= difficulty)
 
+    def test_key_miner(self):
+        start = PrivateKey().raw_secret
+        tried, secret, x = KeyMiner(256).search(start, 100)
+        self.assertEqual(tried, 100)
+        self.assertEqual(PrivateKey(secret).public_key.raw_bytes, x)
+        # the best of the batch has the lowest x-only public key
+        keys = [
+            PrivateKey(add_to_secret(start, i)).public_key.raw_bytes for i in range(100)
+        ]
+        self.assertEqual(x, min(keys))
+        self.assertEqual(KeyMiner(256).search(start, 100, x)[1:], (None, None))
+
+    def test_mine_key_parallel_progress(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "progress.json")
+            snapshots = []
+            p = PowKey(200)
+            p.mine_parallel(
+                workers=2,
+                max_duration=0.5,
+                progress_file=path,
+                on_progress=snapshots.append,
+                interval=0.1,
+            )
+            self.assertTrue(snapshots)
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o600)
+            progress = MiningProgress.load(path)
+            self.assertEqual(progress, p.progress())
+            self.assertEqual(progress.best_secret, p.sk.hex())
+            self.assertGreaterEqual(
+                pow.count_leading_zero_bits_bytes(p.sk.public_key.raw_bytes),
+                progress.best_bits,
+            )
+
+            with self.assertRaises(ValueError):
+                PowKey(8).resume(progress)
+            resumed = PowKey(200)
+            resumed.resume(progress)
+            self.assertEqual(resumed.count, progress.count)
+            # the best key already clears a difficulty it reached
+            resumed.set_difficulty(progress.best_bits)
+            sk = resumed.mine_parallel(workers=1, progress_file=path)
+            self.assertEqual(sk, p.sk)
+            self.assertEqual(resumed.count, progress.count)
+
+        self.assertIsNone(MiningProgress.load(path))
+
     def test_time_estimates(self):
         """Test functions to estimate POW time."""
         public_key = PrivateKey().public_key.hex()
@@ -51,12 +169,26 @@ class TestPow(unittest.TestCase):
         sk = p.mine()
         self.assertTrue(sk.public_key.bech32().endswith(pattern))
 
+        p = PowVanityKey(patterns=[("qqqqqq", None), (None, "2")])
+        sk = p.mine()
+        self.assertTrue(sk.public_key.bech32().endswith("2"))
+        self.assertEqual(p.vk, sk.public_key.bech32())
+
+        self.assertIsNone(PowVanityKey("qqqqqqqq").mine(max_count=100))
+
         # mine an invalid pattern
         pattern = '1'
 
         with self.assertRaisesRegex(ValueError, "not in valid list of bech32 chars"):
             p = PowVanityKey(pattern)
 
+    def test_mine_vanity_key_parallel(self):
+        p = PowVanityKey("2", "3")
+        sk = p.mine_parallel(workers=2)
+        npub = sk.public_key.bech32()
+        self.assertTrue(npub.startswith("npub12") and npub.endswith("3"))
+        self.assertGreater(p.count, 0)
+
     def test_expected_pow_guesses(self):
         p = Pow()
         p.n_pattern = 32
@@ -0,0 +1,72 @@
+import json
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from nostr import codec
+from nostr.event import Event
+from nostr.filter import Filter, Filters
+from nostr.key import PrivateKey
+from nostr.message_pool import MessagePool
+from nostr.relay import Relay
+
+
+class TestRelay(unittest.TestCase):
+    def setUp(self):
+        self.pk = PrivateKey()
+        self.message_pool = MessagePool()
+        self.relay = Relay("ws://fake-relay", self.message_pool)
+        self.relay.add_subscription("sub", Filters([Filter()]))
+
+    def test_event_parsed_once(self):
+        """An inbound EVENT is decoded and built once and handed to the pool."""
+        event = Event(content="Hello, world!")
+        event.sign(self.pk.hex())
+        message = json.dumps(["EVENT", "sub", event.to_dict()])
+
+        with patch("nostr.relay.codec.loads", wraps=codec.loads) as loads, patch.object(
+            Event, "from_dict", wraps=Event.from_dict
+        ) as from_dict:
+            self.relay._on_message(None, message)
+            self.assertEqual(loads.call_count, 1)
+            self.assertEqual(from_dict.call_count, 1)
+
+        results = self.message_pool.get_all()["events"]
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0].event.id, event.id)
+        self.assertTrue(results[0].event.verify())
+
+    def test_invalid_event_dropped(self):
+        event = Event(content="Hello, world!")
+        event.sign(self.pk.hex())
+        event_dict = event.to_dict()
+        event_dict["content"] = "Tampered"
+
+        self.relay._on_message(None, json.dumps(["EVENT", "sub", event_dict]))
+        self.relay._on_message(None, json.dumps(["EVENT", "other", event.to_dict()]))
+        self.assertFalse(self.message_pool.has_events())
+
+    def test_ok_keeps_raw_message(self):
+        message = '["OK", "Test OK"]'
+        self.relay._on_message(None, message)
+        self.assertEqual(self.message_pool.get_ok_notice().content, message)
+
+    def test_verify_executor_keeps_order(self):
+        """Events verified on an executor reach the pool before a later EOSE."""
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            self.relay.verify_executor = executor
+            events = []
+            for i in range(20):
+                event = Event(content=f"event {i}")
+                event.sign(self.pk.hex())
+                events.append(event)
+                self.relay._on_message(
+                    None, json.dumps(["EVENT", "sub", event.to_dict()])
+                )
+            self.relay._on_message(None, json.dumps(["EOSE", "sub"]))
+
+        self.assertEqual(self.message_pool.get_eose_notice().subscription_id, "sub")
+        received = [
+            message.event.id for message in self.message_pool.get_all()["events"]
+        ]
+        self.assertEqual(received, [event.id for event in events])
@@ -1,10 +1,15 @@
+import json
+import time
 import unittest
+from unittest.mock import MagicMock, patch
 
 from nostr.event import Event
-from nostr.filter import Filters
+from nostr.filter import Filter, Filters
 from nostr.key import PrivateKey
+from nostr.relay import Relay
 from nostr.relay_manager import RelayException, RelayManager
 from nostr.subscription import Subscription
+from nostr.sync_state import SyncState
 
 
 class TestRelayManager(unittest.TestCase):
@@ -50,3 +55,230 @@ class TestRelayManager(unittest.TestCase):
             not in relay_manager.relays['ws://fake-relay2'].subscriptions.keys()
         )
         relay_manager.close_all_relay_connections()
+
+    def test_shared_verified_cache(self):
+        """An event received from several relays is verified once."""
+        pk = PrivateKey()
+        event = Event(content="Hello, world!")
+        event.sign(pk.hex())
+        message = json.dumps(["EVENT", "sub", event.to_dict()])
+
+        relay_manager = RelayManager()
+        relay_manager.add_relay(url='ws://fake-relay1')
+        relay_manager.add_relay(url='ws://fake-relay2')
+        relay_manager.add_subscription("sub", Filters([Filter()]))
+
+        with patch("nostr.event.PublicKey.verify", return_value=True) as verify:
+            for relay in relay_manager.relays.values():
+                relay._on_message(None, message)
+            self.assertEqual(verify.call_count, 1)
+
+        cache = relay_manager.verified_cache
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(len(relay_manager.message_pool.get_all()["events"]), 1)
+
+    def test_close_shuts_down_verify_executor(self):
+        relay_manager = RelayManager(verify_workers=2)
+        executor = relay_manager.verify_executor
+        self.assertEqual(executor.submit(sum, [1, 2]).result(), 3)
+        relay_manager.close_connections()
+        with self.assertRaises(RuntimeError):
+            executor.submit(sum, [1, 2])
+
+    def test_sync_state_rewrites_requests(self):
+        """REQs start from the newest event each relay sent before EOSE."""
+        event = Event(content="Hello, world!", created_at=1000)
+        event.sign(PrivateKey().hex())
+        relay_manager = RelayManager(sync_state=SyncState())
+        relay_manager.add_relay(url='ws://fake-relay1')
+        relay_manager.add_relay(url='ws://fake-relay2')
+        filters = Filters([Filter(kinds=[1], limit=10)])
+        relay_manager.add_subscription("sub", filters)
+        relay = relay_manager.relays['ws://fake-relay1']
+        relay._on_message(None, json.dumps(["EVENT", "sub", event.to_dict()]))
+        relay._on_message(None, json.dumps(["EOSE", "sub"]))
+
+        with patch.object(Relay, "publish", autospec=True) as publish:
+            relay_manager.publish_message(json.dumps(["REQ", "sub2", {"kinds": [1]}]))
+            relay_manager.add_subscription_on_all_relays("sub3", filters)
+        sent = {}
+        for call in publish.call_args_list:
+            message = json.loads(call.args[1])
+            sent[(call.args[0].url, message[1])] = message[2]
+        self.assertEqual(
+            sent[('ws://fake-relay1', "sub2")], {"kinds": [1], "since": 1000}
+        )
+        self.assertEqual(sent[('ws://fake-relay2', "sub2")], {"kinds": [1]})
+        self.assertEqual(sent[('ws://fake-relay1', "sub3")]["since"], 1000)
+        self.assertNotIn("since", sent[('ws://fake-relay2', "sub3")])
+
+    def test_coalesced_subscriptions(self):
+        """Overlapping subscriptions share one REQ per relay and get their own
+        events back."""
+        relay_manager = RelayManager(coalesce=True)
+        relay_manager.add_relay(url='ws://fake-relay1')
+        relay_manager.add_relay(url='ws://fake-relay2')
+        keys = [PrivateKey(), PrivateKey()]
+        with patch.object(Relay, "publish", autospec=True) as publish:
+            for i, key in enumerate(keys):
+                relay_manager.add_subscription_on_all_relays(
+                    f"sub{i}", Filters([Filter(authors=[key.public_key.hex()])])
+                )
+            relay_manager.close_subscription_on_all_relays("sub0")
+        sent = [json.loads(call.args[1]) for call in publish.call_args_list]
+        relay_id = sent[0][1]
+        self.assertEqual({message[1] for message in sent}, {relay_id})
+        authors = [key.public_key.hex() for key in keys]
+        self.assertEqual(sent[2][2:], [{"authors": authors}])
+        self.assertEqual(sent[4][2:], [{"authors": authors[1:]}])
+
+        relay = relay_manager.relays['ws://fake-relay1']
+        for key in keys:
+            event = Event(content="Hello, world!")
+            event.sign(key.hex())
+            relay._on_message(None, json.dumps(["EVENT", relay_id, event.to_dict()]))
+        message = relay_manager.message_pool.get_event(block=False)
+        self.assertEqual(message.subscription_id, "sub1")
+        self.assertEqual(message.event.public_key, authors[1])
+        self.assertFalse(relay_manager.message_pool.has_events())
+
+        with patch.object(Relay, "publish", autospec=True) as publish:
+            relay_manager.close_subscription_on_all_relays("sub1")
+        self.assertEqual(json.loads(publish.call_args.args[1]), ["CLOSE", relay_id])
+        self.assertNotIn(relay_id, relay.subscriptions)
+
+
+def fake_connect(reachable):
+    """Relay.connect replacement completing the handshake for reachable urls."""
+
+    def connect(relay):
+        if relay.url in reachable:
+            time.sleep(0.05)
+            relay.ws.sock = MagicMock(connected=True)
+            relay._on_open(None)
+
+    return connect
+
+
+class TestOpenConnections(unittest.TestCase):
+    def setUp(self):
+        self.relay_manager = self.make_relay_manager()
+
+    @staticmethod
+    def make_relay_manager():
+        relay_manager = RelayManager()
+        for url in ("ws://fake-relay1", "ws://fake-relay2", "ws://fake-relay3"):
+            relay_manager.add_relay(url)
+        return relay_manager
+
+    def test_returns_when_all_connected(self):
+        reachable = set(self.relay_manager.relays)
+        with patch.object(Relay, "connect", fake_connect(reachable)):
+            start = time.monotonic()
+            connected = self.relay_manager.open_connections(timeout=5)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(set(connected), reachable)
+
+    def test_all_removes_unreachable(self):
+        reachable = {"ws://fake-relay1", "ws://fake-relay2"}
+        with patch.object(Relay, "connect", fake_connect(reachable)):
+            connected = self.relay_manager.open_connections(timeout=0.3)
+        self.assertEqual(set(connected), reachable)
+        self.assertEqual(set(self.relay_manager.relays), reachable)
+
+    def test_quorum_and_any_return_early(self):
+        reachable = {"ws://fake-relay1", "ws://fake-relay2"}
+        for wait_for in ("quorum", "any"):
+            with self.subTest(wait_for=wait_for), patch.object(
+                Relay, "connect", fake_connect(reachable)
+            ):
+                relay_manager = self.make_relay_manager()
+                start = time.monotonic()
+                connected = relay_manager.open_connections(timeout=5, wait_for=wait_for)
+                self.assertLess(time.monotonic() - start, 1)
+                self.assertTrue(set(connected) <= reachable)
+                self.assertEqual(len(relay_manager.relays), 3)
+
+    def test_raises_when_not_enough_connected(self):
+        with patch.object(Relay, "connect", fake_connect({"ws://fake-relay1"})):
+            with self.assertRaisesRegex(RelayException, "1 of 3 relays"):
+                self.relay_manager.open_connections(timeout=0.3, wait_for="quorum")
+        with patch.object(Relay, "connect", fake_connect(set())):
+            relay_manager = RelayManager(connect_timeout=0.1)
+            relay_manager.add_relay("ws://fake-relay1")
+            with self.assertRaisesRegex(RelayException, "0 of 1 relays"):
+                relay_manager.open_connections()
+
+
+class TestPublishEvent(unittest.TestCase):
+    def setUp(self):
+        self.pk = PrivateKey()
+        self.event = Event(content="Hello, world!")
+        self.event.sign(self.pk.hex())
+        self.relay_manager = RelayManager()
+        for url in ("ws://fake-relay1", "ws://fake-relay2", "ws://fake-relay3"):
+            self.relay_manager.add_relay(url)
+
+    def reply_ok(self, replies):
+        """Relay.publish replacement answering with OK messages from `replies`,
+        a dict of url to (accepted, message)."""
+
+        def publish(relay, message):
+            if relay.url in replies:
+                accepted, reason = replies[relay.url]
+                ok = ["OK", self.event.id, accepted, reason]
+                relay._on_message(None, json.dumps(ok))
+
+        return publish
+
+    def test_fire_and_forget(self):
+        with patch.object(Relay, "publish") as publish:
+            self.assertIsNone(self.relay_manager.publish_event(self.event))
+        self.assertEqual(publish.call_count, 3)
+
+    def test_wait_for_quorum(self):
+        replies = {
+            "ws://fake-relay1": (True, ""),
+            "ws://fake-relay2": (False, "blocked: no spam"),
+            "ws://fake-relay3": (True, "duplicate: already have it"),
+        }
+        with patch.object(Relay, "publish", self.reply_ok(replies)):
+            result = self.relay_manager.publish_event(
+                self.event, wait_for="quorum", timeout=5
+            )
+        self.assertTrue(result.ok)
+        self.assertEqual(set(result.accepted), {"ws://fake-relay1", "ws://fake-relay3"})
+        self.assertEqual(result.rejected, {"ws://fake-relay2": "blocked: no spam"})
+        self.assertEqual(result.pending, [])
+
+    def test_returns_once_outcome_known(self):
+        """Two rejections out of three make a quorum impossible."""
+        replies = {"ws://fake-relay1": (False, ""), "ws://fake-relay2": (False, "")}
+        with patch.object(Relay, "publish", self.reply_ok(replies)):
+            start = time.monotonic()
+            result = self.relay_manager.publish_event(
+                self.event, wait_for="quorum", timeout=5
+            )
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertFalse(result.ok)
+        self.assertEqual(result.pending, ["ws://fake-relay3"])
+
+    def test_timeout_leaves_relays_pending(self):
+        replies = {"ws://fake-relay1": (True, "")}
+        with patch.object(Relay, "publish", self.reply_ok(replies)):
+            result = self.relay_manager.publish_event(
+                self.event, wait_for="all", timeout=0.2
+            )
+            self.assertTrue(
+                self.relay_manager.publish_event(self.event, wait_for="any").ok
+            )
+        self.assertFalse(result.ok)
+        self.assertEqual(result.pending, ["ws://fake-relay2", "ws://fake-relay3"])
+        self.assertEqual(
+            result.to_json_object(),
+            {
+                "ws://fake-relay1": {"accepted": True, "message": ""},
+                "ws://fake-relay2": None,
+                "ws://fake-relay3": None,
+            },
+        )
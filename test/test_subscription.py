@@ -1,9 +1,12 @@
 import json
 import unittest
+from unittest.mock import patch
 
-from nostr.filter import Filter, Filters
+from nostr.event import Event, EventKind
+from nostr.filter import CompiledFilter, Filter, Filters
+from nostr.key import PrivateKey
 from nostr.message_type import ClientMessageType
-from nostr.subscription import Subscription
+from nostr.subscription import Subscription, SubscriptionIndex
 
 
 class TestSubscription(unittest.TestCase):
@@ -25,3 +28,67 @@ class TestSubscription(unittest.TestCase):
         self.assertTrue(isinstance(subscription_id, str))
         self.assertEqual(message_type, ClientMessageType.REQUEST)
         self.assertTrue(isinstance(req_filters, dict))
+
+
+class TestSubscriptionIndex(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.pks = [PrivateKey().public_key.hex() for _ in range(3)]
+        cls.note = Event(public_key=cls.pks[0], content="note")
+        cls.reply = Event(
+            public_key=cls.pks[1],
+            content="reply",
+            tags=[["e", cls.note.id], ["p", cls.pks[0]], ["t", "nostr"]],
+        )
+        cls.dm = Event(
+            public_key=cls.pks[2],
+            content="dm",
+            kind=EventKind.ENCRYPTED_DIRECT_MESSAGE,
+            tags=[["p", cls.pks[1]]],
+        )
+
+    def test_match(self):
+        subscriptions = [
+            Subscription("ids", Filters([Filter(event_ids=[self.note.id])])),
+            Subscription("author", Filters([Filter(authors=[self.pks[1]])])),
+            Subscription("thread", Filters([Filter(event_refs=[self.note.id])])),
+            Subscription(
+                "mentions",
+                Filters(
+                    [
+                        Filter(kinds=[EventKind.TEXT_NOTE], pubkey_refs=[self.pks[0]]),
+                        Filter(authors=[self.pks[0]], since=self.note.created_at + 1),
+                    ]
+                ),
+            ),
+            Subscription(
+                "dms", Filters([Filter(kinds=[EventKind.ENCRYPTED_DIRECT_MESSAGE])])
+            ),
+            Subscription("all", Filters([Filter()])),
+        ]
+        index = SubscriptionIndex(subscriptions)
+
+        for event in (self.note, self.reply, self.dm):
+            expected = {s.id for s in subscriptions if s.filters.match(event)}
+            self.assertEqual(index.match(event), expected)
+        self.assertEqual(index.match(self.note), {"ids", "all"})
+        self.assertEqual(
+            index.match(self.reply), {"author", "thread", "mentions", "all"}
+        )
+
+        index.remove("all")
+        index.remove("author")
+        self.assertEqual(index.match(self.reply), {"thread", "mentions"})
+        self.assertEqual(len(index), 4)
+
+    def test_many_filters(self):
+        """Only candidate filters sharing an indexed value are evaluated."""
+        index = SubscriptionIndex(
+            Subscription(str(i), Filters([Filter(authors=[f"{i:064x}"])]))
+            for i in range(10000)
+        )
+        index.add(Subscription("me", Filters([Filter(authors=[self.pks[0]])])))
+        with patch.object(CompiledFilter, "matches", autospec=True) as matches:
+            matches.return_value = True
+            self.assertEqual(index.match(self.note), {"me"})
+            self.assertEqual(matches.call_count, 1)
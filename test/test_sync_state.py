@@ -0,0 +1,80 @@
+import json
+import os
+import tempfile
+import unittest
+
+from nostr.filter import Filter, Filters
+from nostr.sync_state import SyncState, fingerprint
+
+URL = "wss://relay1"
+
+
+class TestSyncState(unittest.TestCase):
+    def test_fingerprint_ignores_time_window(self):
+        filter = Filter(authors=["a", "b"], kinds=[1], limit=10)
+        self.assertEqual(
+            fingerprint(filter),
+            fingerprint(Filter(authors=["b", "a"], kinds=[1], since=5, until=9)),
+        )
+        self.assertNotEqual(fingerprint(filter), fingerprint(Filter(authors=["a"])))
+        self.assertNotEqual(
+            fingerprint(filter), fingerprint(Filter(authors=["a", "b"], kinds=[0]))
+        )
+
+    def test_rewrite(self):
+        state = SyncState()
+        filters = Filters([Filter(authors=["a"], limit=10), Filter(kinds=[0])])
+        state.update(URL, filters[0], 100)
+        state.update(URL, filters[0], 90)
+
+        rewritten = state.rewrite(URL, filters)
+        self.assertEqual(
+            rewritten.to_json_array(),
+            [{"authors": ["a"], "limit": 10, "since": 100}, {"kinds": [0]}],
+        )
+        # the original filters are left as they were
+        self.assertIsNone(filters[0].since)
+        self.assertEqual(
+            state.rewrite("wss://relay2", filters).to_json_array(),
+            filters.to_json_array(),
+        )
+        newer = Filters([Filter(authors=["a"], since=200)])
+        self.assertEqual(state.rewrite(URL, newer)[0].since, 200)
+
+    def test_events_count_after_eose(self):
+        state = SyncState()
+        filter = Filter(authors=["a"])
+        state.observe(URL, "sub", filter, 300)
+        state.observe(URL, "sub", filter, 200)
+        self.assertIsNone(state.get(URL, filter))
+
+        state.end_of_stored_events(URL, "sub")
+        self.assertEqual(state.get(URL, filter), 300)
+        state.observe(URL, "sub", filter, 400)
+        self.assertEqual(state.get(URL, filter), 400)
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "nostr", "sync.json")
+            self.assertIsNone(SyncState.load(path).get(URL, Filter()))
+            state = SyncState(path)
+            state.update(URL, Filter(kinds=[1]), 123)
+            state.save()
+
+            with open(path) as file:
+                self.assertEqual(len(json.load(file)[URL]), 1)
+            self.assertEqual(SyncState.load(path).get(URL, Filter(kinds=[1])), 123)
+
+    def test_load_corrupt_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "sync.json")
+            for content in ('{"wss://relay', "[]"):
+                with open(path, "w") as file:
+                    file.write(content)
+                with self.assertLogs("nostr.sync_state", "WARNING"):
+                    state = SyncState.load(path)
+                self.assertIsNone(state.get(URL, Filter()))
+                # the next save replaces the corrupt file
+                state.update(URL, Filter(), 123)
+                state.save()
+                self.assertEqual(SyncState.load(path).get(URL, Filter()), 123)
@@ -0,0 +1,60 @@
+import unittest
+
+from nostr import bech32
+from nostr.key import PrivateKey, mine_vanity_key
+from nostr.vanity import (
+    SEARCH_BATCH,
+    VanityMiner,
+    VanityPattern,
+    npub_checksum,
+    random_secret,
+)
+
+
+class TestVanity(unittest.TestCase):
+    def test_npub_checksum(self):
+        for _ in range(50):
+            public_key = PrivateKey().public_key
+            npub = public_key.bech32()
+            checksum = npub_checksum(public_key.raw_bytes)
+            expected = 0
+            for char in npub[-6:]:
+                expected = expected << 5 | bech32.CHARSET.index(char)
+            self.assertEqual(checksum, expected)
+
+    def test_pattern_validation(self):
+        with self.assertRaisesRegex(ValueError, "not in valid list of bech32 chars"):
+            VanityPattern("b")
+        with self.assertRaisesRegex(ValueError, "at least one"):
+            VanityPattern()
+        # the last key character only holds 1 bit followed by padding
+        with self.assertRaisesRegex(ValueError, "cannot occur"):
+            VanityPattern(suffix="x" + "q" * 6)
+
+    def test_search_consecutive_keys(self):
+        start = random_secret()
+        npub = PrivateKey(
+            (int.from_bytes(start, "big") + 7).to_bytes(32, "big")
+        ).public_key.bech32()
+        pattern = VanityPattern(npub[5:9], npub[-3:])
+        secret, found = VanityMiner([pattern]).search(start, 8)
+        self.assertEqual(found, pattern)
+        self.assertEqual(PrivateKey(secret).public_key.bech32(), npub)
+        self.assertEqual(VanityMiner([pattern]).search(start, 7), (None, None))
+
+    def test_search_several_patterns(self):
+        patterns = [
+            VanityPattern("qqqqqq"),
+            VanityPattern("2"),
+            VanityPattern(None, "x"),
+        ]
+        secret, pattern = VanityMiner(patterns).search(random_secret(), SEARCH_BATCH)
+        npub = PrivateKey(secret).public_key.bech32()
+        self.assertTrue(
+            npub.startswith("npub12") or npub.endswith("x"), (npub, pattern)
+        )
+
+    def test_mine_vanity_key(self):
+        sk = mine_vanity_key("2", "3")
+        npub = sk.public_key.bech32()
+        self.assertTrue(npub.startswith("npub12") and npub.endswith("3"))